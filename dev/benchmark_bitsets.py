@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Times the clade bitset backends of peyotl.phylo.bitsets (and the big-int
+add_bits4subtree_ids + compare_bits_as_splits path that they replace) on pairs of
+random trees of increasing size.
+
+For each size, the clades of one tree are built, and a sample of --rows clades of
+the first tree is compared (as splits) with every clade of the second tree.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.phylo.bitsets import available_bitset_backends, tree_clade_bitsets
+from peyotl.phylo.compat import compare_bits_as_splits
+from peyotl.phylo.tree import create_tree_from_id2par
+import argparse
+import random
+import time
+
+
+def random_id2par(leaves, rng):
+    """Random binary tree (as an id2par dict) with `leaves` as the tips."""
+    id2par = {}
+    tips = [leaves[0]]
+    next_id = 0
+    for leaf in leaves[1:]:
+        i = rng.randrange(len(tips))
+        old = tips[i]
+        anc = 'n{}'.format(next_id)
+        next_id += 1
+        id2par[anc] = id2par.get(old)
+        id2par[old] = anc
+        id2par[leaf] = anc
+        tips.append(leaf)
+    return id2par
+
+
+def _time(fn):
+    start = time.time()
+    r = fn()
+    return r, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tips', type=int, nargs='+', default=[1000, 5000, 10000, 20000])
+    parser.add_argument('--rows', type=int, default=200, help='number of clades of the first tree to compare')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    backends = available_bitset_backends()
+    print('{:>8} {:>22} {:>12} {:>14}'.format('tips', 'path', 'build (s)', 'compare (s)'))
+    for num_tips in args.tips:
+        leaves = ['t{}'.format(i) for i in range(num_tips)]
+        trees = [create_tree_from_id2par(random_id2par(leaves, rng), list(leaves)) for _ in range(2)]
+        leaf_index = dict((i, n) for n, i in enumerate(leaves))
+
+        def _bigint_build():
+            for tree in trees:
+                tree.add_bits4subtree_ids(dict((i, 1 << n) for i, n in leaf_index.items()))
+            return [[n.bits4subtree_ids for n in t.postorder_node_iter() if not n.is_leaf] for t in trees]
+
+        (one, other), build = _time(_bigint_build)
+        rows = one[:args.rows]
+        universe = (1 << num_tips) - 1
+        _, compare = _time(lambda: [[compare_bits_as_splits(a, b, universe) for b in other] for a in rows])
+        print('{:>8} {:>22} {:>12.3f} {:>14.3f}'.format(num_tips, 'add_bits4subtree_ids', build, compare))
+        for name in backends:
+            (one_bits, other_bits), build = _time(lambda: [tree_clade_bitsets(t, leaf_index=leaf_index,
+                                                                              backend=name)[0] for t in trees])
+            sample = one_bits.subset_rows(range(min(args.rows, len(one_bits))))
+            _, compare = _time(lambda: sample.compare_as_splits(other_bits))
+            print('{:>8} {:>22} {:>12.3f} {:>14.3f}'.format(num_tips, name + ' backend', build, compare))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Times OTT.induced_tree for random samples of OTT IDs of increasing size, with the
+default 'id2par' method (walks up the parent dict from every ID) and the 'preorder'
+method (sorts the IDs by preorder number and adds the LCAs of adjacent IDs).
+
+The time to load the tables used by each method (the pickled parent dict for 'id2par',
+the memory-mapped taxonomy store and LCA index for 'preorder') is reported first.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.ott import OTT
+import argparse
+import random
+import time
+
+
+def _time(fn):
+    start = time.time()
+    r = fn()
+    return r, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ott-dir', default=None, help='taxonomy directory (default: the configured OTT)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--monotypic', action='store_true', help='pass create_monotypic_nodes=True')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    ott = OTT(ott_dir=args.ott_dir)
+    id2par, load_id2par = _time(lambda: ott.ott_id2par_ott_id)
+    _, load_store = _time(lambda: ott.lca_index.lca_preorder(0, 0))
+    print('load: id2par {:.3f} s, taxonomy store and LCA index {:.3f} s'.format(load_id2par, load_store))
+    # the root is left out, because the id2par method rejects it
+    ids = [i for i, p in id2par.items() if p is not None]
+    print('{:>10} {:>12} {:>14} {:>10}'.format('IDs', 'id2par (s)', 'preorder (s)', 'nodes'))
+    for size in args.sizes:
+        if size > len(ids):
+            break
+        sample = rng.sample(ids, size)
+        _, slow = _time(lambda: ott.induced_tree(list(sample), create_monotypic_nodes=args.monotypic))
+        tree, fast = _time(lambda: ott.induced_tree(sample, create_monotypic_nodes=args.monotypic,
+                                                    method='preorder'))
+        num_nodes = sum(1 for _ in tree.preorder_node_iter())
+        print('{:>10} {:>12.3f} {:>14.3f} {:>10}'.format(size, slow, fast, num_nodes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Times the character-by-character NewickTokenizer (+ NewickEventFactory tree building)
+against iter_newick_tokens (+ the direct token tree builder used by parse_newick).
+
+By default a random binary tree with --tips tips (and branch lengths) is written to a
+temporary file; use --newick to time an existing file (e.g. a synthetic tree).
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.phylo.tree import parse_newick, ArrayTreeWithPathsInEdges, TreeWithPathsInEdges
+from peyotl.utility.tokenizer import NewickEventFactory, NewickTokenizer, iter_newick_tokens
+import argparse
+import tempfile
+import random
+import codecs
+import time
+import os
+
+
+def write_random_newick(out, num_tips, seed):
+    """Writes a random binary tree (as newick) to `out` without recursion."""
+    rng = random.Random(seed)
+    next_tip = [0]
+
+    def _tip_label():
+        next_tip[0] += 1
+        return 'ott{}:{:.4f}'.format(next_tip[0], rng.random())
+
+    # each stack entry is the number of tips that the subtree must contain
+    stack = [num_tips]
+    buf = []
+    while stack:
+        n = stack.pop()
+        if n == 'close':
+            buf.append('):{:.4f}'.format(rng.random()))
+        elif n == 'comma':
+            buf.append(',')
+        elif n == 1:
+            buf.append(_tip_label())
+        else:
+            left = rng.randint(1, n - 1)
+            buf.append('(')
+            stack.extend(['close', n - left, 'comma', left])
+        if len(buf) > 10000:
+            out.write(''.join(buf))
+            buf = []
+    buf.append(';\n')
+    out.write(''.join(buf))
+
+
+def _time(label, fn):
+    start = time.time()
+    r = fn()
+    print('{:>45}: {:8.2f} seconds'.format(label, time.time() - start))
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tips', type=int, default=2000000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--newick', default=None, help='newick file to parse (instead of a random tree)')
+    parser.add_argument('--skip-old', action='store_true', default=False,
+                        help='only time the new tokenizer and parser')
+    args = parser.parse_args()
+    fp, tmp_fp = args.newick, None
+    if fp is None:
+        fd, tmp_fp = tempfile.mkstemp(suffix='.tre')
+        os.close(fd)
+        with codecs.open(tmp_fp, 'w', encoding='utf-8') as out:
+            write_random_newick(out, args.tips, args.seed)
+        fp = tmp_fp
+    try:
+        print('{} ({:.1f} MB)'.format(fp, os.path.getsize(fp) / (1024 * 1024)))
+        if not args.skip_old:
+            _time('NewickTokenizer tokens', lambda: sum(1 for _ in NewickTokenizer(filepath=fp)))
+        _time('iter_newick_tokens tokens', lambda: sum(1 for _ in iter_newick_tokens(filepath=fp)))
+        if not args.skip_old:
+            _time('NewickEventFactory -> TreeWithPathsInEdges',
+                  lambda: TreeWithPathsInEdges(newick_events=NewickEventFactory(filepath=fp)))
+        _time('parse_newick -> TreeWithPathsInEdges', lambda: parse_newick(filepath=fp))
+        _time('parse_newick -> ArrayTreeWithPathsInEdges',
+              lambda: parse_newick(filepath=fp, _class=ArrayTreeWithPathsInEdges))
+    finally:
+        if tmp_fp is not None:
+            os.remove(tmp_fp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Compares the time and peak memory of get_ot_study_info_from_nexml with the minidom
+conversion (streaming=False) and the streaming conversion (the default). With --to-nexml,
+the file is converted to NexSON first, and the writing of that NexSON as NeXML by
+write_obj_as_nexml is timed instead.
+
+Each conversion runs in a separate process, so that the peak resident set size
+(ru_maxrss) of the process is the peak for that conversion. --repeat N makes a larger
+input by repeating the <trees> blocks of the file N times.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.nexson_syntax import get_ot_study_info_from_nexml, write_obj_as_nexml, DIRECT_HONEY_BADGERFISH
+import codecs
+import subprocess
+import argparse
+import resource
+import tempfile
+import time
+import sys
+import os
+import re
+
+_DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                              'peyotl', 'test', 'data', 'nexml', 'S15515.xml')
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _run_one(filepath, streaming, to_nexml):
+    if to_nexml:
+        blob = get_ot_study_info_from_nexml(src=filepath, nexson_syntax_version=DIRECT_HONEY_BADGERFISH)
+        before = _peak_rss_mb()
+        start = time.time()
+        with codecs.open(os.devnull, 'w', encoding='utf-8') as out:
+            write_obj_as_nexml(blob, out, streaming=streaming)
+    else:
+        before = _peak_rss_mb()
+        start = time.time()
+        get_ot_study_info_from_nexml(src=filepath, nexson_syntax_version=DIRECT_HONEY_BADGERFISH, streaming=streaming)
+    print('{t:.3f} {b:.1f} {a:.1f}'.format(t=time.time() - start, b=before, a=_peak_rss_mb()))
+
+
+def _repeated_trees(filepath, repeat):
+    with open(filepath, 'rb') as fo:
+        content = fo.read()
+    blocks = b''.join(m.group(0) for m in re.finditer(br'<trees\b.*?</trees>', content, re.S))
+    pos = content.rindex(b'</trees>') + len(b'</trees>')
+    fd, tmp = tempfile.mkstemp(suffix='.xml')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(content[:pos])
+        for _ in range(repeat - 1):
+            out.write(blocks)
+        out.write(content[pos:])
+    return tmp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('nexml', nargs='*', default=[_DEFAULT_INPUT], help='NeXML files')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--to-nexml', action='store_true', help='time NexSON -> NeXML instead')
+    parser.add_argument('--run-one', choices=['dom', 'stream'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_one:
+        _run_one(args.nexml[0], args.run_one == 'stream', args.to_nexml)
+        return
+    print('{:>30} {:>9} {:>7} {:>10} {:>12}'.format('file', 'MB', 'mode', 'time (s)', 'peak MB'))
+    for fp in args.nexml:
+        src = fp if args.repeat < 2 else _repeated_trees(fp, args.repeat)
+        try:
+            size = os.path.getsize(src) / (1024.0 * 1024.0)
+            for mode in ('dom', 'stream'):
+                cmd = [sys.executable, os.path.abspath(__file__), src, '--run-one', mode]
+                if args.to_nexml:
+                    cmd.append('--to-nexml')
+                out = subprocess.check_output(cmd)
+                t, before, after = [float(i) for i in out.split()]
+                print('{:>30} {:>9.1f} {:>7} {:>10.3f} {:>12.1f}'.format(os.path.basename(fp)[-30:], size, mode, t,
+                                                                          after - before))
+        finally:
+            if src != fp:
+                os.remove(src)
+
+
+if __name__ == '__main__':
+    main()
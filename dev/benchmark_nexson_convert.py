@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Times the conversion of NexSON studies between badgerfish (0.0) and by-ID
+honeybadgerfish (1.2), in both directions, with the single-pass converters used by
+convert_nexson_format and with the old route through the direct (1.0) form.
+
+Studies are read from the NexSON files given as arguments (directories are searched
+for *.json files), from the local phylesystem with --phylesystem, or from the NexSON
+test data by default. Each study is converted to the source format and copied before
+the timer is started, so only the conversions are timed.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.nexson_syntax import (convert_nexson_format,
+                                  BADGER_FISH_NEXSON_VERSION,
+                                  BY_ID_HONEY_BADGERFISH,
+                                  DIRECT_HONEY_BADGERFISH)
+from peyotl.utility.input_output import read_as_json
+import argparse
+import copy
+import gc
+import time
+import os
+
+_DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                              'peyotl', 'test', 'data', 'nexson')
+
+
+def _iter_filepaths(inputs, phylesystem):
+    if phylesystem:
+        from peyotl.phylesystem.phylesystem_umbrella import Phylesystem
+        for _, fp in Phylesystem().iter_study_filepaths():
+            yield fp
+        return
+    for inp in inputs:
+        if not os.path.isdir(inp):
+            yield inp
+            continue
+        for root, dirs, files in os.walk(inp):
+            dirs.sort()
+            for f in sorted(files):
+                if f.endswith('.json'):
+                    yield os.path.join(root, f)
+
+
+def _load_blobs(filepaths, nexson_format):
+    blobs = []
+    for fp in filepaths:
+        try:
+            blobs.append(convert_nexson_format(read_as_json(fp), nexson_format))
+        except Exception:  # not a (convertible) NexSON study
+            pass
+    return blobs
+
+
+def _via_direct(blob, out_format, current_format):
+    blob = convert_nexson_format(blob, DIRECT_HONEY_BADGERFISH, current_format=current_format)
+    return convert_nexson_format(blob, out_format, current_format=DIRECT_HONEY_BADGERFISH)
+
+
+def _single_pass(blob, out_format, current_format):
+    return convert_nexson_format(blob, out_format, current_format=current_format)
+
+
+def _time_all(fn, blobs, out_format, current_format, repeat):
+    best = None
+    for _ in range(repeat):
+        copies = [copy.deepcopy(b) for b in blobs]
+        gc.collect()
+        gc.disable()  # as timeit does, so that collections of the copies are not timed
+        try:
+            start = time.time()
+            for b in copies:
+                fn(b, out_format, current_format)
+            t = time.time() - start
+        finally:
+            gc.enable()
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('nexson', nargs='*', default=[_DEFAULT_INPUT], help='NexSON files or directories')
+    parser.add_argument('--phylesystem', action='store_true', help='use every study of the local phylesystem')
+    parser.add_argument('--repeat', type=int, default=3, help='best of N runs')
+    args = parser.parse_args()
+    filepaths = list(_iter_filepaths(args.nexson, args.phylesystem))
+    print('{:>10} {:>8} {:>14} {:>14} {:>8}'.format('direction', 'studies', 'via 1.0 (s)', 'single (s)', 'speedup'))
+    for src, dest, label in [(BADGER_FISH_NEXSON_VERSION, BY_ID_HONEY_BADGERFISH, '0.0->1.2'),
+                             (BY_ID_HONEY_BADGERFISH, BADGER_FISH_NEXSON_VERSION, '1.2->0.0')]:
+        blobs = _load_blobs(filepaths, src)
+        chained = _time_all(_via_direct, blobs, dest, src, args.repeat)
+        single = _time_all(_single_pass, blobs, dest, src, args.repeat)
+        print('{:>10} {:>8} {:>14.3f} {:>14.3f} {:>7.2f}x'.format(label, len(blobs), chained, single,
+                                                                   chained / single if single else 0.0))
+
+
+if __name__ == '__main__':
+    main()
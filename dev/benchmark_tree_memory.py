@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Reports the memory per node (and build time) of the trees created by
+create_tree_from_id2par and parse_newick with the node-object, slotted and
+struct-of-arrays tree classes of peyotl.phylo.tree.
+
+Memory is measured with tracemalloc when it is available (python 3), otherwise
+by a deep sys.getsizeof walk of the tree.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.phylo.tree import (create_tree_from_id2par, parse_newick, ArrayTreeWithPathsInEdges,
+                               SlottedTreeWithPathsInEdges, TreeWithPathsInEdges)
+from peyotl.utility.str_util import StringIO
+import argparse
+import random
+import time
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_CLASSES = (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges)
+
+
+def random_id2par(num_tips, seed):
+    """Returns (id2par, tip list) for a random binary tree with integer IDs."""
+    rng = random.Random(seed)
+    id2par = {0: None}
+    tips = [0]
+    next_id = 1
+    while len(tips) < num_tips:
+        i = rng.randrange(len(tips))
+        par = tips[i]
+        tips[i] = next_id
+        tips.append(next_id + 1)
+        id2par[next_id] = par
+        id2par[next_id + 1] = par
+        next_id += 2
+    return id2par, tips
+
+
+def deep_sizeof(obj):
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            d = getattr(o, '__dict__', None)
+            if d is not None:
+                stack.append(d)
+            for klass in type(o).__mro__:
+                for slot in getattr(klass, '__slots__', ()):
+                    v = getattr(o, slot, None)
+                    if v is not None and not isinstance(v, property):
+                        stack.append(v)
+    return total
+
+
+def measure(build_fn):
+    """Returns (tree, bytes, seconds) for the tree returned by `build_fn()`"""
+    if tracemalloc is not None:
+        tracemalloc.start()
+        start = time.time()
+        tree = build_fn()
+        elapsed = time.time() - start
+        nbytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        start = time.time()
+        tree = build_fn()
+        elapsed = time.time() - start
+        nbytes = deep_sizeof(tree)
+    return tree, nbytes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tips', type=int, default=100000, help='number of tips in the random tree')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    id2par, tips = random_id2par(args.tips, args.seed)
+    newick = None
+    print('{:>40} {:>10} {:>10} {:>12}'.format('tree class (source)', 'nodes', 'bytes/node', 'seconds'))
+    for source in ('id2par', 'newick'):
+        for cls in _CLASSES:
+            if source == 'id2par':
+                def build():
+                    return create_tree_from_id2par(id2par, list(tips), _class=cls)
+            else:
+                def build():
+                    return parse_newick(newick=newick, _class=cls)
+            tree, nbytes, elapsed = measure(build)
+            num_nodes = sum(1 for _ in tree.preorder_node_iter())
+            if newick is None:
+                o = StringIO()
+                tree.write_newick(o)
+                newick = o.getvalue()
+            label = '{} ({})'.format(cls.__name__, source)
+            print('{:>40} {:>10} {:>10.1f} {:>12.3f}'.format(label, num_nodes, nbytes / num_nodes, elapsed))
+            del tree
+
+
+if __name__ == '__main__':
+    main()
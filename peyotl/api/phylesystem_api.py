@@ -42,6 +42,8 @@ class _PhylesystemAPIWrapper(_WSWrapper):
         self._phylesystem_config = None
         self._phylesystem_obj = None
         self._use_raw = False
+        # ConversionCache for the client-side conversions of studies from a local phylesystem
+        self.conversion_cache = kwargs.get('conversion_cache')
 
     @property
     def domain(self):
@@ -133,6 +135,7 @@ class _PhylesystemAPIWrapper(_WSWrapper):
         return r
 
     def get_study(self, study_id, schema=None):
+        blob_sha = None
         if self._src_code == _GET_EXTERNAL:
             url = self.get_external_url(study_id)
             nexson = self.json_http_get(url)
@@ -141,6 +144,8 @@ class _PhylesystemAPIWrapper(_WSWrapper):
             nexson, sha = self.phylesystem_obj.return_study(study_id)  # pylint: disable=W0632
             r = {'data': nexson,
                  'sha': sha}
+            if self.conversion_cache is not None and schema is not None:
+                blob_sha = self.phylesystem_obj.get_blob_sha_for_study_id(study_id, sha)
         else:
             assert self._src_code == _GET_API
             if self._trans_code == _TRANS_SERVER:
@@ -148,7 +153,7 @@ class _PhylesystemAPIWrapper(_WSWrapper):
                     schema = create_content_spec(nexson_version=self.repo_nexml2json)
             r = self._remote_get_study(study_id, schema)
         if (isinstance(r, dict) and 'data' in r) and (self._trans_code == _TRANS_CLIENT) and (schema is not None):
-            r['data'] = schema.convert(r['data'])
+            r['data'] = schema.convert(r['data'], cache=self.conversion_cache, blob_sha=blob_sha)
         return r
 
     @property
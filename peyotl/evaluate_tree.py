@@ -1,20 +1,29 @@
 #!/usr/bin/env python
+"""Scores the possible rootings of a phylogeny by the number of taxa (of the OTT
+induced tree for its tips) that each rooting displays and conflicts with.
+
+Taxonomy clusters are nested, so each taxon is classified once against the
+unrooted phylogeny: it maps (through the maximal phylogeny nodes whose leaves are
+all in the taxon) onto a "hub" node that separates the taxon's branches from the
+other branches. The rootings in which a taxon is displayed or incompatible are
+then unions of preorder intervals of the (currently rooted) phylogeny, so all of
+the rooting positions are scored with difference arrays in one sweep. The cost
+is linear in the size of the phylogeny plus the sum of the taxon sizes, rather
+than the product of the numbers of edges of the two trees.
+"""
+from __future__ import absolute_import, print_function, division
 from peyotl.ott import create_pruned_and_taxonomy_for_tip_ott_ids
-from peyotl.phylo.compat import compare_bits_as_splits, SplitComparison
+from peyotl.utility.parallel import default_num_workers, shared_ordered_parallel_map
 from peyotl.utility import any_early_exit, get_logger
+from bisect import bisect_left, bisect_right
 
 _LOG = get_logger(__name__)
 
 
 def evaluate_tree_rooting(nexson, ott, tree_proxy):
-    """
-    Returns None if the taxanomy contributes no information to the rooting decision
-        (e.g. all of the tips are within one genus in the taxonomy)
-
-    TODO: need to coordinate with Jim Allman and see if we can
-    do this in a non- O(nm) manner (where n and m are the # of non-trivial edges in the phylo and taxo tree)
-    putting barrier notes on the phylo tree would work...
-
+    """Returns None if the taxanomy contributes no information to the rooting decision
+        (e.g. all of the tips are within one genus in the taxonomy).
+    Otherwise returns the dict described in score_rootings_against_taxonomy.
     """
     pruned_phylo, taxo_tree = create_pruned_and_taxonomy_for_tip_ott_ids(tree_proxy, ott)
     if taxo_tree is None:  # this can happen if no otus are mapped
@@ -25,194 +34,277 @@ def evaluate_tree_rooting(nexson, ott, tree_proxy):
     has_phylo_groupings = any_early_exit(pruned_phylo.root.child_iter(), lambda node: not node.is_leaf)
     if not has_phylo_groupings:
         return None
-    id2bit = pruned_phylo.add_bits4subtree_ids(None)
-    taxo_tree.add_bits4subtree_ids(id2bit)
-    assert taxo_tree.root.bits4subtree_ids == pruned_phylo.root.bits4subtree_ids
-    taxo_nontriv_splits = taxo_tree.bits2internal_node
-    taxon_mask = taxo_tree.root.bits4subtree_ids
-    # _LOG.debug('taxo_nontriv_splits = {}'.format(taxo_nontriv_splits))
-    # might want to copy this dict rather than modify in place..
-    del taxo_nontriv_splits[taxon_mask]  # root bitmask is trivial
-    _LOG.debug('taxon_mask = {} (which is {} bits)'.format(bin(taxon_mask)[2:], len(bin(taxon_mask)) - 2))
-    num_ids = len(id2bit)
-    _LOG.debug('id2bit has length = {}'.format(len(id2bit)))
-    # for checking tips of the phylogeny, it is nice to know which leaf OTUs attach
-    #   at the base of the taxonomy (no other grouping)
-    basal_taxo = set()
-    basal_bits = 0
-    for c in taxo_tree.root.child_iter():
-        if c.is_leaf:
-            basal_taxo.add(c._id)
-            basal_bits |= id2bit[c._id]
-    _LOG.debug('basal_bits = {}'.format(bin(basal_bits)[2:].zfill(num_ids)))
-    _LOG.debug('# nontrivial taxo splits = {}'.format(len(taxo_nontriv_splits)))
-    _EMPTY_SET = frozenset([])
-    non_root_pp_preorder = [nd for nd in pruned_phylo.preorder_node_iter()][1:]
-    curr_root_incompat_set = set()
-    any_root_incompat_set = set()
-    _taxo_node_id_set_cache = {_EMPTY_SET: _EMPTY_SET}
-    for node in non_root_pp_preorder:
-        edge = node.edge
-        if node.is_leaf:
-            edge._displays = None
-            edge._inverted_displays = None
-            b = id2bit[node._id]
-            if node._id in basal_taxo:
-                edge._not_inverted_incompat = _EMPTY_SET
-                edge._inverted_incompat = _EMPTY_SET
-                inv_mask = taxon_mask - b
-                idisp = taxo_nontriv_splits.get(inv_mask)
-                if idisp is not None:
-                    edge._inverted_displays = idisp
+    result = score_rootings_against_taxonomy(pruned_phylo, taxo_tree)
+    _LOG.debug('best_score = {}'.format(result['best_score']))
+    _LOG.debug('best_rootings = {}'.format(result['best_rootings']))
+    _LOG.debug('current score = {}'.format(result['current_score']))
+    return result
+
+
+class _PreorderPhylo(object):
+    """Preorder arrays of the rooted phylogeny: parent index, children, index of the
+    last descendant, and the (preorder) ranks of the first and last leaf below each node."""
+
+    def __init__(self, tree):
+        ta = tree.traversal_arrays()
+        preorder, tree_par = ta.preorder, ta.parent
+        nodes = [ta.node(i) for i in preorder]
+        n = len(nodes)
+        rank = [0] * len(tree_par)
+        for r, i in enumerate(preorder):
+            rank[i] = r
+        par = [-1] * n
+        children = [None] * n
+        for r in range(1, n):
+            p = rank[tree_par[preorder[r]]]
+            par[r] = p
+            if children[p] is None:
+                children[p] = [r]
             else:
-                edge._not_inverted_incompat = _EMPTY_SET
-                # TODO would be more efficient to jump to tip and walk back...
-                b = id2bit[node._id]
-                ii = set()
-                for tb, tid in taxo_nontriv_splits.items():
-                    if tb & b:
-                        ii.add(tid)
-                edge._inverted_incompat = _get_cached_set(ii, _taxo_node_id_set_cache)
-                disp = taxo_nontriv_splits.get(b)
-                if disp is not None:
-                    edge._displays = disp
-        else:
-            # TODO this could be more efficient...
-            b = node.bits4subtree_ids
-            nii = set()
-            ii = set()
-            e = set()
-            ie = set()
-            displays = None
-            inv_displays = None
-            # TODO: this loop does not take advantage of the fact that
-            #   taxo_nontriv_splits are splits from a tree (hence compatible with each other)
-            for tb, tid in taxo_nontriv_splits.items():
-                sp_result = compare_bits_as_splits(b, tb, taxon_mask)
-                if sp_result == SplitComparison.UNROOTED_INCOMPATIBLE:
-                    any_root_incompat_set.add(tid)
-                    nii.add(tid)
-                    ii.add(tid)
-                elif sp_result == SplitComparison.UNROOTED_COMPAT:
-                    nii.add(tid)
-                elif sp_result == SplitComparison.ROOTED_COMPAT:
-                    ii.add(tid)
-                elif sp_result == SplitComparison.UNROOTED_EQUIVALENT:
-                    ie.add(tid)
-                    inv_displays = tid
-                elif sp_result == SplitComparison.ROOTED_EQUIVALENT:
-                    e.add(tid)
-                    displays = tid
-            edge._not_inverted_incompat = _get_cached_set(nii, _taxo_node_id_set_cache)
-            edge._inverted_incompat = _get_cached_set(ii, _taxo_node_id_set_cache)
-            edge._equiv = _get_cached_set(e, _taxo_node_id_set_cache)
-            edge._inverted_equiv = _get_cached_set(ie, _taxo_node_id_set_cache)
-            edge._displays = displays
-            edge._inverted_displays = inv_displays
-            curr_root_incompat_set.update(nii)
-            # create a set to be filled in in the loop below (for each internal node)
-            node._inc_contrib_rootward = set()
-            node._displays_contrib_rootward = set()
-    pproot = pruned_phylo.root
-    pproot._incompat_if_rooted_below = set()
-    pproot._inc_contrib_rootward = set()
-    pproot._displays_contrib_rootward = set()
-    for node in reversed(non_root_pp_preorder):
-        edge = node.edge
+                children[p].append(r)
+        last = list(range(n))
+        first_leaf = [0] * n
+        last_leaf = [0] * n
+        leaf_index = []
+        for i in range(n):
+            if children[i] is None:
+                first_leaf[i] = last_leaf[i] = len(leaf_index)
+                leaf_index.append(i)
+        for i in range(n - 1, -1, -1):
+            c = children[i]
+            if c is not None:
+                last[i] = last[c[-1]]
+                first_leaf[i] = first_leaf[c[0]]
+                last_leaf[i] = last_leaf[c[-1]]
+        self.nodes = nodes
+        self.par = par
+        self.children = children
+        self.last = last
+        self.first_leaf = first_leaf
+        self.last_leaf = last_leaf
+        self.leaf_index = leaf_index
+        self.leaf_rank = dict((nodes[i]._id, r) for r, i in enumerate(leaf_index))
+
+
+def _taxon_leaf_ranks(taxo_tree, leaf_rank):
+    """Returns a list of the sorted phylogeny leaf ranks of each non-root taxon with
+    more than one (but not all) of the leaves. Taxa with the same leaves are reported once."""
+    num_leaves = len(leaf_rank)
+    ranks_of = {}
+    taxa = []
+    for node in taxo_tree.postorder_node_iter():
+        r = leaf_rank.get(node._id)
         if node.is_leaf:
-            edge._inc_contrib_rootward = _EMPTY_SET
-            node._displays_contrib_rootward = _EMPTY_SET
-        else:
-            par = node.parent
-            iaobc = set(edge._not_inverted_incompat)
-            iaobc.update(node._inc_contrib_rootward)
-            edge._inc_contrib_rootward = _get_cached_set(iaobc, _taxo_node_id_set_cache)
-            par._inc_contrib_rootward.update(edge._inc_contrib_rootward)
-            par._displays_contrib_rootward.update(node._displays_contrib_rootward)
-            if edge._displays is not None:
-                par._displays_contrib_rootward.add(edge._displays)
-
-    _LOG.debug('# root _inc_contrib_rootward = {}'.format(pruned_phylo.root._inc_contrib_rootward))
-    _LOG.debug('# curr_root_incompat_set = {}'.format(curr_root_incompat_set))
-    pproot.rooting_here_incompat = _get_cached_set(pproot._inc_contrib_rootward, _taxo_node_id_set_cache)
-    pproot.rooting_here_incompat_score = len(pproot.rooting_here_incompat)
-    pproot.rooting_here_displays = _get_cached_set(pproot._displays_contrib_rootward, _taxo_node_id_set_cache)
-    pproot.rooting_here_disp_score = len(pproot.rooting_here_displays)
-    pproot.rooting_here_score = (pproot.rooting_here_disp_score, pproot.rooting_here_incompat_score)
-    pproot._inc_contrib_tipward = _EMPTY_SET
-    pproot._disp_contrib_tipward = _EMPTY_SET
-    best_score = pproot.rooting_here_score
-    best_rootings = [pproot]
-    # now sweep up
-    for node in non_root_pp_preorder:
-        edge = node.edge
-        parent = node.parent
-        sib_inc_union = set()
-        sib_disp = set()
-        for sib in node.sib_iter():
-            sib_inc_union.update(sib.edge._inc_contrib_rootward)
-            sib_disp.update(sib._displays_contrib_rootward)
-            if sib.edge._displays is not None:
-                sib_disp.add(sib.edge._displays)
-        # if we are visiting an internal node, we have to figure out the cost of
-        #  rooting at the node too...
-        if not node.is_leaf:
-            icu = set()
-            icu.update(edge._inverted_incompat)
-            icu.update(sib_inc_union)
-            icu.update(parent._inc_contrib_tipward)
-            node._inc_contrib_tipward = _get_cached_set(icu, _taxo_node_id_set_cache)
-            dci = set(sib_disp)
-            if edge._inverted_displays is not None:
-                dci.add(edge._displays)
-            dci.update(parent._disp_contrib_tipward)
-            node._disp_contrib_tipward = _get_cached_set(dci, _taxo_node_id_set_cache)
-
-            rhi = set()
-            rhi.update(icu)
-            rhi.update(node._inc_contrib_rootward)
-            node.rooting_here_incompat = _get_cached_set(rhi, _taxo_node_id_set_cache)
-            rhd = set(node._displays_contrib_rootward)
-            rhd.update(node._disp_contrib_tipward)
-            node.rooting_here_displays = _get_cached_set(rhd, _taxo_node_id_set_cache)
-            best_score, best_rootings = _check_for_opt_score(node, best_score, best_rootings)
-        # figure out the # of conflicts if rooting on this edge...
-        rhi = set()
-        rhi.update(edge._inverted_incompat)
-        rhi.update(sib_inc_union)
-        edge.rooting_here_incompat = _get_cached_set(rhi, _taxo_node_id_set_cache)
-        rhd = set(parent._disp_contrib_tipward)
-        rhd.update(parent.rooting_here_displays)
-        if edge._inverted_displays is not None:
-            rhd.add(edge._inverted_displays)
-        edge.rooting_here_displays = _get_cached_set(rhd, _taxo_node_id_set_cache)
-        best_score, best_rootings = _check_for_opt_score(edge, best_score, best_rootings)
-
-    _LOG.debug('best_score = {}'.format(best_score))
-    _LOG.debug('best_rootings = {}'.format(best_rootings))
-    _LOG.debug('current score = {}'.format(pproot.rooting_here_score))
-    _LOG.debug('any_root_incompat_set (size={}) = {}'.format(len(any_root_incompat_set), any_root_incompat_set))
-
-
-def _check_for_opt_score(entity, best, best_list):
-    incompat = len(entity.rooting_here_incompat)
-    ds = len(entity.rooting_here_displays)
-    entity.rooting_here_incompat_score = incompat
-    entity.rooting_here_disp_score = ds
-    entity.rooting_here_score = (entity.rooting_here_disp_score, entity.rooting_here_incompat_score)
+            ranks_of[id(node)] = [] if r is None else [r]
+            continue
+        kids = [ranks_of.pop(id(c)) for c in node.child_iter()]
+        if len(kids) == 1 and r is None:
+            ranks_of[id(node)] = kids[0]  # same leaf set as the child, so the list is shared
+            continue
+        merged = [] if r is None else [r]
+        for k in kids:
+            merged.extend(k)
+        merged.sort()
+        ranks_of[id(node)] = merged
+        if node._parent is not None and 1 < len(merged) < num_leaves:
+            taxa.append(merged)
+    # a monotypic chain shares one list, so only the tipmost member was appended
+    return taxa
+
+
+def _maximal_full_nodes(pp, ranks):
+    """Returns the maximal phylogeny nodes whose leaves are all in `ranks` (a sorted list of leaf ranks)."""
+    par, first_leaf, last_leaf = pp.par, pp.first_leaf, pp.last_leaf
+    cover = []
+    i, num = 0, len(ranks)
+    while i < num:
+        v = pp.leaf_index[ranks[i]]
+        while True:
+            p = par[v]
+            if p < 0:
+                break
+            lo, hi = first_leaf[p], last_leaf[p]
+            if bisect_right(ranks, hi) - bisect_left(ranks, lo) != hi - lo + 1:
+                break
+            v = p
+        cover.append(v)
+        i += last_leaf[v] - first_leaf[v] + 1
+    return cover
+
+
+def _classify_taxon(pp, ranks):
+    """Returns (hub, taxon_branches, other_branches) or None if the taxon conflicts with
+    every rooting. Branches are child indices of the hub, except that the parent side of
+    the hub is represented by -1."""
+    cover = _maximal_full_nodes(pp, ranks)
+    par, children = pp.par, pp.children
+    num_cover_kids = {}
+    for c in cover:
+        p = par[c]
+        num_cover_kids[p] = num_cover_kids.get(p, 0) + 1
+    if len(num_cover_kids) == 1:
+        hub = par[cover[0]]
+        in_cover = set(cover)
+        others = [c for c in children[hub] if c not in in_cover]
+        if par[hub] >= 0:
+            others.append(-1)
+        return hub, cover, others
+    # the taxon must contain the root side of the deepest hub; every node on the path
+    #   from there to the root must have all but the pathward child in the taxon.
+    hub = max(num_cover_kids.keys())  # descendants follow their ancestors in preorder
+    on_path = 1
+    p = par[hub]
+    while p >= 0:
+        k = num_cover_kids.get(p, 0)
+        if k != len(children[p]) - 1:
+            return None
+        if k:
+            on_path += 1
+            if on_path > len(num_cover_kids):
+                return None
+        p = par[p]
+    if on_path != len(num_cover_kids):
+        return None
+    in_cover = set(cover)
+    hub_cover = [c for c in children[hub] if c in in_cover]
+    others = [c for c in children[hub] if c not in in_cover]
+    return hub, hub_cover + [-1], others
+
+
+def score_rootings_against_taxonomy(pruned_phylo, taxo_tree):
+    """Scores every rooting of `pruned_phylo` (at an internal node or on an edge) by the
+    number of taxa in `taxo_tree` that it displays and the number that it is incompatible with.
+    The leaf IDs of `taxo_tree` must be the leaf IDs of `pruned_phylo`.
+
+    Sets rooting_here_score (a (# displayed, # incompatible) tuple) on each internal node
+    and on the edge of each non-root node, and returns a dict with:
+        'current_score': the score of the current root,
+        'best_score': the highest # displayed (ties broken by the lowest # incompatible),
+        'best_rootings': list of ('node', node_id) or ('edge', parent_id, child_id) tuples,
+        'num_taxa': number of distinct non-trivial taxa,
+        'num_always_incompatible': number of taxa that conflict with every rooting.
+    """
+    pp = _PreorderPhylo(pruned_phylo)
+    n = len(pp.nodes)
+    last = pp.last
+    node_inc, edge_inc = [0] * (n + 1), [0] * (n + 1)
+    node_disp, edge_disp = [0] * (n + 1), [0] * (n + 1)
+    all_inc, all_disp = 0, 0
+    taxa = _taxon_leaf_ranks(taxo_tree, pp.leaf_rank)
+    num_always_incompatible = 0
+    for ranks in taxa:
+        c = _classify_taxon(pp, ranks)
+        if c is None:
+            num_always_incompatible += 1
+            all_inc += 1
+            continue
+        hub, taxon_branches, other_branches = c
+        # rootings strictly within one of the taxon's branches break the taxon. If there is
+        #   only one such branch (a child of the hub, as the cover of a taxon that includes the
+        #   root side has more than one node), the taxon is a split of the tree: rooting at the
+        #   child or on its edge leaves the taxon compatible, and it is displayed everywhere else.
+        if len(taxon_branches) == 1:
+            b = taxon_branches[0]
+            node_inc[b + 1] += 1
+            node_inc[last[b] + 1] -= 1
+            edge_inc[b + 1] += 1
+            edge_inc[last[b] + 1] -= 1
+            all_disp += 1
+            node_disp[b] -= 1
+            node_disp[last[b] + 1] += 1
+            edge_disp[b + 1] -= 1
+            edge_disp[last[b] + 1] += 1
+            continue
+        for b in taxon_branches:
+            if b < 0:
+                all_inc += 1
+                node_inc[hub] -= 1
+                node_inc[last[hub] + 1] += 1
+                edge_inc[hub + 1] -= 1
+                edge_inc[last[hub] + 1] += 1
+            else:
+                node_inc[b] += 1
+                node_inc[last[b] + 1] -= 1
+                edge_inc[b] += 1
+                edge_inc[last[b] + 1] -= 1
+        if len(other_branches) == 1:
+            # the rest of the tree is one child of the hub (the parent side of the hub can not
+            #   be the only other branch, as the hub would then be in the cover), so the taxon
+            #   is displayed by rooting on the edge to that child or within it.
+            b = other_branches[0]
+            node_disp[b] += 1
+            node_disp[last[b] + 1] -= 1
+            edge_disp[b] += 1
+            edge_disp[last[b] + 1] -= 1
+    best_score, best_rootings = None, []
+    current_score = None
+    ni, ei, nd, ed = all_inc, all_inc, all_disp, all_disp
+    for i, node in enumerate(pp.nodes):
+        ni += node_inc[i]
+        ei += edge_inc[i]
+        nd += node_disp[i]
+        ed += edge_disp[i]
+        if pp.children[i] is not None:
+            score = (nd, ni)
+            node.rooting_here_score = score
+            if i == 0:
+                current_score = score
+            best_score, best_rootings = _check_for_opt_score(score, ('node', node._id), best_score, best_rootings)
+        if i > 0:
+            score = (ed, ei)
+            node.edge.rooting_here_score = score
+            where = ('edge', pp.nodes[pp.par[i]]._id, node._id)
+            best_score, best_rootings = _check_for_opt_score(score, where, best_score, best_rootings)
+    return {'current_score': current_score,
+            'best_score': best_score,
+            'best_rootings': best_rootings,
+            'num_taxa': len(taxa),
+            'num_always_incompatible': num_always_incompatible}
+
+
+def _check_for_opt_score(score, where, best, best_list):
+    if best is None:
+        return score, [where]
+    ds, incompat = score
     high_disp, low_incompat = best
-    if ds > high_disp:
-        best = entity.rooting_here_score
-        best_list = [entity]
-    elif ds == high_disp:
-        if incompat < low_incompat:
-            best = entity.rooting_here_score
-            best_list = [entity]
-        elif incompat == low_incompat:
-            best_list.append(entity)
+    if ds > high_disp or (ds == high_disp and incompat < low_incompat):
+        return score, [where]
+    if score == best:
+        best_list.append(where)
     return best, best_list
 
 
-def _get_cached_set(s, dict_frozensets):
-    fs = frozenset(s)
-    return dict_frozensets.setdefault(fs, fs)
+def _evaluate_study_rootings(ott, args):
+    from peyotl.nexson_syntax import extract_tree_nexson
+    from peyotl.nexson_proxy import NexsonTreeProxy
+    study_id, nexson = args
+    results = []
+    for tree_id, tree, otus in extract_tree_nexson(nexson, tree_id=None):
+        tree_proxy = NexsonTreeProxy(tree=tree, tree_id=tree_id, otus=otus)
+        results.append((tree_id, evaluate_tree_rooting(nexson, ott, tree_proxy)))
+    return study_id, results
+
+
+def iter_tree_rooting_evaluations(study_iter, ott, num_workers=None):
+    """Yields (study_id, tree_id, evaluate_tree_rooting result) for each tree in the
+    (study_id, nexson) pairs of `study_iter`. Studies are evaluated by a pool of
+    `num_workers` processes (default: one per CPU). The OTT parent table is loaded before
+    the pool is created, so forked workers share it.
+    """
+    if num_workers is None:
+        num_workers = default_num_workers()
+    ott.preload(('ottID2parentOttId',))
+    for study_id, results in shared_ordered_parallel_map(_evaluate_study_rootings, ott, study_iter, num_workers):
+        for tree_id, r in results:
+            yield study_id, tree_id, r
+
+
+def evaluate_study_tree_rootings(nexson, ott):
+    """Returns a dict of tree ID -> evaluate_tree_rooting result for every tree in `nexson`."""
+    return dict((tree_id, r) for _, tree_id, r in iter_tree_rooting_evaluations([(None, nexson)], ott,
+                                                                                num_workers=1))
+
+
+def evaluate_phylesystem_tree_rootings(phylesystem, ott, num_workers=None):
+    """Generator of (study_id, tree_id, evaluate_tree_rooting result) for every tree in `phylesystem`."""
+    return iter_tree_rooting_evaluations(phylesystem.iter_study_objs(), ott, num_workers=num_workers)
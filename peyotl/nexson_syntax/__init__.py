@@ -34,12 +34,16 @@ from peyotl.nexson_syntax.optimal2direct_nexson import Optimal2DirectNexson
 from peyotl.nexson_syntax.direct2optimal_nexson import Direct2OptimalNexson
 from peyotl.nexson_syntax.badgerfish2direct_nexson import Badgerfish2DirectNexson
 from peyotl.nexson_syntax.direct2badgerfish_nexson import Direct2BadgerfishNexson
+from peyotl.nexson_syntax.badgerfish2optimal_nexson import Badgerfish2OptimalNexson
+from peyotl.nexson_syntax.optimal2badgerfish_nexson import Optimal2BadgerfishNexson
+from peyotl.nexson_syntax.conversion_cache import ConversionCache
 from peyotl.nexson_syntax.nexson2nexml import Nexson2Nexml
 from peyotl.nexson_syntax.nexml2nexson import Nexml2Nexson
 from peyotl.nexson_syntax.inspect import count_num_trees
 from peyotl.utility import get_logger
 import xml.dom.minidom
 import codecs
+import json
 import re
 
 _CONVERTIBLE_FORMATS = frozenset([NEXML_NEXSON_VERSION,
@@ -355,6 +359,18 @@ class PhyloSchema(object):
         elif self.format_code == PhyloSchema.NEWICK:
             return 'Newick'
 
+    @property
+    def cache_key(self):
+        """String that identifies the output of convert for a study (see ConversionCache)."""
+        content_id = self.content_id
+        if isinstance(content_id, list) or isinstance(content_id, tuple):
+            content_id = '/'.join(UNICODE(i) for i in content_id)
+        parts = [self.content, content_id, self.description]
+        if self.format_code != PhyloSchema.NEXSON:
+            parts.append(self.otu_label)
+        parts.extend([self.bracket_ingroup, self.cull_nonmatching])
+        return u'|'.join(u'' if i is None else UNICODE(i) for i in parts)
+
     def can_convert_from(self, src_schema=None):  # pylint: disable=W0613
         if self.format_code == PhyloSchema.NEXSON:
             return self.content != 'subtree'
@@ -428,10 +444,32 @@ class PhyloSchema(object):
         else:
             assert False
 
-    def serialize(self, src, output_dest=None, src_schema=None):
-        return self.convert(src, serialize=True, output_dest=output_dest, src_schema=src_schema)
+    def serialize(self, src, output_dest=None, src_schema=None, cache=None, blob_sha=None):
+        return self.convert(src, serialize=True, output_dest=output_dest, src_schema=src_schema, cache=cache,
+                            blob_sha=blob_sha)
+
+    def convert(self, src, serialize=None, output_dest=None, src_schema=None, cache=None, blob_sha=None):
+        """Returns the conversion of the NexSON `src` (or writes it to `output_dest`).
+        If a ConversionCache `cache` and the git blob SHA of the study file that `src` was
+        read from (`blob_sha`) are given, the result is looked up in (or added to) `cache`,
+        so `src` is not modified on a cache hit.
+        """
+        if cache is None or blob_sha is None or output_dest:
+            return self._convert(src, serialize=serialize, output_dest=output_dest, src_schema=src_schema)
+        is_nexson = self.format_code == PhyloSchema.NEXSON
+        schema_key = self.cache_key
+        r = cache.get(blob_sha, schema_key)
+        if r is None:
+            # NexSON is cached as the serialized JSON, so that every hit returns a new object
+            r = self._convert(src, serialize=True if is_nexson else serialize, src_schema=src_schema)
+            if r is None:
+                return None
+            cache.put(blob_sha, schema_key, r)
+        if is_nexson and not serialize:
+            return json.loads(r)
+        return r
 
-    def convert(self, src, serialize=None, output_dest=None, src_schema=None):
+    def _convert(self, src, serialize=None, output_dest=None, src_schema=None):
         if src_schema is None:
             src_format = PhyloSchema.NEXSON
             current_format = None
@@ -534,10 +572,23 @@ class PhyloSchema(object):
         assert False
 
 
+_READ_CHUNK_SIZE = 1 << 16
+
+
+def _iter_utf_8_chunks(text_stream):
+    """Yields the content of `text_stream` as utf-8 encoded blocks."""
+    while True:
+        chunk = text_stream.read(_READ_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk.encode('utf-8')
+
+
 def get_ot_study_info_from_nexml(src=None,
                                  nexml_content=None,
                                  encoding=u'utf8',
-                                 nexson_syntax_version=DEFAULT_NEXSON_VERSION):
+                                 nexson_syntax_version=DEFAULT_NEXSON_VERSION,
+                                 streaming=True):
     """Converts an XML doc to JSON using the honeybadgerfish convention (see to_honeybadgerfish_dict)
     and then prunes elements not used by open tree of life study curartion.
 
@@ -556,28 +607,38 @@ def get_ot_study_info_from_nexml(src=None,
     Currently:
         removes nexml/characters @TODO: should replace it with a URI for
             where the removed character data can be found.
+
+    If `streaming` is True (the default), the document is converted as it is read (see
+    Nexml2Nexson.convert_stream), rather than being parsed into a minidom document first,
+    which needs many times the size of the file in memory. The result is the same.
     """
     if _is_by_id_hbf(nexson_syntax_version):
         nsv = DIRECT_HONEY_BADGERFISH
     else:
         nsv = nexson_syntax_version
+    ccfg = ConversionConfig(output_format=nsv, input_format=NEXML_NEXSON_VERSION)
+    converter = Nexml2Nexson(ccfg)
     if nexml_content is None:
         if is_str_type(src):
             if src.startswith('http://') or src.startswith('https://'):
                 from peyotl.utility import download
                 nexml_content = download(url=src, encoding=encoding)
                 nexml_content = nexml_content.encode('utf-8')
-            else:
+            elif not streaming:
                 with codecs.open(src, 'r', encoding=encoding) as src:
                     nexml_content = src.read().encode('utf-8')
-        else:
+        elif not streaming:
             nexml_content = src.read().encode('utf-8')
-    doc = xml.dom.minidom.parseString(nexml_content)
-    doc_root = doc.documentElement
-
-    ccfg = ConversionConfig(output_format=nsv, input_format=NEXML_NEXSON_VERSION)
-    converter = Nexml2Nexson(ccfg)
-    o = converter.convert(doc_root)
+    if not streaming:
+        doc = xml.dom.minidom.parseString(nexml_content)
+        o = converter.convert(doc.documentElement)
+    elif nexml_content is not None:
+        o = converter.convert_stream([nexml_content])
+    elif is_str_type(src):
+        with codecs.open(src, 'r', encoding=encoding) as src:
+            o = converter.convert_stream(_iter_utf_8_chunks(src))
+    else:
+        o = converter.convert_stream(_iter_utf_8_chunks(src))
     if _is_by_id_hbf(nexson_syntax_version):
         o = convert_nexson_format(o, BY_ID_HONEY_BADGERFISH, current_format=nsv)
     if 'nex:nexml' in o:
@@ -599,7 +660,12 @@ def write_obj_as_nexml(obj_dict,
                        addindent='',
                        newl='',
                        use_default_root_atts=True,
-                       otu_label='ot:originalLabel'):
+                       otu_label='ot:originalLabel',
+                       streaming=True):
+    """Writes `obj_dict` as NeXML to `file_obj`. If `streaming` is True (the default) each
+    element is written as the NexSON is traversed (see Nexson2Nexml.write), otherwise a
+    minidom Document is built and then written. The output is the same.
+    """
     nsv = detect_nexson_version(obj_dict)
     if not _nexson_directly_translatable_to_nexml(nsv):
         convert_nexson_format(obj_dict, DIRECT_HONEY_BADGERFISH)
@@ -609,18 +675,23 @@ def write_obj_as_nexml(obj_dict,
                             use_default_root_atts=use_default_root_atts,
                             otu_label=otu_label)
     converter = Nexson2Nexml(ccfg)
-    doc = converter.convert(obj_dict)
-    doc.writexml(file_obj, addindent=addindent, newl=newl, encoding='utf-8')
+    if streaming:
+        converter.write(obj_dict, file_obj, addindent=addindent, newl=newl)
+    else:
+        doc = converter.convert(obj_dict)
+        doc.writexml(file_obj, addindent=addindent, newl=newl, encoding='utf-8')
 
 
-def convert_to_nexml(obj_dict, addindent='', newl='', use_default_root_atts=True, otu_label='ot:originalLabel'):
+def convert_to_nexml(obj_dict, addindent='', newl='', use_default_root_atts=True, otu_label='ot:originalLabel',
+                     streaming=True):
     f, wrapper = get_utf_8_string_io_writer()
     write_obj_as_nexml(obj_dict,
                        file_obj=wrapper,
                        addindent=addindent,
                        newl=newl,
                        use_default_root_atts=use_default_root_atts,
-                       otu_label=otu_label)
+                       otu_label=otu_label,
+                       streaming=streaming)
     flush_utf_8_writer(wrapper)
     return f.getvalue()
 
@@ -652,6 +723,9 @@ def convert_nexson_format(blob,
     """Take a dict form of NexSON and converts its datastructures to
     those needed to serialize as out_nexson_format.
     If current_format is not specified, it will be inferred.
+    The conversion is done in place: the dicts of the elements of `blob` are
+        reused rather than copied (see the docstrings of the converters), so
+        converting a study does not take much more memory than the study itself.
     If `remove_old_structs` is False and different honeybadgerfish varieties
         are selected, the `blob` will be 'fat" containing both types
         of lookup structures.
@@ -667,22 +741,19 @@ def convert_nexson_format(blob,
         if sort_arbitrary:
             sort_arbitrarily_ordered_nexson(blob)
         return blob
-    two2zero = _is_by_id_hbf(out_nexson_format) and _is_badgerfish_version(current_format)
-    zero2two = _is_by_id_hbf(current_format) and _is_badgerfish_version(out_nexson_format)
-    if two2zero or zero2two:
-        # go from 0.0 -> 1.0 then the 1.0->1.2 should succeed without nexml...
-        blob = convert_nexson_format(blob,
-                                     DIRECT_HONEY_BADGERFISH,
-                                     current_format=current_format,
-                                     remove_old_structs=remove_old_structs,
-                                     pristine_if_invalid=pristine_if_invalid)
-        current_format = DIRECT_HONEY_BADGERFISH
+    zero2two = _is_by_id_hbf(out_nexson_format) and _is_badgerfish_version(current_format)
+    two2zero = _is_by_id_hbf(current_format) and _is_badgerfish_version(out_nexson_format)
     ccdict = {'output_format': out_nexson_format,
               'input_format': current_format,
               'remove_old_structs': remove_old_structs,
               'pristine_if_invalid': pristine_if_invalid}
-    ccfg = ConversionConfig(ccdict)
-    if _is_badgerfish_version(current_format):
+    ccfg = ConversionConfig(**ccdict)
+    # 0.0 <-> 1.2 is done in one pass rather than by going through 1.0
+    if zero2two:
+        converter = Badgerfish2OptimalNexson(ccfg)
+    elif two2zero:
+        converter = Optimal2BadgerfishNexson(ccfg)
+    elif _is_badgerfish_version(current_format):
         converter = Badgerfish2DirectNexson(ccfg)
     elif _is_badgerfish_version(out_nexson_format):
         assert _is_direct_hbf(current_format)
@@ -22,6 +22,11 @@ class Badgerfish2DirectNexson(NexsonConverter):
     """Conversion of the direct Badgerfish and Phylografter JSON
     to the direct form of honeybadgerfish JSON (v 1.0)
     This is a dict-to-dict in-place conversion. No serialization is included.
+    With remove_old_structs (the default) no element is copied: the dicts of the
+    otus, otu, trees, tree, node and edge elements are reused, and a meta element
+    that has attributes other than its property, type and value becomes the value
+    of its ^-prefixed key. The only new objects are the lists that replace lone
+    elements. Otherwise the meta lists are kept, so those metas are copied.
     """
 
     def __init__(self, conv_cfg):
@@ -35,14 +40,20 @@ class Badgerfish2DirectNexson(NexsonConverter):
             self._workaround_phylografter_rel_bug = False
             self._add_tree_xsi_type = False
 
+    def _meta_remainder(self, bf_meta, suppressed):
+        """Returns a dict of the keys of `bf_meta` that are not in `suppressed`. If the old
+        structs are removed, this is `bf_meta` itself (after deleting the suppressed keys)."""
+        if self.remove_old_structs:
+            for k in suppressed:
+                bf_meta.pop(k, None)
+            return bf_meta
+        return dict((k, v) for k, v in bf_meta.items() if k not in suppressed)
+
     def _transform_literal_meta(self, lit_bf_meta):
         dt = lit_bf_meta.get('@datatype')
         content = lit_bf_meta.get('$')
         att_key = lit_bf_meta['@property']
-        full_obj = {}
-        for k in lit_bf_meta.keys():
-            if k not in _SUPPRESSED_LITERAL:
-                full_obj[k] = lit_bf_meta[k]
+        full_obj = self._meta_remainder(lit_bf_meta, _SUPPRESSED_LITERAL)
         # Coercion should not be needed for json->json
         if dt and self._coercing_literals:
             if is_str_type(content):
@@ -63,10 +74,7 @@ class Badgerfish2DirectNexson(NexsonConverter):
                 att_key = res_bf_meta['@property']
             else:
                 raise
-        full_obj = {}
-        for k in res_bf_meta.keys():
-            if k not in _SUPPRESSED_RESOURCE:
-                full_obj[k] = res_bf_meta[k]
+        full_obj = self._meta_remainder(res_bf_meta, _SUPPRESSED_RESOURCE)
         att_key = '^' + att_key
         assert full_obj
         _cull_redundant_about(full_obj)
@@ -77,27 +85,32 @@ class Badgerfish2DirectNexson(NexsonConverter):
             if isinstance(el, dict):
                 self._recursive_convert_dict(el)
 
-    def _recursive_convert_dict(self, obj):
+    def _recursive_convert_dict(self, obj, skip_keys=()):
+        """Converts the meta elements of `obj` and of the values of `obj` (other than those
+        of the keys in `skip_keys`, which the caller converts) to ^-prefixed keys."""
         _cull_redundant_about(obj)  # rule 10...
-        meta_list = _get_index_list_of_values(obj, 'meta')
-        to_inject = {}
-        for meta in meta_list:
-            xt = meta['@xsi:type']
-            if _RESOURCE_META_PAT.match(xt):
-                mk, mv = self._transform_resource_meta(meta)
-            else:
-                assert _LITERAL_META_PAT.match(xt)
-                mk, mv = self._transform_literal_meta(meta)
-            _add_value_to_dict_bf(to_inject, mk, mv)
-        if ('meta' in obj) and self.remove_old_structs:
-            del obj['meta']
-        for k, v in to_inject.items():
-            _add_value_to_dict_bf(obj, k, v)
+        if 'meta' in obj:
+            meta_list = _get_index_list_of_values(obj, 'meta')
+            to_inject = {}
+            for meta in meta_list:
+                xt = meta['@xsi:type']
+                if _RESOURCE_META_PAT.match(xt):
+                    mk, mv = self._transform_resource_meta(meta)
+                else:
+                    assert _LITERAL_META_PAT.match(xt)
+                    mk, mv = self._transform_literal_meta(meta)
+                _add_value_to_dict_bf(to_inject, mk, mv)
+            if self.remove_old_structs:
+                del obj['meta']
+            for k, v in to_inject.items():
+                _add_value_to_dict_bf(obj, k, v)
         for k, v in obj.items():
             if isinstance(v, dict):
-                self._recursive_convert_dict(v)
+                if k not in skip_keys:
+                    self._recursive_convert_dict(v)
             elif isinstance(v, list):
-                self._recursive_convert_list(v)
+                if k not in skip_keys:
+                    self._recursive_convert_list(v)
 
     def _dict_to_list_of_dicts(self, obj, tag, child_tag=None, grand_child_tag=None):
         el = obj.get(tag)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Badgerfish2OptimalNexson class"""
+from peyotl.nexson_syntax.badgerfish2direct_nexson import Badgerfish2DirectNexson
+from peyotl.nexson_syntax.helper import (get_nexml_el,
+                                         _get_index_list_of_values,
+                                         _index_list_of_values,
+                                         BY_ID_HONEY_BADGERFISH,
+                                         NexsonError)
+from peyotl.utility import get_logger
+
+_LOG = get_logger(__name__)
+
+
+class Badgerfish2OptimalNexson(Badgerfish2DirectNexson):
+    """Conversion of the direct Badgerfish and Phylografter JSON (v 0.0)
+    to the optimized version of honeybadgerfish JSON (v 1.2).
+    The result is the same as that of Badgerfish2DirectNexson followed by
+    Direct2OptimalNexson, but the meta elements of each otu, node and edge are
+    converted as it is indexed, so the blob is only walked once.
+    This is a dict-to-dict in-place conversion. No serialization is included.
+    The dicts of the blob are reused as described for Badgerfish2DirectNexson and
+    Direct2OptimalNexson.
+    """
+
+    def __init__(self, conv_cfg):
+        Badgerfish2DirectNexson.__init__(self, conv_cfg)
+
+    def _as_list(self, obj, tag):
+        """Returns the list of obj[tag] (after replacing a lone dict by a list holding it)."""
+        el = obj.get(tag)
+        if el and not isinstance(el, list):
+            obj[tag] = [el]
+        return _get_index_list_of_values(obj, tag)
+
+    def convert_otus(self, otus_list):
+        otusById = {}
+        otusElementOrder = []
+        for otus_el in otus_list:
+            self._recursive_convert_dict(otus_el, skip_keys=('otu',))
+            self._as_list(otus_el, 'otu')
+            otuById = {}
+            for otu in _index_list_of_values(otus_el, 'otu'):
+                self._recursive_convert_dict(otu)
+                otuById[otu['@id']] = otu
+            oid = otus_el['@id']
+            otusById[oid] = otus_el
+            otusElementOrder.append(oid)
+            otus_el['otuById'] = otuById
+        if self.remove_old_structs:
+            for otus_el in otusById.values():
+                del otus_el['@id']
+                del otus_el['otu']
+                for otu in otus_el['otuById'].values():
+                    del otu['@id']
+        return otusById, otusElementOrder
+
+    def convert_tree(self, tree):
+        """Return (tree_id, tree) or None (if the tree has no edges)."""
+        self._recursive_convert_dict(tree, skip_keys=('node', 'edge'))
+        if self._add_tree_xsi_type:
+            tree.setdefault('@xsi:type', 'nex:FloatTree')
+        nodeById = {}
+        root_node = None
+        self._as_list(tree, 'node')
+        node_list = _index_list_of_values(tree, 'node')
+        for node in node_list:
+            self._recursive_convert_dict(node)
+            nodeById[node['@id']] = node
+            if node.get('@root') in [True, 'true']:
+                assert root_node is None
+                root_node = node
+        assert root_node is not None
+        edgeBySourceId = {}
+        edge_list = self._as_list(tree, 'edge')
+        for edge in edge_list:
+            self._recursive_convert_dict(edge)
+            eid = edge['@id']
+            del edge['@id']
+            edgeBySourceId.setdefault(edge['@source'], {})[eid] = edge
+        tree['nodeById'] = nodeById
+        tree['edgeBySourceId'] = edgeBySourceId
+        tree['^ot:rootNodeId'] = root_node['@id']
+        tid = tree['@id']
+        if self.remove_old_structs:
+            del tree['@id']
+            del tree['node']
+            if 'edge' not in tree:
+                # see Direct2OptimalNexson.convert_tree
+                _LOG.warn('Tree with ID "{}" is being dropped because it has no edges'.format(tid))
+                assert not edge_list
+                return None
+            del tree['edge']
+            for node in node_list:
+                if '^ot:isLeaf' in node:
+                    del node['^ot:isLeaf']
+                del node['@id']
+        return tid, tree
+
+    def convert(self, obj):
+        """Takes a dict corresponding to the badgerfish JSON blob of the 0.0.* type and
+        converts it to BY_ID_HONEY_BADGERFISH version. The object is modified in place
+        and returned.
+        """
+        if self.pristine_if_invalid:
+            raise NotImplementedError('pristine_if_invalid option is not supported yet')
+        nex = get_nexml_el(obj)
+        assert nex
+        self._recursive_convert_dict(nex, skip_keys=('otus', 'trees'))
+        self._as_list(nex, 'otus')
+        otusById, otusElementOrder = self.convert_otus(_index_list_of_values(nex, 'otus'))
+        trees = self._as_list(nex, 'trees')
+        treesById = {}
+        treesElementOrder = []
+        tree_id_set = set()
+        for tree_group in trees:
+            tgid = tree_group['@id']
+            if tgid in treesById:
+                raise NexsonError('Repeated trees element id "{}"'.format(tgid))
+            treesById[tgid] = tree_group
+            treesElementOrder.append(tgid)
+            self._recursive_convert_dict(tree_group, skip_keys=('tree',))
+            treeById = {}
+            treeElementOrder = []
+            for tree in self._as_list(tree_group, 'tree'):
+                t_t = self.convert_tree(tree)
+                if t_t is None:
+                    continue
+                tid = t_t[0]
+                if tid in tree_id_set:
+                    raise NexsonError('Repeated tree element id "{}"'.format(tid))
+                tree_id_set.add(tid)
+                treeById[tid] = tree
+                treeElementOrder.append(tid)
+            tree_group['treeById'] = treeById
+            tree_group['^ot:treeElementOrder'] = treeElementOrder
+        nex['otusById'] = otusById
+        nex['^ot:otusElementOrder'] = otusElementOrder
+        nex['treesById'] = treesById
+        nex['^ot:treesElementOrder'] = treesElementOrder
+        nex['@nexml2json'] = str(BY_ID_HONEY_BADGERFISH)
+        if self.remove_old_structs:
+            del nex['otus']
+            del nex['trees']
+            for v in treesById.values():
+                if 'tree' in v:
+                    del v['tree']
+                del v['@id']
+        return obj
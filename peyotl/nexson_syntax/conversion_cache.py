@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""Cache of the results of PhyloSchema.convert for studies stored in git.
+
+A result is keyed by the git blob SHA of the study file and by PhyloSchema.cache_key
+(the content, content ID and output format of the schema), so an entry never becomes
+stale: a new version of a study has a new blob SHA. Results are held as the serialized
+text (NexSON is stored as the JSON text that PhyloSchema.serialize returns) in an LRU
+dict that is limited by the total size of the texts (in utf-8) and, optionally, in files under
+`cache_dir` (so that they are shared between processes and survive restarts).
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.str_util import UNICODE
+from peyotl.utility import get_logger
+from collections import OrderedDict
+import threading
+import hashlib
+import os
+
+_LOG = get_logger(__name__)
+
+_DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+_BYTES_TAG, _TEXT_TAG = b'b', b'u'
+
+
+def _nbytes(value):
+    """Size of `value` in bytes (unicode text is counted as utf-8)."""
+    if isinstance(value, UNICODE):
+        return len(value.encode('utf-8'))
+    return len(value)
+
+
+class ConversionCache(object):
+    """Holds at most `max_bytes` (default 64 MB) of results in memory, evicting the least
+    recently used ones. If `cache_dir` is not None, every result is also written to a
+    file in that directory, and a result that is not in memory is read from there.
+    `hits` (of which `disk_hits` were read from `cache_dir`) and `misses` count lookups.
+    """
+
+    def __init__(self, max_bytes=_DEFAULT_MAX_BYTES, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'entries': len(self._entries),
+                    'nbytes': self.nbytes}
+
+    def filepath(self, blob_sha, schema_key):
+        """Path of the file for the result in `cache_dir`."""
+        digest = hashlib.sha1(u'{}\n{}'.format(blob_sha, schema_key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def get(self, blob_sha, schema_key):
+        """Returns the cached result of the conversion of the study with git blob SHA
+        `blob_sha` by a PhyloSchema with the `schema_key` cache_key, or None."""
+        key = (blob_sha, schema_key)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry  # most recently used
+                self.hits += 1
+                return entry[0]
+        value = self._read_file(blob_sha, schema_key) if self.cache_dir is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._add(key, value)
+        return value
+
+    def put(self, blob_sha, schema_key, value):
+        """Caches the result `value` (a byte or unicode string), see get."""
+        with self._lock:
+            self._add((blob_sha, schema_key), value)
+        if self.cache_dir is not None:
+            self._write_file(blob_sha, schema_key, value)
+
+    def clear(self):
+        """Empties the in-memory cache (the files in `cache_dir` are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _add(self, key, value):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted[1]
+
+    def _read_file(self, blob_sha, schema_key):
+        fp = self.filepath(blob_sha, schema_key)
+        if not os.path.exists(fp):
+            return None
+        try:
+            with open(fp, 'rb') as fo:
+                content = fo.read()
+        except Exception:
+            _LOG.exception('Ignoring unreadable conversion cache file "{}"'.format(fp))
+            return None
+        tag, value = content[:1], content[1:]
+        if tag == _TEXT_TAG:
+            return value.decode('utf-8')
+        return value
+
+    def _write_file(self, blob_sha, schema_key, value):
+        fp = self.filepath(blob_sha, schema_key)
+        par = os.path.dirname(fp)
+        if not os.path.isdir(par):
+            try:
+                os.makedirs(par)
+            except OSError:  # created by another process
+                if not os.path.isdir(par):
+                    raise
+        if isinstance(value, UNICODE):
+            content = _TEXT_TAG + value.encode('utf-8')
+        else:
+            content = _BYTES_TAG + value
+        tmp_fp = '{}.{}.tmp'.format(fp, os.getpid())
+        with open(tmp_fp, 'wb') as fo:
+            fo.write(content)
+        os.rename(tmp_fp, fp)
@@ -14,6 +14,9 @@ class Direct2BadgerfishNexson(NexsonConverter):
     """Conversion of the direct form of honeybadgerfish
     HoneyBadgerFish (v 1.0) to "raw" Badgerfish + phylografter tweaks
     This is a dict-to-dict in-place conversion. No serialization is included.
+    The element dicts are reused, as are the values of ^-prefixed keys that are
+    dicts (they become the meta elements). A dict is only created for each meta
+    with a plain (string, number or boolean) value.
     """
 
     def __init__(self, conv_cfg):
@@ -25,7 +28,9 @@ class Direct2BadgerfishNexson(NexsonConverter):
             if isinstance(el, dict):
                 self._recursive_convert_dict(el)
 
-    def _recursive_convert_dict(self, obj):
+    def _recursive_convert_dict(self, obj, skip_keys=()):
+        """Converts the ^-prefixed keys of `obj` and of the values of `obj` (other than those
+        of the keys in `skip_keys`, which the caller converts) to meta elements."""
         _add_redundant_about(obj)  # rule 10...
         meta_list = []
         to_del = set()
@@ -37,6 +42,8 @@ class Direct2BadgerfishNexson(NexsonConverter):
                     meta_list.extend(converted)
                 else:
                     meta_list.append(converted)
+            elif k in skip_keys:
+                continue
             if isinstance(v, dict):
                 self._recursive_convert_dict(v)
             elif isinstance(v, list):
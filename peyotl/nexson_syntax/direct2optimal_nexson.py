@@ -15,6 +15,10 @@ class Direct2OptimalNexson(NexsonConverter):
     """Conversion of the direct port of NeXML to JSON (v 1.0)
     to the more optimized version (v 1.2).
     This is a dict-to-dict in-place conversion. No serialization is included.
+    The dicts of the otus, otu, trees, tree, node and edge elements are reused (only
+    their @id keys are moved to the ...ById dicts), so the new objects are just the
+    ...ById dicts and the element order lists. Unless remove_old_structs is False,
+    the lists of the v 1.0 form are dropped.
     """
 
     def __init__(self, conv_cfg):
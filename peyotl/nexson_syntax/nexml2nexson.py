@@ -6,12 +6,12 @@ from peyotl.nexson_syntax.helper import (NexsonConverter,
                                          _coerce_literal_val_to_primitive,
                                          _cull_redundant_about,
                                          _get_index_list_of_values,
-                                         _index_list_of_values,
                                          _is_badgerfish_version,
                                          _LITERAL_META_PAT,
                                          _RESOURCE_META_PAT)
 
 from peyotl.utility import get_logger, is_str_type
+from xml.parsers import expat
 import xml.dom.minidom
 
 _LOG = get_logger(__name__)
@@ -75,10 +75,23 @@ def _extract_text_and_child_element_list(minidom_node):
     return text_content, ntl
 
 
+def _attribute_dict(minidom_node):
+    att_container = minidom_node.attributes
+    if att_container is None:
+        return {}
+    return dict((a.name, a.value) for a in (att_container.item(i) for i in range(att_container.length)))
+
+
 class Nexml2Nexson(NexsonConverter):
     """Conversion of the optimized (v 1.2) version of NexSON to
     the more direct (v 1.0) port of NeXML
-    This is a dict-to-minidom-doc conversion. No serialization is included.
+    This is a minidom-doc-to-dict conversion (convert), or a conversion of the
+    bytes of a NeXML document as they are parsed (convert_stream).
+
+    Each element is converted bottom-up from its attributes, its text and the
+    "records" of its child nodes: a (key, value, is_meta) triple that is either
+    (tag, honeybadgerfish dict, False) or the (key, value, True) pair that a
+    meta element is transformed to (key is None for a meta that is dropped).
     """
 
     def __init__(self, conv_cfg):
@@ -88,6 +101,18 @@ class Nexml2Nexson(NexsonConverter):
 
     def convert(self, doc_root):
         key, val = self._gen_hbf_el(doc_root)
+        return self._finish_conversion(key, val)
+
+    def convert_stream(self, byte_chunks):
+        """Returns the same object as convert for the NeXML document whose bytes are the
+        concatenation of `byte_chunks` (e.g. blocks read from a file). No DOM is built:
+        the output dicts are created as the end tag of each element is parsed, and the
+        "characters" elements (which are discarded by convert) are skipped by the parser.
+        """
+        handler = _NexmlEventHandler(self)
+        return self._finish_conversion(*handler.parse(byte_chunks))
+
+    def _finish_conversion(self, key, val):
         val['@nexml2json'] = self.output_format
         o = {key: val}
         try:
@@ -127,115 +152,101 @@ class Nexml2Nexson(NexsonConverter):
     def _gen_hbf_el(self, x):
         """
         Builds a dictionary from the DOM element x
-        The function
-        Uses as hacky splitting of attribute or tag names using {}
-            to remove namespaces.
         returns a pair of: the tag of `x` and the honeybadgerfish
             representation of the subelements of x
-        Indirect recursion through _hbf_handle_child_elements
+        Indirect recursion through _dom_child_record
         """
-        obj = {}
-        # grab the tag of x
         el_name = x.nodeName
         assert el_name is not None
-        # add the attributes to the dictionary
-        att_container = x.attributes
-        ns_obj = {}
-        if att_container is not None:
-            for i in range(att_container.length):
-                attr = att_container.item(i)
-                n = attr.name
-                t = None
-                if n.startswith('xmlns'):
-                    if n == 'xmlns':
-                        t = '$'
-                    elif n.startswith('xmlns:'):
-                        t = n[6:]  # strip off the xmlns:
-                if t is None:
-                    obj['@' + n] = attr.value
-                else:
-                    ns_obj[t] = attr.value
-        if ns_obj:
-            obj['@xmlns'] = ns_obj
+        text_content, records = self._dom_content(x)
+        return el_name, self._hbf_obj(_attribute_dict(x), text_content, records)
 
+    def _dom_child_record(self, child):
+        return self._element_record(child.nodeName, _attribute_dict(child), *self._dom_content(child))
+
+    def _dom_content(self, x):
         x.normalize()
-        # store the text content of the element under the key '$'
         text_content, ntl = _extract_text_and_child_element_list(x)
+        return text_content, [self._dom_child_record(c) for c in ntl]
+
+    def _element_record(self, el_name, attributes, text_content, records):
+        """Returns the record (see the class docstring) for a child element."""
+        if el_name == 'meta' and (not self._badgerfish_style_conversion):
+            matk, matv = self._transform_meta_key_value(attributes, text_content, records)
+            return matk, matv, True
+        return el_name, self._hbf_obj(attributes, text_content, records), False
+
+    def _hbf_obj(self, attributes, text_content, records):
+        """Returns the honeybadgerfish dict for an element. The attributes (other than
+        namespace declarations, which go in '@xmlns') are stored with an '@' prefix and
+        the text content of the element under the key '$'."""
+        obj = {}
+        ns_obj = {}
+        for n, v in attributes.items():
+            t = None
+            if n.startswith('xmlns'):
+                if n == 'xmlns':
+                    t = '$'
+                elif n.startswith('xmlns:'):
+                    t = n[6:]  # strip off the xmlns:
+            if t is None:
+                obj['@' + n] = v
+            else:
+                ns_obj[t] = v
+        if ns_obj:
+            obj['@xmlns'] = ns_obj
         if text_content:
             obj['$'] = text_content
-        self._hbf_handle_child_elements(obj, ntl)
-        return el_name, obj
+        return self._add_child_records(obj, records)
 
-    def _hbf_handle_child_elements(self, obj, ntl):
-        """
-        Indirect recursion through _gen_hbf_el
-        """
-        # accumulate a list of the children names in ko, and
-        #   the a dictionary of tag to xml elements.
-        # repetition of a tag means that it will map to a list of
-        #   xml elements
+    def _add_child_records(self, obj, records):
+        # transformed meta elements are added to obj directly, other children are
+        #   grouped by tag (in order of first appearance). The value for each tag is
+        #   the list of the dicts of the child elements with that tag.
         cd = {}
         ko = []
-        ks = set()
-        for child in ntl:
-            k = child.nodeName
-            if k == 'meta' and (not self._badgerfish_style_conversion):
-                matk, matv = self._transform_meta_key_value(child)
-                if matk is not None:
-                    _add_value_to_dict_bf(obj, matk, matv)
+        for k, v, is_meta in records:
+            if is_meta:
+                if k is not None:
+                    _add_value_to_dict_bf(obj, k, v)
             else:
-                if k not in ks:
+                dcl = cd.get(k)
+                if dcl is None:
                     ko.append(k)
-                    ks.add(k)
-                _add_value_to_dict_bf(cd, k, child)
-
-        # Converts the child XML elements to dicts by recursion and
-        #   adds these to the dict.
+                    dcl = []
+                    cd[k] = dcl
+                dcl.append(v)
         for k in ko:
-            v = _index_list_of_values(cd, k)
-            dcl = []
-            ct = None
-            for xc in v:
-                ct, dc = self._gen_hbf_el(xc)
-                dcl.append(dc)
             # this assertion will trip is the hacky stripping of namespaces
             #   results in a name clash among the tags of the children
-            assert ct not in obj
-            obj[ct] = dcl
-
+            assert k not in obj
+            obj[k] = cd[k]
         # delete redundant about attributes that are used in XML, but not JSON (last rule of HoneyBadgerFish)
         _cull_redundant_about(obj)
         return obj
 
-    def _literal_transform_meta_key_value(self, minidom_meta_element):
-        att_key = None
-        dt = minidom_meta_element.getAttribute('datatype') or 'xsd:string'
-        att_str_val = minidom_meta_element.getAttribute('content')
-        att_key = minidom_meta_element.getAttribute('property')
+    def _literal_transform_meta_key_value(self, attributes, text_content, records):
+        dt = attributes.get('datatype') or 'xsd:string'
+        att_str_val = attributes.get('content', '')
+        att_key = attributes.get('property', '')
         full_obj = {}
-        if att_key is None:
-            _LOG.debug('"property" missing from literal meta')
-            return None, None
-        att_container = minidom_meta_element.attributes
-        for i in range(att_container.length):
-            attr = att_container.item(i)
-            handling_code, new_name = _literal_meta_att_decision_fn(attr.name)
+        for name, value in attributes.items():
+            handling_code, new_name = _literal_meta_att_decision_fn(name)
             if handling_code == ATT_TRANSFORM_CODE.IN_FULL_OBJECT:
-                full_obj[new_name] = attr.value
+                full_obj[new_name] = value
             else:
                 if handling_code == ATT_TRANSFORM_CODE.IN_XMLNS_OBJ:
-                    full_obj.setdefault('@xmlns', {})[new_name] = attr.value
+                    full_obj.setdefault('@xmlns', {})[new_name] = value
                 else:
                     assert handling_code == ATT_TRANSFORM_CODE.HANDLED
 
         if not att_str_val:
-            att_str_val, ntl = _extract_text_and_child_element_list(minidom_meta_element)
-            att_str_val = att_str_val.strip()
-            if len(ntl) > 1:
+            att_str_val = text_content.strip()
+            if len(records) > 1:
                 _LOG.debug('Nested meta elements are not legal for LiteralMeta (offending property="%s")', att_key)
                 return None, None
-            if len(ntl) == 1:
-                self._hbf_handle_child_elements(full_obj, ntl)
+            if len(records) == 1:
+                self._add_child_records(full_obj, records)
         att_key = '^' + att_key
         trans_val = _coerce_literal_val_to_primitive(dt, att_str_val)
         if trans_val is None:
@@ -247,50 +258,139 @@ class Nexml2Nexson(NexsonConverter):
             return att_key, full_obj
         return att_key, trans_val
 
-    def _resource_transform_meta_key_value(self, minidom_meta_element):
-        rel = minidom_meta_element.getAttribute('rel')
-        if rel is None:
-            _LOG.debug('"rel" missing from ResourceMeta')
-            return None, None
+    def _resource_transform_meta_key_value(self, attributes, text_content, records):
+        rel = attributes.get('rel', '')
         full_obj = {}
-        att_container = minidom_meta_element.attributes
-        for i in range(att_container.length):
-            attr = att_container.item(i)
-            handling_code, new_name = _resource_meta_att_decision_fn(attr.name)
+        for name, value in attributes.items():
+            handling_code, new_name = _resource_meta_att_decision_fn(name)
             if handling_code == ATT_TRANSFORM_CODE.IN_FULL_OBJECT:
-                full_obj[new_name] = attr.value
+                full_obj[new_name] = value
             else:
                 if handling_code == ATT_TRANSFORM_CODE.IN_XMLNS_OBJ:
-                    full_obj.setdefault('@xmlns', {})[new_name] = attr.value
+                    full_obj.setdefault('@xmlns', {})[new_name] = value
                 else:
                     assert handling_code == ATT_TRANSFORM_CODE.HANDLED
         rel = '^' + rel
-        att_str_val, ntl = _extract_text_and_child_element_list(minidom_meta_element)
-        if att_str_val:
+        if text_content:
             _LOG.debug('text content of ResourceMeta of rel="%s"', rel)
             return None, None
-        if ntl:
-            self._hbf_handle_child_elements(full_obj, ntl)
+        if records:
+            self._add_child_records(full_obj, records)
         if not full_obj:
             _LOG.debug('ResourceMeta of rel="%s" without condents ("href" attribute or nested meta)', rel)
             return None, None
         _cull_redundant_about(full_obj)
         return rel, full_obj
 
-    def _transform_meta_key_value(self, minidom_meta_element):
-        """Checks if the minidom_meta_element can be represented as a
-            key/value pair in a object.
+    def _transform_meta_key_value(self, attributes, text_content, records):
+        """Checks if the meta element (given as its attributes dict, text and
+            child records) can be represented as a key/value pair in a object.
 
         Returns (key, value) ready for JSON serialization, OR
                 `None, None` if the element can not be treated as simple pair.
         If `None` is returned, then more literal translation of the
             object may be required.
         """
-        xt = minidom_meta_element.getAttribute('xsi:type')
+        xt = attributes.get('xsi:type', '')
         if _LITERAL_META_PAT.match(xt):
-            return self._literal_transform_meta_key_value(minidom_meta_element)
+            return self._literal_transform_meta_key_value(attributes, text_content, records)
         elif _RESOURCE_META_PAT.match(xt):
-            return self._resource_transform_meta_key_value(minidom_meta_element)
+            return self._resource_transform_meta_key_value(attributes, text_content, records)
         else:
             _LOG.debug('xsi:type attribute "%s" not LiteralMeta or ResourceMeta', xt)
             return None, None
+
+
+_NEXML_ROOT_TAGS = frozenset(['nexml', 'nex:nexml'])
+
+
+class _NexmlEventHandler(object):
+    """expat callbacks for Nexml2Nexson.convert_stream. Only the open elements are held:
+    [tag, attributes, text, current text run, child records] for each. The text runs
+    between child nodes are stripped and concatenated, as the DOM conversion does.
+    Comments, CDATA sections and processing instructions are child nodes with an empty
+    dict (as they are in the DOM conversion).
+    """
+
+    def __init__(self, converter):
+        self._converter = converter
+        self._stack = []
+        self._skip_depth = 0
+        self._in_cdata = False
+        self._root = None
+
+    def parse(self, byte_chunks):
+        """Returns (tag, dict) for the root element."""
+        p = expat.ParserCreate()
+        p.buffer_text = True
+        p.StartElementHandler = self._start
+        p.EndElementHandler = self._end
+        p.CharacterDataHandler = self._chars
+        p.CommentHandler = self._comment
+        p.StartCdataSectionHandler = self._start_cdata
+        p.EndCdataSectionHandler = self._end_cdata
+        p.ProcessingInstructionHandler = self._pi
+        for chunk in byte_chunks:
+            p.Parse(chunk, False)
+        p.Parse(b'', True)
+        return self._root
+
+    @staticmethod
+    def _flush(frame):
+        if frame[3]:
+            frame[2].append(''.join(frame[3]).strip())
+            frame[3] = []
+
+    def _add_node_record(self, tag):
+        if self._skip_depth or not self._stack:
+            return
+        top = self._stack[-1]
+        self._flush(top)
+        top[4].append(self._converter._element_record(tag, {}, '', []))
+
+    def _start(self, name, attributes):
+        if self._skip_depth:
+            self._skip_depth += 1
+            return
+        stack = self._stack
+        if stack:
+            self._flush(stack[-1])
+            # the characters blocks are discarded, so they are not converted
+            if name == 'characters' and len(stack) == 1 and stack[0][0] in _NEXML_ROOT_TAGS:
+                self._skip_depth = 1
+                return
+        stack.append([name, attributes, [], [], []])
+
+    def _end(self, name):
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        frame = self._stack.pop()
+        self._flush(frame)
+        text_content = ''.join(frame[2])
+        if self._stack:
+            self._stack[-1][4].append(self._converter._element_record(name, frame[1], text_content, frame[4]))
+        else:
+            self._root = name, self._converter._hbf_obj(frame[1], text_content, frame[4])
+
+    def _chars(self, data):
+        if self._skip_depth or self._in_cdata or not self._stack:
+            return
+        self._stack[-1][3].append(data)
+
+    def _comment(self, data):
+        self._add_node_record('#comment')
+
+    def _start_cdata(self):
+        if self._skip_depth or not self._stack:
+            return
+        self._flush(self._stack[-1])
+        self._in_cdata = True
+
+    def _end_cdata(self):
+        if self._in_cdata:
+            self._in_cdata = False
+            self._add_node_record('#cdata-section')
+
+    def _pi(self, target, data):
+        self._add_node_record(target)
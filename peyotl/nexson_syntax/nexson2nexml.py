@@ -8,10 +8,49 @@ from peyotl.nexson_syntax.helper import (NexsonConverter,
 from peyotl.utility.str_util import UNICODE
 from peyotl.utility import get_logger
 import xml.dom.minidom
+import sys
 
 _LOG = get_logger(__name__)
 
 
+def _xml_attribute_items(attrib):
+    """Returns the list of (name, value) attributes for an element with the `attrib` dict
+    (see _create_sub_el) in the order in which they are set."""
+    items = []
+    if attrib:
+        index = {}
+
+        def _set(k, v):
+            i = index.get(k)
+            if i is None:
+                index[k] = len(items)
+                items.append((k, v))
+            else:
+                items[i] = (k, v)
+
+        if ('id' in attrib) and ('about' not in attrib):
+            _set('about', '#' + attrib['id'])
+        for att_key, att_value in attrib.items():
+            if isinstance(att_value, dict):
+                for inner_key, inner_val in att_value.items():
+                    _set(':'.join([att_key, inner_key]), inner_val)
+            else:
+                _set(att_key, att_value)
+    return items
+
+
+def _xml_text(data):
+    """Returns the text content for the `data` of an element (see _create_sub_el) or None"""
+    if data is None:
+        return None
+    if data is True:
+        return 'true'
+    if data is False:
+        return 'false'
+    u = UNICODE(data).strip()
+    return u if u else None
+
+
 def _create_sub_el(doc, parent, tag, attrib, data=None):
     """Creates and xml element for the `doc` with the given `parent`
     and `tag` as the tagName.
@@ -25,31 +64,97 @@ def _create_sub_el(doc, parent, tag, attrib, data=None):
     Returns the element created
     """
     el = doc.createElement(tag)
-    if attrib:
-        if ('id' in attrib) and ('about' not in attrib):
-            about_val = '#' + attrib['id']
-            el.setAttribute('about', about_val)
-        for att_key, att_value in attrib.items():
-            if isinstance(att_value, dict):
-                for inner_key, inner_val in att_value.items():
-                    rk = ':'.join([att_key, inner_key])
-                    el.setAttribute(rk, inner_val)
-            else:
-                el.setAttribute(att_key, att_value)
+    for att_key, att_value in _xml_attribute_items(attrib):
+        el.setAttribute(att_key, att_value)
     if parent:
         parent.appendChild(el)
-    if data is not None:
-        if data is True:
-            el.appendChild(doc.createTextNode('true'))
-        elif data is False:
-            el.appendChild(doc.createTextNode('false'))
-        else:
-            u = UNICODE(data).strip()
-            if u:
-                el.appendChild(doc.createTextNode(u))
+    text = _xml_text(data)
+    if text is not None:
+        el.appendChild(doc.createTextNode(text))
     return el
 
 
+class _MinidomBuilder(object):
+    """Builds the elements written by Nexson2Nexml as a minidom Document (self.doc)"""
+
+    def __init__(self):
+        self.doc = xml.dom.minidom.Document()
+
+    def sub_el(self, parent, tag, attrib, data=None):
+        return _create_sub_el(self.doc, self.doc if parent is None else parent, tag, attrib, data)
+
+    def end_el(self, el):
+        pass
+
+
+# minidom writes the attributes of an element sorted by name before python 3.8 (in the
+#   order in which they were set from 3.8 on). _NexmlStreamWriter follows the same rule,
+#   so that its output is the same as writing the minidom Document.
+_SORT_ATTRIBUTES = sys.version_info < (3, 8)
+
+
+def _escape_xml(data):
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+class _OpenElement(object):
+    __slots__ = ('tagName', 'indent', 'text', 'has_children')
+
+    def __init__(self, tag, indent, text):
+        self.tagName = tag
+        self.indent = indent
+        self.text = text
+        self.has_children = False
+
+
+class _NexmlStreamWriter(object):
+    """Writes the elements created by Nexson2Nexml to the stream `out` as they are created,
+    in the format of minidom's Document.writexml (with the same `addindent` and `newl`).
+    The start tag of an element is written when the element is created; whether it is
+    closed with "/>", or its text goes on the same line as the end tag, is decided when the
+    first child element is created or the element is ended.
+    """
+
+    def __init__(self, out, addindent='', newl=''):
+        self._out = out
+        self._addindent = addindent
+        self._newl = newl
+        out.write('<?xml version="1.0" encoding="utf-8"?>' + newl)
+
+    def _open_for_child(self, parent):
+        if parent.has_children:
+            return
+        parent.has_children = True
+        out = self._out
+        out.write('>' + self._newl)
+        if parent.text is not None:
+            out.write(_escape_xml(parent.indent + self._addindent + parent.text + self._newl))
+
+    def sub_el(self, parent, tag, attrib, data=None):
+        if parent is None:
+            indent = ''
+        else:
+            self._open_for_child(parent)
+            indent = parent.indent + self._addindent
+        atts = _xml_attribute_items(attrib)
+        if _SORT_ATTRIBUTES:
+            atts.sort()
+        out = self._out
+        out.write(indent + '<' + tag)
+        for k, v in atts:
+            out.write(' ' + k + '="' + _escape_xml(v) + '"')
+        return _OpenElement(tag, indent, _xml_text(data))
+
+    def end_el(self, el):
+        out = self._out
+        if el.has_children:
+            out.write(el.indent + '</' + el.tagName + '>' + self._newl)
+        elif el.text is not None:
+            out.write('>' + _escape_xml(el.text) + '</' + el.tagName + '>' + self._newl)
+        else:
+            out.write('/>' + self._newl)
+
+
 def _convert_bf_meta_val_for_xml(blob):
     if not isinstance(blob, list):
         blob = [blob]
@@ -68,7 +173,11 @@ def _convert_bf_meta_val_for_xml(blob):
 class Nexson2Nexml(NexsonConverter):
     """Conversion of the optimized (v 1.2) version of NexSON to
     the more direct (v 1.0) port of NeXML
-    This is a dict-to-minidom-doc conversion. No serialization is included.
+    This is a dict-to-minidom-doc conversion (convert), or a conversion that writes
+    the NeXML to a stream as the dict is traversed (write).
+    The elements are created through a "builder" (_MinidomBuilder or _NexmlStreamWriter)
+    with sub_el(parent, tag, attrib, data) and end_el(el) (called after the children of
+    the element have been created).
     """
 
     def __init__(self, conv_cfg):
@@ -85,18 +194,29 @@ class Nexson2Nexml(NexsonConverter):
         self._creating_otu_label = True
 
     def convert(self, blob):
-        doc = xml.dom.minidom.Document()
+        builder = _MinidomBuilder()
+        self._build(builder, blob)
+        return builder.doc
+
+    def write(self, blob, out, addindent='', newl=''):
+        """Writes the NeXML for `blob` to the stream `out`. The output is the same as writing
+        the Document returned by convert with writexml (encoding='utf-8'), but each
+        element is written as soon as it is created, so no Document is held in memory.
+        """
+        self._build(_NexmlStreamWriter(out, addindent=addindent, newl=newl), blob)
+
+    def _build(self, builder, blob):
         converted_root_el = False
         if 'nexml' in blob:
             converted_root_el = True
             blob['nex:nexml'] = blob['nexml']
             del blob['nexml']
-        self._top_level_build_xml(doc, blob)
-        if converted_root_el:
-            blob['nexml'] = blob['nex:nexml']
-            del blob['nex:nexml']
-
-        return doc
+        try:
+            self._top_level_build_xml(builder, blob)
+        finally:
+            if converted_root_el:
+                blob['nexml'] = blob['nex:nexml']
+                del blob['nex:nexml']
 
     def _partition_keys_for_xml(self, o):
         """Breaks o into four content type by key syntax:
@@ -136,7 +256,7 @@ class Nexson2Nexml(NexsonConverter):
                 ck[k] = v
         return ak, tk, ck, mc
 
-    def _top_level_build_xml(self, doc, obj_dict):
+    def _top_level_build_xml(self, builder, obj_dict):
         if self.use_default_root_atts:
             root_atts = {
                 "xmlns:nex": "http://www.nexml.org/2009",
@@ -172,8 +292,8 @@ class Nexson2Nexml(NexsonConverter):
             atts['about'] = '#' + atts['id']
         if 'nexml2json' in atts:
             del atts['nexml2json']
-        r = _create_sub_el(doc, doc, root_name, atts, data)
-        self._add_meta_dict_to_xml(doc, r, meta_children)
+        r = builder.sub_el(None, root_name, atts, data)
+        self._add_meta_dict_to_xml(builder, r, meta_children)
         nexml_key_order = (('meta', None),
                            ('otus', (('meta', None),
                                      ('otu', None)
@@ -203,12 +323,13 @@ class Nexson2Nexml(NexsonConverter):
                                       )
                             )
                            )
-        self._add_dict_of_subtree_to_xml_doc(doc, r, children, nexml_key_order)
+        self._add_dict_of_subtree_to_xml_doc(builder, r, children, nexml_key_order)
+        builder.end_el(r)
 
-    def _add_subtree_list_to_xml_doc(self, doc, par, ch_list, key, key_order):
+    def _add_subtree_list_to_xml_doc(self, builder, par, ch_list, key, key_order):
         for child in ch_list:
             if isinstance(child, dict):
-                self._add_subtree_to_xml_doc(doc, par, child, key, key_order)
+                self._add_subtree_to_xml_doc(builder, par, child, key, key_order)
             else:
                 ca = {}
                 cc = {}
@@ -216,20 +337,22 @@ class Nexson2Nexml(NexsonConverter):
                 if isinstance(child, list) or isinstance(child, tuple) or isinstance(child, set):
                     for sc in child:
                         if isinstance(sc, dict):
-                            self._add_subtree_to_xml_doc(doc, par, sc, key, key_order)
+                            self._add_subtree_to_xml_doc(builder, par, sc, key, key_order)
                         else:
                             cd = sc
-                            cel = _create_sub_el(doc, par, key, ca, cd)
-                            self._add_meta_dict_to_xml(doc, cel, mc)
-                            self._add_dict_of_subtree_to_xml_doc(doc, cel, cc, key_order=None)
+                            cel = builder.sub_el(par, key, ca, cd)
+                            self._add_meta_dict_to_xml(builder, cel, mc)
+                            self._add_dict_of_subtree_to_xml_doc(builder, cel, cc, key_order=None)
+                            builder.end_el(cel)
                 else:
                     cd = child
-                    cel = _create_sub_el(doc, par, key, ca, cd)
-                    self._add_meta_dict_to_xml(doc, cel, mc)
-                    self._add_dict_of_subtree_to_xml_doc(doc, cel, cc, key_order=None)
+                    cel = builder.sub_el(par, key, ca, cd)
+                    self._add_meta_dict_to_xml(builder, cel, mc)
+                    self._add_dict_of_subtree_to_xml_doc(builder, cel, cc, key_order=None)
+                    builder.end_el(cel)
 
     def _add_dict_of_subtree_to_xml_doc(self,
-                                        doc,
+                                        builder,
                                         parent,
                                         children_dict,
                                         key_order=None):
@@ -241,16 +364,16 @@ class Nexson2Nexml(NexsonConverter):
                 if k in children_dict:
                     chl = _index_list_of_values(children_dict, k)
                     written.add(k)
-                    self._add_subtree_list_to_xml_doc(doc, parent, chl, k, nko)
+                    self._add_subtree_list_to_xml_doc(builder, parent, chl, k, nko)
         ksl = list(children_dict.keys())
         ksl.sort()
         for k in ksl:
             chl = _index_list_of_values(children_dict, k)
             if k not in written:
-                self._add_subtree_list_to_xml_doc(doc, parent, chl, k, None)
+                self._add_subtree_list_to_xml_doc(builder, parent, chl, k, None)
 
     def _add_subtree_to_xml_doc(self,
-                                doc,
+                                builder,
                                 parent,
                                 subtree,
                                 key,
@@ -277,12 +400,13 @@ class Nexson2Nexml(NexsonConverter):
                 ca['label'] = str(val)
             elif key_to_promote in ca:
                 ca['label'] = str(ca[key_to_promote])
-        cel = _create_sub_el(doc, parent, key, ca, cd)
-        self._add_meta_dict_to_xml(doc, cel, mc)
-        self._add_dict_of_subtree_to_xml_doc(doc, cel, cc, key_order)
+        cel = builder.sub_el(parent, key, ca, cd)
+        self._add_meta_dict_to_xml(builder, cel, mc)
+        self._add_dict_of_subtree_to_xml_doc(builder, cel, cc, key_order)
+        builder.end_el(cel)
         return cel
 
-    def _add_meta_dict_to_xml(self, doc, parent, meta_dict):
+    def _add_meta_dict_to_xml(self, builder, parent, meta_dict):
         """
         Values in the meta element dict are converted to a BadgerFish-style
             encoding (see _convert_hbf_meta_val_for_xml), so regardless of input_format,
@@ -295,14 +419,14 @@ class Nexson2Nexml(NexsonConverter):
         for key in key_list:
             el_list = _index_list_of_values(meta_dict, key)
             for el in el_list:
-                self._add_meta_value_to_xml_doc(doc, parent, el)
+                self._add_meta_value_to_xml_doc(builder, parent, el)
 
-    def _add_meta_value_to_xml_doc(self, doc, parent, obj):
+    def _add_meta_value_to_xml_doc(self, builder, parent, obj):
         """Values in the meta element dict are converted to a BadgerFish-style
             encoding (see _convert_hbf_meta_val_for_xml), so regardless of input_format,
             we treat them as if they were BadgerFish.
         """
-        return self._add_subtree_to_xml_doc(doc,
+        return self._add_subtree_to_xml_doc(builder,
                                             parent,
                                             subtree=obj,
                                             key='meta',
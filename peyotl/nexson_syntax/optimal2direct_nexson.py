@@ -13,6 +13,9 @@ class Optimal2DirectNexson(NexsonConverter):
     """Conversion of the optimized (v 1.2) version of NexSON to
     the more direct (v 1.0) port of NeXML
     This is a dict-to-dict in-place conversion. No serialization is included.
+    The dicts of the otus, otu, trees, tree, node and edge elements are reused (the
+    @id keys are moved back into them), so the new objects are just the lists of the
+    v 1.0 form. Unless remove_old_structs is False, the ...ById dicts are dropped.
     """
 
     def __init__(self, conv_cfg):
@@ -2,12 +2,22 @@
 from __future__ import absolute_import, print_function, division
 from peyotl.phylo.entities import OTULabelStyleEnum
 from peyotl.nexson_syntax import quote_newick_name
-from peyotl.phylo.tree import create_tree_from_id2par, create_anc_lineage_from_id2par
+from peyotl.phylo.tree import create_tree_from_id2par, TreeWithPathsInEdges
+from peyotl.ott.taxonomy_store import (OTTTaxonomyStore, NOT_PRUNED, PRUNE_FLAGGED, TAXONOMY_STORE_VERSION,
+                                       is_large_batch, write_taxonomy_store)
+from peyotl.ott.lca import OTTLCAIndex, LCA_INDEX_VERSION, write_lca_index
+from peyotl.ott.name_index import OTTNameIndex, NAME_INDEX_VERSION, write_name_index
+from peyotl.ott.taxonomy_parser import PhaseTimer, iter_synonym_rows, iter_taxonomy_rows
+from peyotl.utility.parallel import default_num_workers
+from peyotl.ott.table_registry import OTT_TABLE_REGISTRY, OTTTableRegistry
+from peyotl.ott.cache_update import OTTCachePatch, patch_preorder, PATCHABLE_TABLES, PREORDER_TABLES
+from peyotl.utility.input_output import write_as_json
 from peyotl.utility.str_util import is_str_type
 from peyotl.utility import get_config_object, get_logger
 from collections import defaultdict
 import pickle
 import codecs
+import shutil
 import os
 
 _LOG = get_logger(__name__)
@@ -15,7 +25,7 @@ NONE_PAR = None
 
 _PICKLE_AS_JSON = False
 if _PICKLE_AS_JSON:
-    from peyotl.utility.input_output import read_as_json, write_as_json
+    from peyotl.utility.input_output import read_as_json
 
 _TREEMACHINE_PRUNE_FLAGS = {'major_rank_conflict', 'major_rank_conflict_direct', 'major_rank_conflict_inherited',
                             'environmental', 'unclassified_inherited', 'unclassified_direct', 'viral', 'nootu',
@@ -25,12 +35,70 @@ _TREEMACHINE_PRUNE_FLAGS = {'major_rank_conflict', 'major_rank_conflict_direct',
 
 class OTTFlagUnion(object):
     def __init__(self, ott, flag_set):
+        self.flags = frozenset(flag_set)
         self._flag_set_keys = ott.convert_flag_string_set_to_flag_set_keys(flag_set)
 
     def keys(self):
         return set(self._flag_set_keys)
 
 
+def _prune_flag_setup(ott, prune_flags):
+    """Returns (list of flags, OTTFlagUnion or None, dict of pruned flag set key -> sorted list
+    of the flags in `prune_flags` that it contains)."""
+    if prune_flags:
+        if isinstance(prune_flags, OTTFlagUnion):
+            flags_to_prune_list = list(prune_flags.flags)
+        else:
+            flags_to_prune_list = list(prune_flags)
+        to_prune_fsi_set = ott.convert_flag_string_set_to_union(flags_to_prune_list)
+    else:
+        flags_to_prune_list = []
+        to_prune_fsi_set = None
+    flags_to_prune_set = frozenset(flags_to_prune_list)
+    pfd = {}
+    if to_prune_fsi_set:
+        fsi_to_str_flag_set = {}
+        for k, v in dict(ott.flag_set_id_to_flag_set).items():
+            fsi_to_str_flag_set[k] = frozenset(list(v))
+        for f in to_prune_fsi_set.keys():
+            s = fsi_to_str_flag_set[f]
+            str_flag_intersection = flags_to_prune_set.intersection(s)
+            pfd[f] = list(str_flag_intersection)
+            pfd[f].sort()
+    return flags_to_prune_list, to_prune_fsi_set, pfd
+
+
+def _record_pruned(pruned_dict, fsi, ott_id):
+    fd = pruned_dict.get(fsi)
+    if fd is None:
+        pruned_dict[fsi] = {'anc_ott_id_pruned': [ott_id]}
+    else:
+        fd['anc_ott_id_pruned'].append(ott_id)
+
+
+def _finish_newick_log(log_dict, pruned_dict, pfd, num_nodes, num_tips, num_monotypic_nodes, num_pruned_anc_nodes):
+    log_dict['pruned'] = {}
+    for fsi, obj in pruned_dict.items():
+        f = pfd[fsi]
+        f.sort()
+        obj['flags_causing_prune'] = f
+        nk = ','.join(f)
+        log_dict['pruned'][nk] = obj
+    log_dict['num_tips'] = num_tips
+    log_dict['num_pruned_anc_nodes'] = num_pruned_anc_nodes
+    log_dict['num_nodes'] = num_nodes
+    log_dict['num_non_leaf_nodes'] = num_nodes - num_tips
+    log_dict['num_non_leaf_nodes_with_multiple_children'] = num_nodes - num_tips - num_monotypic_nodes
+    log_dict['num_monotypic_nodes'] = num_monotypic_nodes
+    return log_dict
+
+
+def _format_label(name, ott_id, label_style):
+    if label_style == OTULabelStyleEnum.CURRENT_LABEL_OTT_ID:
+        return u'{n}_ott{o:d}'.format(n=name, o=ott_id)
+    return name
+
+
 def write_newick_ott(out,
                      ott,
                      ott_id2children,
@@ -48,29 +116,10 @@ def write_newick_ott(out,
         about the pruning.
     """
     # create to_prune_fsi_set a set of flag set indices to prune...
-    if prune_flags:
-        flags_to_prune_list = list(prune_flags)
-        to_prune_fsi_set = ott.convert_flag_string_set_to_union(flags_to_prune_list)
-    else:
-        flags_to_prune_list = []
-        to_prune_fsi_set = None
-    flags_to_prune_set = frozenset(flags_to_prune_list)
-    pfd = {}
+    flags_to_prune_list, to_prune_fsi_set, pfd = _prune_flag_setup(ott, prune_flags)
     log_dict = None
     if create_log_dict:
         log_dict = {'version': ott.version, 'flags_to_prune': flags_to_prune_list}
-        fsi_to_str_flag_set = {}
-        for k, v in dict(ott.flag_set_id_to_flag_set).items():
-            fsi_to_str_flag_set[k] = frozenset(list(v))
-        if to_prune_fsi_set:
-            pfd = {}
-            for f in to_prune_fsi_set.keys():
-                s = fsi_to_str_flag_set[f]
-                str_flag_intersection = flags_to_prune_set.intersection(s)
-                pfd[f] = list(str_flag_intersection)
-                pfd[f].sort()
-        # log_dict['prune_flags_d'] = d
-        # log_dict['pfd'] = pfd
         pruned_dict = {}
     num_tips = 0
     num_pruned_anc_nodes = 0
@@ -98,12 +147,7 @@ def write_newick_ott(out,
                     for child_id in children:
                         if ott.has_flag_set_key_intersection(child_id, to_prune_fsi_set):
                             if log_dict is not None:
-                                fsi = ott.get_flag_set_key(child_id)
-                                fd = pruned_dict.get(fsi)
-                                if fd is None:
-                                    pruned_dict[fsi] = {'anc_ott_id_pruned': [child_id]}
-                                else:
-                                    fd['anc_ott_id_pruned'].append(child_id)
+                                _record_pruned(pruned_dict, ott.get_flag_set_key(child_id), child_id)
                             num_pruned_anc_nodes += 1
                         else:
                             c.append(child_id)
@@ -133,26 +177,105 @@ def write_newick_ott(out,
                 last_children.remove(ott_id)
         out.write(';')
     if create_log_dict:
-        log_dict['pruned'] = {}
-        for fsi, obj in pruned_dict.items():
-            f = pfd[fsi]
-            f.sort()
-            obj['flags_causing_prune'] = f
-            nk = ','.join(f)
-            log_dict['pruned'][nk] = obj
-        log_dict['num_tips'] = num_tips
-        log_dict['num_pruned_anc_nodes'] = num_pruned_anc_nodes
-        log_dict['num_nodes'] = num_nodes
-        log_dict['num_non_leaf_nodes'] = num_nodes - num_tips
-        log_dict['num_non_leaf_nodes_with_multiple_children'] = num_nodes - num_tips - num_monotypic_nodes
-        log_dict['num_monotypic_nodes'] = num_monotypic_nodes
+        _finish_newick_log(log_dict, pruned_dict, pfd, num_nodes, num_tips, num_monotypic_nodes,
+                           num_pruned_anc_nodes)
+    return log_dict
+
+
+def write_newick_ott_from_store(out,
+                                ott,
+                                root_ott_id,
+                                label_style,
+                                prune_flags,
+                                create_log_dict=False):
+    """Writes the same newick (and log dict) as write_newick_ott, but walks the preorder
+    arrays of `ott`.taxonomy_store instead of a dict of children. Pruned subtrees are
+    found with the (cached) prune mask of `prune_flags` and skipped without being visited.
+    """
+    flags_to_prune_list, to_prune_fsi_set, pfd = _prune_flag_setup(ott, prune_flags)
+    log_dict = None
+    pruned_dict = {}
+    if create_log_dict:
+        log_dict = {'version': ott.version, 'flags_to_prune': flags_to_prune_list}
+    store = ott.taxonomy_store
+    mask = ott.flag_prune_mask(to_prune_fsi_set) if to_prune_fsi_set else None
+    num_tips = 0
+    num_pruned_anc_nodes = 0
+    num_nodes = 0
+    num_monotypic_nodes = 0
+    root = store.preorder_interval(root_ott_id)[0]
+    if mask is not None and mask[root] == PRUNE_FLAGGED:
+        # entire taxonomy is pruned off
+        if log_dict is not None:
+            pruned_dict[ott.get_flag_set_key(root_ott_id)] = {'': [root_ott_id]}
+        num_pruned_anc_nodes += 1
+    else:
+        last_des = store.array('last_des')
+        ott_ids = store.array('ott_id')
+        flag_set_ids = store.array('flag_set_id')
+        buf = []
+
+        def _label(pn):
+            ott_id = ott_ids[pn]
+            return quote_newick_name(_format_label(store.name_at(pn), ott_id, label_style))
+
+        stack = []
+        curr = root
+        while True:
+            # entering `curr`
+            num_nodes += 1
+            children = []
+            pos, end = curr + 1, last_des[curr]
+            while pos <= end:
+                if mask is not None and mask[pos] == PRUNE_FLAGGED:
+                    if log_dict is not None:
+                        _record_pruned(pruned_dict, flag_set_ids[pos], ott_ids[pos])
+                    num_pruned_anc_nodes += 1
+                else:
+                    children.append(pos)
+                pos = last_des[pos] + 1
+            if mask is not None:
+                nc = len(children)
+                if nc == 1:
+                    num_monotypic_nodes += 1
+                elif nc == 0:
+                    num_tips += 1
+            if children:
+                buf.append('(')
+                stack.append([curr, children, 0])
+                curr = children[0]
+                continue
+            buf.append(_label(curr))
+            # exiting nodes until one has another child to visit
+            while stack:
+                top = stack[-1]
+                top[2] += 1
+                if top[2] < len(top[1]):
+                    buf.append(',')
+                    curr = top[1][top[2]]
+                    break
+                buf.append(')')
+                buf.append(_label(top[0]))
+                stack.pop()
+            if not stack:
+                break
+            if len(buf) > 4096:
+                out.write(''.join(buf))
+                buf = []
+        buf.append(';')
+        out.write(''.join(buf))
+    if create_log_dict:
+        _finish_newick_log(log_dict, pruned_dict, pfd, num_nodes, num_tips, num_monotypic_nodes,
+                           num_pruned_anc_nodes)
     return log_dict
 
 
 class _TransitionalNode(object):
+    __slots__ = ('par', 'ott_id', 'children', 'preorder_number')
+
     def __init__(self, ott_id=None, par=None):
         self.par = par
-        # self.ott_id = ott_id
+        self.ott_id = ott_id
         self.children = None
         self.preorder_number = None
         if par is not None:
@@ -164,45 +287,36 @@ class _TransitionalNode(object):
         else:
             self.children.append(c)
 
+    def preorder_iter(self):
+        """Non-recursive, so deep lineages do not hit the recursion limit."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.children is not None:
+                stack.extend(reversed(node.children))
+
     def number_tree(self, n):
-        self.preorder_number = n
-        if self.children is None:
-            return n + 1
-        n += 1
-        for c in self.children:
-            n = c.number_tree(n)
+        for node in self.preorder_iter():
+            node.preorder_number = n
+            n += 1
         return n
 
-    def fill_preorder2tuples(self, r_sib_pn, preorder2tuples):
-        ppn = self.par.preorder_number
-        pn = self.preorder_number
-        if self.children is None:
-            t = (ppn, r_sib_pn)
-        else:
-            curr_c = self.children[0]
-            left_child_pn = curr_c.preorder_number
-            for r_sib in self.children[1:]:
-                right_pn = r_sib.preorder_number
-                curr_c.fill_preorder2tuples(right_pn, preorder2tuples)
-                curr_c = r_sib
-            curr_c.fill_preorder2tuples(None, preorder2tuples)
-            right_child_pn = curr_c.preorder_number
-            t = (ppn, r_sib_pn, left_child_pn, right_child_pn)
-        assert pn not in preorder2tuples
-        preorder2tuples[pn] = t
-
     def create_leaf_set(self, leaves):
-        if self.children:
-            for c in self.children:
-                c.create_leaf_set(leaves)
-        elif self.ott_id is not None:
-            leaves.add(self.ott_id)
+        for node in self.preorder_iter():
+            if (not node.children) and node.ott_id is not None:
+                leaves.add(node.ott_id)
+
 
 _CACHES = {
     'flagsetid2flagset': ('flagSetID2FlagSet', 'maps an integer to set of flags. Used to compress the flags field'),
-    'forwardingtable': ('forward_table', 'maps a deprecated ID to its forwarded ID'),
+    'forwardingtable': ('forwardingTable', 'maps a deprecated ID to its forwarded ID'),
+    'lcaindex': ('ottLCAIndex', '''binary-lifting ancestor tables for MRCA queries (built from the
+    taxonomy store). See peyotl.ott.lca''',),
     'homonym2ottid': ('homonym2ottID', 'maps a taxon name -> tuple of OTT IDs ',),
     'name2ottid': ('name2ottID', 'maps a taxon name -> ott ID ',),
+    'nameindex': ('ottNameIndex', '''memory-mapped index of normalized names and synonyms for exact,
+    homonym and prefix lookups. See peyotl.ott.name_index''',),
     'ncbi2ottid': ('ncbi2ottID', 'maps an ncbi to an ott ID or list of ott IDs'),
     'nonhomonym2ottid': ('nonhomonym2ottID', 'maps a taxon name -> single OTT ID ',),
     'ottid2flags': ('ottID2flags', '''maps an ott ID to an integer that can be looked up in the flag_set_id2flag_set dictionary. Absence of a ott ID means that there were no flags set.''',),
@@ -210,7 +324,7 @@ _CACHES = {
     'ottid2parentottid': ('ottID2parentOttId', 'ott ID-> parent\'s ott ID. root maps to -1',),
     'ottid2preorder': ('ottID2preorder', 'ott ID -> preorder #',),
     'ottid2ranks': ('ottID2ranks','ottID -> rank',),
-    'ottid2sources': ('ottIDsources', '''maps an ott ID to a dict. The value
+    'ottid2sources': ('ottID2sources', '''maps an ott ID to a dict. The value
     holds a mapping of a source taxonomy name to the ID of this ott ID in that
     taxonomy.''',),
     'ottid2uniq': ('ottID2uniq', 'ott ID -> uniqname for those IDs that have a uniqname field',),
@@ -224,9 +338,37 @@ _CACHES = {
     ''',),
     'root': ('root', 'name and ott_id of the root of the taxonomy',),
     'taxonomicsources': ('taxonomicSources', 'the set of all taxonomic source prefixes'),
+    'taxonomystore': ('taxonomyStore', '''memory-mapped arrays (indexed by preorder #) of OTT ID, parent,
+    flag set key and name. See peyotl.ott.taxonomy_store''',),
     'uniq2ottid': ('uniq2ottID', 'uniqname -> ott ID for those IDs that have a uniqname',)
    }
-_SECOND_LEVEL_CACHES = {'ncbi2ottid'}
+_SECOND_LEVEL_CACHES = {'ncbi2ottid', 'lcaindex', 'nameindex'}
+_BINARY_CACHES = {'taxonomystore', 'lcaindex', 'nameindex'}
+
+
+# cache target -> OTT property that loads (and holds) it. Used by OTT.preload
+_TABLE_PROPERTIES = {'flagsetid2flagset': 'flag_set_id_to_flag_set',
+                     'forwardingtable': 'forward_table',
+                     'lcaindex': 'lca_index',
+                     'nameindex': 'name_index',
+                     'ottid2flags': 'ott_id_to_flags',
+                     'ottid2names': 'ott_id_to_names',
+                     'ottid2parentottid': 'ott_id2par_ott_id',
+                     'ottid2ranks': 'ott_id_to_ranks',
+                     'ottid2sources': 'ott_id_to_sources',
+                     'preorder2ottid': 'preorder2ott_id',
+                     'taxonomicsources': 'taxonomic_sources',
+                     'taxonomystore': 'taxonomy_store',
+                     }
+_DEFAULT_PRELOAD = ('taxonomystore', 'ottid2parentottid', 'ottid2names', 'ottid2flags', 'flagsetid2flagset',
+                    'forwardingtable')
+
+
+def _cache_filename(target):
+    fn = _CACHES[target][0]
+    if target in _BINARY_CACHES:
+        return fn + '.bin'
+    return fn + '.pickle'
 
 
 class CacheNotFoundError(RuntimeError):
@@ -251,6 +393,11 @@ class OTT(object):
             raise ValueError('"{}" is not a directory'.format(self.ott_dir))
         # self.skip_prefixes = ('environmental samples (', 'uncultured (', 'Incertae Sedis (')
         self.skip_prefixes = ('environmental samples (',)
+        self._reset_loaded_tables()
+        self._cache_build_workers = kwargs.get('cache_build_workers')
+        self.cache_build_timings = None
+
+    def _reset_loaded_tables(self):
         self._ott_id_to_names = None
         self._ott_id2par_ott_id = None
         self._preorder2ott_id = None
@@ -265,6 +412,19 @@ class OTT(object):
         self._taxonomic_sources = None
         self._ncbi_2_ott_id = None
         self._forward_table = None
+        self._taxonomy_store = None
+        self._lca_index = None
+        self._name_index = None
+
+    @property
+    def cache_build_workers(self):
+        """Number of processes used to parse the taxonomy files when building caches. Set by
+        the `cache_build_workers` kwarg or the "cache_build_workers" setting in the "[ott]"
+        section of the config. Defaults to the number of CPUs."""
+        if self._cache_build_workers is None:
+            w = self._config.get_config_setting('ott', 'cache_build_workers', warn_on_none_level=None)
+            self._cache_build_workers = int(w) if w else default_num_workers()
+        return self._cache_build_workers
 
     def create_ncbi_to_ott(self):
         ncbi2ott = {}
@@ -310,6 +470,18 @@ class OTT(object):
         each key to its set of strings."""
         return OTTFlagUnion(self, flag_set)
 
+    def flag_prune_mask(self, prune_flags):
+        """Returns the prune mask (a bytearray indexed by preorder number, see
+        peyotl.ott.taxonomy_store) for `prune_flags` (an OTTFlagUnion or a set of flag
+        strings). Masks are cached in the process-wide table registry, so repeated
+        pruning with the same flags does not rescan the taxonomy."""
+        if not isinstance(prune_flags, OTTFlagUnion):
+            prune_flags = self.convert_flag_string_set_to_union(prune_flags)
+        keys = sorted(prune_flags.keys())
+        name = 'flagPruneMask({})'.format(','.join([str(i) for i in keys]))
+        store = self.taxonomy_store
+        return OTT_TABLE_REGISTRY.get(self._registry_key, name, lambda: store.flag_prune_mask(keys))
+
     def convert_flag_string_set_to_flag_set_keys(self, flag_set):
         if not isinstance(flag_set, set):
             flag_set = set(flag_set)
@@ -364,8 +536,10 @@ class OTT(object):
     @property
     def ott_id2par_ott_id(self):
         if self._ott_id2par_ott_id is None:
-            fp = self.make('ottid2parentottid')
-            self._ott_id2par_ott_id = self._load_cache_filepath(fp)
+            def _loader():
+                return self._load_cache_filepath(self.make('ottid2parentottid'))
+
+            self._ott_id2par_ott_id = OTT_TABLE_REGISTRY.get(self._registry_key, 'ottID2parentOttId', _loader)
         return self._ott_id2par_ott_id
 
     def make(self, target):
@@ -373,9 +547,7 @@ class OTT(object):
         if tl not in _CACHES:
             c = '\n  '.join(_CACHES.keys())
             raise ValueError('target "{t}" not understood. Must be one of: {a}'.format(t=target, a=c))
-        info = _CACHES[tl]
-        fn = info[0] + '.pickle'
-        fp = os.path.join(self.ott_dir, fn)
+        fp = os.path.join(self.ott_dir, _cache_filename(tl))
         need_build = False
         if not os.path.exists(fp):
             need_build = True
@@ -385,7 +557,7 @@ class OTT(object):
                 raise RuntimeError('taxonomy not found at "{}"'.format(taxonomy_file))
             if os.path.getmtime(fp) < os.path.getmtime(taxonomy_file):
                 need_build = True
-            elif tl in ['name2ottid', 'ottid2names']:  # TODO, make sure that these are the only files needing synonyms.
+            elif tl in ['name2ottid', 'ottid2names', 'nameindex']:  # TODO, make sure that these are the only files needing synonyms.
                 if os.path.getmtime(fp) < os.path.getmtime(self.synonyms_filepath):
                     need_build = True
         if need_build:
@@ -397,11 +569,39 @@ class OTT(object):
             _LOG.debug('"{}" up to date.'.format(fp))
         return fp
 
+    @property
+    def _registry_key(self):
+        return OTTTableRegistry.key_for(self.ott_dir, self.version)
+
     def _load_pickled(self, fn):
-        if not fn.endswith('.pickle'):
-            fn = fn + '.pickle'
-        fp = os.path.join(self.ott_dir, fn)
-        return self._load_cache_filepath(fp)
+        """Returns the table from the process-wide registry, unpickling it on first use."""
+        if fn.endswith('.pickle'):
+            fn = fn[:-len('.pickle')]
+        fp = os.path.join(self.ott_dir, fn + '.pickle')
+        return OTT_TABLE_REGISTRY.get(self._registry_key, fn, lambda: self._load_cache_filepath(fp))
+
+    def preload(self, tables=None):
+        """Loads the cache `tables` (names of caches, e.g. "ottID2names" or "ottid2names";
+        default is the tables used in ID mapping and newick export) into the process-wide
+        registry. Calling this before forking worker processes lets the workers share the
+        tables copy-on-write."""
+        if tables is None:
+            tables = _DEFAULT_PRELOAD
+        for t in tables:
+            tl = t.lower()
+            if tl not in _CACHES:
+                c = '\n  '.join(_CACHES.keys())
+                raise ValueError('table "{t}" not understood. Must be one of: {a}'.format(t=t, a=c))
+            prop = _TABLE_PROPERTIES.get(tl)
+            if prop is None:
+                self._load_pickled(_CACHES[tl][0])
+            else:
+                getattr(self, prop)
+
+    def memory_usage(self):
+        """Returns a dict of table name -> approximate bytes for the tables of this taxonomy
+        that are loaded in this process. Memory-mapped stores report their mapped size."""
+        return OTT_TABLE_REGISTRY.memory_usage(self._registry_key).get(self._registry_key, {})
 
     def _load_cache_filepath(self, fp):
         if not os.path.exists(fp):
@@ -442,24 +642,107 @@ class OTT(object):
         return self._preorder2ott_id
 
     def get_label(self, ott_id, name2label):
-        n = self.get_name(ott_id)
-        if name2label == OTULabelStyleEnum.CURRENT_LABEL_OTT_ID:
-            return u'{n}_ott{o:d}'.format(n=n, o=ott_id)
-        return n
+        return _format_label(self.get_name(ott_id), ott_id, name2label)
+
+    @property
+    def taxonomy_store(self):
+        """OTTTaxonomyStore (memory-mapped) for name, parent and flag queries that
+        do not need the pickled dicts to be loaded."""
+        if self._taxonomy_store is None:
+            self._taxonomy_store = OTT_TABLE_REGISTRY.get(self._registry_key, 'taxonomyStore',
+                                                          self._open_taxonomy_store)
+        return self._taxonomy_store
+
+    def _open_taxonomy_store(self):
+        fp = self.make('taxonomystore')
+        store = OTTTaxonomyStore(fp)
+        if store.version != TAXONOMY_STORE_VERSION:
+            _LOG.debug('"{}" is from an older version of peyotl. Rebuilding'.format(fp))
+            store.close()
+            self._create_caches(out_dir=self.ott_dir)
+            store = OTTTaxonomyStore(fp)
+        return store
+
+    @property
+    def lca_index(self):
+        """OTTLCAIndex used by mrca and mrca_many. Built from the taxonomy store on first use."""
+        if self._lca_index is None:
+            self._lca_index = OTT_TABLE_REGISTRY.get(self._registry_key, 'ottLCAIndex', self._open_lca_index)
+        return self._lca_index
+
+    def _open_lca_index(self):
+        store = self.taxonomy_store
+        fp = os.path.join(self.ott_dir, _cache_filename('lcaindex'))
+        try:
+            self.make('lcaindex')
+            if os.path.getmtime(fp) < os.path.getmtime(store.filepath):
+                raise CacheNotFoundError('lcaindex')
+            index = OTTLCAIndex(fp, store)
+            if index.version != LCA_INDEX_VERSION:
+                index.close()
+                raise CacheNotFoundError('lcaindex')
+        except CacheNotFoundError:
+            write_lca_index(fp, store)
+            index = OTTLCAIndex(fp, store)
+        return index
+
+    def mrca(self, ott_ids):
+        """Returns the OTT ID of the most recent common ancestor of the taxa in `ott_ids`.
+        Raises KeyError if any ID is not in the taxonomy."""
+        return self.lca_index.mrca(ott_ids)
+
+    def mrca_many(self, list_of_id_sets):
+        """Returns a list of the MRCA OTT ID for each collection of OTT IDs in `list_of_id_sets`"""
+        index = self.lca_index
+        return [index.mrca(i) for i in list_of_id_sets]
 
     def get_name(self, ott_id):
-        name_or_name_list = self.ott_id_to_names.get(ott_id)
-        if name_or_name_list is None:
-            return None
-        if is_str_type(name_or_name_list):
-            return name_or_name_list
-        return name_or_name_list[0]
+        return self.taxonomy_store.get_name(ott_id)
 
     def get_ott_ids(self, name):
         if self._name2ott_ids is None:
             self._name2ott_ids = self._load_pickled('name2ottID')
         return self._name2ott_ids.get(name)
 
+    @property
+    def name_index(self):
+        """OTTNameIndex (memory-mapped) used by find_names, match_names and autocomplete_name."""
+        if self._name_index is None:
+            self._name_index = OTT_TABLE_REGISTRY.get(self._registry_key, 'ottNameIndex', self._open_name_index)
+        return self._name_index
+
+    def _open_name_index(self):
+        fp = os.path.join(self.ott_dir, _cache_filename('nameindex'))
+        try:
+            self.make('nameindex')
+            index = OTTNameIndex(fp)
+            if index.version != NAME_INDEX_VERSION:
+                index.close()
+                raise CacheNotFoundError('nameindex')
+        except CacheNotFoundError:
+            # caches from before the name index was added: build it from the names table
+            self.make('ottid2names')
+            write_name_index(fp, self.ott_id_to_names)
+            index = OTTNameIndex(fp)
+        return index
+
+    def find_names(self, name):
+        """Returns the list of (OTT ID, matched name, is_synonym) for the names and synonyms that
+        match `name` ignoring case, accents and extra whitespace (see peyotl.ott.name_index).
+        Homonyms give more than one OTT ID."""
+        return self.name_index.lookup(name)
+
+    def match_names(self, names):
+        """Local version of the TNRS exact matching for a batch of names. Returns a dict
+        mapping each name in `names` to its list of matches (see find_names)."""
+        names = list(names)
+        return dict(zip(names, self.name_index.lookup_many(names)))
+
+    def autocomplete_name(self, prefix, limit=100):
+        """Returns up to `limit` matches (see find_names) for the names and synonyms that start
+        with `prefix` (compared as normalized names), in sorted order of the normalized names."""
+        return self.name_index.prefix_search(prefix, limit=limit)
+
     @property
     def root_name(self):
         if self._root_name is None:
@@ -475,8 +758,10 @@ class OTT(object):
     def remove_caches(self, out_dir=None):
         if out_dir is None:
             out_dir = self.ott_dir
-        for tup in _CACHES.values():
-            fp = os.path.join(out_dir, tup[0] + '.pickle')
+        if os.path.abspath(out_dir) == os.path.abspath(self.ott_dir):
+            OTT_TABLE_REGISTRY.discard(self._registry_key)
+        for target in _CACHES.keys():
+            fp = os.path.join(out_dir, _cache_filename(target))
             if os.path.exists(fp):
                 _LOG.info('Removing cache "{f}"'.format(f=fp))
                 os.remove(fp)
@@ -488,6 +773,8 @@ class OTT(object):
             self._create_pickle_files(out_dir=out_dir)
         except:
             raise  # TODO, clean up
+        if (out_dir is None) or os.path.abspath(out_dir) == os.path.abspath(self.ott_dir):
+            OTT_TABLE_REGISTRY.discard(self._registry_key)
 
     def _create_pickle_files(self, out_dir=None):  # pylint: disable=R0914,R0915
         """
@@ -509,8 +796,10 @@ class OTT(object):
         taxonomy_file = self.taxonomy_filepath
         if not os.path.isfile(taxonomy_file):
             raise ValueError('Expecting to find "{}" based on ott_dir of "{}"'.format(taxonomy_file, self.ott_dir))
+        timer = PhaseTimer('OTT cache build')
+        num_workers = self.cache_build_workers
         num_lines = 0
-        _LOG.debug('Reading "{f}"...'.format(f=taxonomy_file))
+        _LOG.debug('Reading "{f}" with {w:d} worker(s)...'.format(f=taxonomy_file, w=num_workers))
         id2par = {}  # UID to parent UID
         id2name = {}  # UID to 'name' field
         id2rank = {}  # UID to 'rank' field
@@ -524,111 +813,70 @@ class OTT(object):
         sources = set()
         flag_set = set()
         f_set_id = 0
-        source = {}
         root_ott_id = None
-        with codecs.open(taxonomy_file, 'r', encoding='utf-8') as tax_fo:
-            it = iter(tax_fo)
-            first_line = next(it)
-            assert first_line == 'uid\t|\tparent_uid\t|\tname\t|\trank\t|\tsourceinfo\t|\tuniqname\t|\tflags\t|\t\n'
-            # now parse the rest of the taxonomy file
-            for rown in it:
-                ls = rown.split('\t|\t')
-                uid, par, name = ls[:3]
-                rank,sourceinfo, uniqname, flags = ls[3:7]
-                skip = False
-                for p in self.skip_prefixes:
-                    if uniqname.startswith(p):
-                        skip = True
-                        break
-                if skip:
-                    continue
-                uid = int(uid)
-                if par == '':
-                    # parse the root node (name = life; no parent)
-                    par = NONE_PAR
-                    root_ott_id = uid
-                    assert name == 'life'
-                    self._root_name = name
-                else:
-                    # this is not the root node
-                    par = int(par)
-                    if par not in id2par:
-                        raise ValueError('parent {} not found in OTT parsing'.format(par))
-                assert ls[7] == '\n'
-                assert uid not in id2par
-                id2par[uid] = par
-                id2name[uid] = name
-                if rank:
-                    id2rank[uid] = rank
-                if uniqname:
-                    id2uniq[uid] = uniqname
-                    if uniqname in uniq2id:
-                        _LOG.error('uniqname "{u}" used for OTT ID "{f:d}" and "{n:d}"'.format(
-                            u=uniqname,
-                            f=uniq2id[uniqname],
-                            n=uid))
-                    uniq2id[uniqname] = uid
-                if sourceinfo:
-                    s_list = sourceinfo.split(',')
-                    for x in s_list:
-                        src, sid = x.split(':')
-                        try:
-                            sid = int(sid)
-                        except:
-                            pass
-                        sources.add(src)
-                        source[src] = sid
-                if flags:
-                    f_list = flags.split(',')
-                    if len(f_list) > 1:
-                        f_list.sort()
-                    f_set = frozenset(f_list)
-                    for x in f_list:
-                        flag_set.add(x)
-                    fsi = flag_set2flag_set_id.get(f_set)
-                    if fsi is None:
-                        fsi = f_set_id
-                        f_set_id += 1
-                        flag_set_id2flag_set[fsi] = f_set
-                        flag_set2flag_set_id[f_set] = fsi
-                    id2flag[uid] = fsi
-                if source:
-                    id2source[uid] = source
-                    source = {}
-
-                num_lines += 1
-                if num_lines % 100000 == 0:
-                    _LOG.debug('read {n:d} lines...'.format(n=num_lines))
+        for row in iter_taxonomy_rows(taxonomy_file, skip_prefixes=self.skip_prefixes, num_workers=num_workers):
+            uid, par, name, rank, source, uniqname, f_list = row
+            if par is None:
+                # parse the root node (name = life; no parent)
+                par = NONE_PAR
+                root_ott_id = uid
+                assert name == 'life'
+                self._root_name = name
+            elif par not in id2par:
+                raise ValueError('parent {} not found in OTT parsing'.format(par))
+            assert uid not in id2par
+            id2par[uid] = par
+            id2name[uid] = name
+            if rank:
+                id2rank[uid] = rank
+            if uniqname:
+                id2uniq[uid] = uniqname
+                if uniqname in uniq2id:
+                    _LOG.error('uniqname "{u}" used for OTT ID "{f:d}" and "{n:d}"'.format(
+                        u=uniqname,
+                        f=uniq2id[uniqname],
+                        n=uid))
+                uniq2id[uniqname] = uid
+            if source:
+                sources.update(source.keys())
+                id2source[uid] = source
+            if f_list:
+                f_set = frozenset(f_list)
+                flag_set.update(f_list)
+                fsi = flag_set2flag_set_id.get(f_set)
+                if fsi is None:
+                    fsi = f_set_id
+                    f_set_id += 1
+                    flag_set_id2flag_set[fsi] = f_set
+                    flag_set2flag_set_id[f_set] = fsi
+                id2flag[uid] = fsi
+            num_lines += 1
+            if num_lines % 100000 == 0:
+                _LOG.debug('read {n:d} lines...'.format(n=num_lines))
         _LOG.debug('read taxonomy file. total of {n:d} lines.'.format(n=num_lines))
+        timer.end_phase('parse taxonomy')
         _write_pickle(out_dir, 'ottID2parentOttId', id2par)
         synonyms_file = self.synonyms_filepath
         _LOG.debug('Reading "{f}"...'.format(f=synonyms_file))
         if not os.path.isfile(synonyms_file):
             raise ValueError('Expecting to find "{}" based on ott_dir of "{}"'.format(synonyms_file, self.ott_dir))
         num_lines = 0
-        with codecs.open(synonyms_file, 'r', encoding='utf-8') as syn_fo:
-            it = iter(syn_fo)
-            first_line = next(it)
-            # modified to allow for final 'source column'
-            assert first_line.startswith('name\t|\tuid\t|\ttype\t|\tuniqname')
-            for rown in it:
-                ls = rown.split('\t|\t')
-                name, ott_id = ls[0], ls[1]
-                ott_id = int(ott_id)
-                if ott_id in id2name:
-                    n = id2name[ott_id]
-                    if isinstance(n, list):
-                        n.append(name)
-                    else:
-                        id2name[ott_id] = [n, name]
+        for name, ott_id in iter_synonym_rows(synonyms_file, num_workers=num_workers):
+            if ott_id in id2name:
+                n = id2name[ott_id]
+                if isinstance(n, list):
+                    n.append(name)
                 else:
-                    _f = u'synonym "{n}" maps to an ott_id ({u}) that was not in the taxonomy!'
-                    _m = _f.format(n=name, u=ott_id)
-                    _LOG.debug(_m)
-                num_lines += 1
-                if num_lines % 100000 == 0:
-                    _LOG.debug('read {n:d} lines...'.format(n=num_lines))
+                    id2name[ott_id] = [n, name]
+            else:
+                _f = u'synonym "{n}" maps to an ott_id ({u}) that was not in the taxonomy!'
+                _m = _f.format(n=name, u=ott_id)
+                _LOG.debug(_m)
+            num_lines += 1
+            if num_lines % 100000 == 0:
+                _LOG.debug('read {n:d} lines...'.format(n=num_lines))
         _LOG.debug('read synonyms file. total of {n:d} lines.'.format(n=num_lines))
+        timer.end_phase('parse synonyms')
         _LOG.debug('normalizing id2name dict. {s:d} entries'.format(s=len(id2name)))
         _swap = {}
         for k, v in id2name.items():
@@ -663,25 +911,11 @@ class OTT(object):
                 homonym2id[name] = ott_ids
             else:
                 nonhomonym2id[name] = ott_ids
-        _LOG.debug('Making heavy tree')
-        tt = make_tree_from_taxonomy(id2par)
-        _LOG.debug('preorder numbering nodes')
-        root = tt[root_ott_id]
-        root.number_tree(0)
-        _LOG.debug('creating ott_id <--> preorder maps')
-        ott_id2preorder = {}
-        preorder2ott_id = {}
-        for ott_id, node in tt.items():
-            ott_id2preorder[ott_id] = node.preorder_number
-            preorder2ott_id[node.preorder_number] = ott_id
-        ott_id2preorder['root_ott_id'] = root_ott_id
-        ott_id2preorder['root'] = root.preorder_number
-        preorder2ott_id['root'] = root_ott_id
-        preorder2ott_id['root_preorder'] = root.preorder_number
+        timer.end_phase('name indexing')
+        preorder_list = _write_preorder_tables(out_dir, id2par, root_ott_id)
+        timer.end_phase('tree building')
         self._root_ott_id = root_ott_id
         self._write_root_properties(out_dir, self._root_name, self._root_ott_id)
-        _write_pickle(out_dir, 'ottID2preorder', ott_id2preorder)
-        _write_pickle(out_dir, 'preorder2ottID', preorder2ott_id)
         _write_pickle(out_dir, 'ottID2uniq', id2uniq)
         _write_pickle(out_dir, 'uniq2ottID', uniq2id)
         _write_pickle(out_dir, 'name2ottID', name2id)
@@ -693,15 +927,99 @@ class OTT(object):
         _write_pickle(out_dir, 'ottID2flags', id2flag)
         _write_pickle(out_dir, 'flagSetID2FlagSet', flag_set_id2flag_set)
         _write_pickle(out_dir, 'taxonomicSources', sources)
+        timer.end_phase('writing pickles')
         forward_table = self._parse_forwarding_files()
         _write_pickle(out_dir, 'forwardingTable', forward_table)
-        _LOG.debug('creating tree representation with preorder # to tuples')
-        preorder2tuples = {}
-        root.par = _TransitionalNode()  # fake parent of root
-        root.par.preorder_number = None
-        root.fill_preorder2tuples(None, preorder2tuples)
-        preorder2tuples['root'] = root.preorder_number
-        _write_pickle(out_dir, 'preorder2tuple', preorder2tuples)
+        timer.end_phase('forwarding table')
+        write_taxonomy_store(os.path.join(out_dir, _cache_filename('taxonomystore')),
+                             preorder_list, id2par, id2name, id2flag)
+        timer.end_phase('taxonomy store')
+        write_name_index(os.path.join(out_dir, _cache_filename('nameindex')), id2name)
+        timer.end_phase('name index')
+        _LOG.info('OTT cache build took {s:.2f} seconds in total'.format(s=timer.total))
+        self.cache_build_timings = timer.timings
+
+    def update_caches(self, new_ott_dir, change_log_filepath=None):
+        """Creates the caches for the OTT release in `new_ott_dir` by patching the caches of
+        this (older) release, and then switches this object to `new_ott_dir`.
+        The new taxonomy, synonyms and forwards files are diffed against the old tables, and
+        the tables that are affected by the changes are patched (the rest are copied). If the
+        topology changed, the new preorder is spliced from the old taxonomy store (see
+        cache_update.patch_preorder) instead of renumbering the whole tree, unless the root changed.
+        Only the diffing, the name updates and the splicing scale with the size of the delta:
+        a patched table is still pickled whole, and the preorder tables and the taxonomy store
+        are rewritten whole when the topology changed (every preorder # after the first change
+        may shift). Returns a change log dict (also written as JSON to `change_log_filepath`
+        if it is not None).
+        """
+        new_ott = OTT(ott_dir=new_ott_dir, config=self._config, cache_build_workers=self.cache_build_workers)
+        if os.path.abspath(new_ott.ott_dir) == os.path.abspath(self.ott_dir):
+            raise ValueError('update_caches requires a different directory than the current ott_dir')
+        for fp in (new_ott.taxonomy_filepath, new_ott.synonyms_filepath):
+            if not os.path.isfile(fp):
+                raise ValueError('Expecting to find "{}" based on ott_dir of "{}"'.format(fp, new_ott_dir))
+        old_store = self.taxonomy_store  # makes sure that the old caches exist
+        timer = PhaseTimer('OTT cache update')
+        patch = OTTCachePatch(self._load_pickled, self.version, new_ott.version)
+        num_workers = self.cache_build_workers
+        patch.diff_taxonomy(iter_taxonomy_rows(new_ott.taxonomy_filepath,
+                                               skip_prefixes=new_ott.skip_prefixes,
+                                               num_workers=num_workers))
+        timer.end_phase('diff taxonomy')
+        patch.diff_synonyms(iter_synonym_rows(new_ott.synonyms_filepath, num_workers=num_workers))
+        timer.end_phase('diff synonyms')
+        patch.diff_forwards(new_ott._parse_forwarding_files())
+        timer.end_phase('diff forwarding table')
+        out_dir = new_ott.ott_dir
+        for fn in PATCHABLE_TABLES:
+            if fn in patch.changed_tables:
+                _write_pickle(out_dir, fn, patch.table(fn))
+            else:
+                _copy_cache_file(self.ott_dir, out_dir, fn + '.pickle')
+        id2par = patch.table('ottID2parentOttId')
+        root_ott_id = patch.table('root')['ott_id']
+        if patch.topology_changed:
+            if root_ott_id == old_store.root_ott_id:
+                cl = patch.change_log
+                moved = [i['ott_id'] for i in cl['added']] + [i['ott_id'] for i in cl['reparented']]
+                preorder_list = patch_preorder(old_store, id2par, moved, cl['removed'])
+            else:
+                preorder_list = None  # the whole taxonomy is renumbered
+            preorder_list = _write_preorder_tables(out_dir, id2par, root_ott_id, preorder_list=preorder_list)
+        else:
+            preorder_list = None
+            for fn in PREORDER_TABLES:
+                _copy_cache_file(self.ott_dir, out_dir, fn + '.pickle')
+        timer.end_phase('writing pickles')
+        store_fn = _cache_filename('taxonomystore')
+        if patch.topology_changed or patch.primary_names_changed or patch.flags_changed:
+            if preorder_list is None:
+                preorder_list = old_store.array('ott_id').tolist()
+            write_taxonomy_store(os.path.join(out_dir, store_fn), preorder_list, id2par,
+                                 patch.table('ottID2names'), patch.table('ottID2flags'))
+        else:
+            _copy_cache_file(self.ott_dir, out_dir, store_fn)
+        if not patch.topology_changed:
+            # the LCA index only depends on the preorder parent array
+            _copy_cache_file(self.ott_dir, out_dir, _cache_filename('lcaindex'), required=False)
+        timer.end_phase('taxonomy store')
+        index_fn = _cache_filename('nameindex')
+        if 'ottID2names' in patch.changed_tables:
+            write_name_index(os.path.join(out_dir, index_fn), patch.table('ottID2names'))
+        else:
+            _copy_cache_file(self.ott_dir, out_dir, index_fn, required=False)
+        timer.end_phase('name index')
+        _LOG.info('OTT cache update took {s:.2f} seconds in total'.format(s=timer.total))
+        self.cache_build_timings = timer.timings
+        change_log = patch.finish_change_log()
+        self.ott_dir = new_ott.ott_dir
+        self._reset_loaded_tables()
+        key = self._registry_key
+        for fn in patch.changed_tables:
+            OTT_TABLE_REGISTRY.put(key, fn, patch.table(fn))
+        if change_log_filepath is not None:
+            write_as_json(change_log, change_log_filepath, indent=1)
+        return change_log
 
     def _parse_forwarding_files(self):
         r = {}
@@ -757,18 +1075,57 @@ class OTT(object):
             root_ott_id = self.root_ott_id
         if label_style not in [OTULabelStyleEnum.OTT_ID, OTULabelStyleEnum.CURRENT_LABEL_OTT_ID]:
             raise NotImplementedError('newick from ott with labels other than ott id')
-        o2p = self.ott_id2par_ott_id
-        ott2children = make_ott_to_children(o2p)
-        return write_newick_ott(out,
-                                self,
-                                ott2children,
-                                root_ott_id,
-                                label_style,
-                                prune_flags,
-                                create_log_dict=create_log_dict)
+        return write_newick_ott_from_store(out,
+                                           self,
+                                           root_ott_id,
+                                           label_style,
+                                           prune_flags,
+                                           create_log_dict=create_log_dict)
+
+    def write_binary_subtree(self, filepath, root_ott_id=None, prune_flags=None):
+        """Writes the subtree rooted at `root_ott_id` (default: the whole taxonomy) with OTT IDs
+        as the node IDs, in the format of peyotl.phylo.binary_tree (read it with
+        TreeWithPathsInEdges.read_binary or BinaryTreeReader). Taxa that have any of the flags
+        in `prune_flags` are left out with their subtrees. The arrays are sliced from the
+        taxonomy store, so no tree is built. Returns the number of taxa written.
+        """
+        from peyotl.phylo.binary_tree import write_binary_tree_arrays
+        if root_ott_id is None:
+            root_ott_id = self.root_ott_id
+        store = self.taxonomy_store
+        first, last = store.preorder_interval(root_ott_id)
+        to_prune_fsi_set = _prune_flag_setup(self, prune_flags)[1]
+        mask = self.flag_prune_mask(to_prune_fsi_set) if to_prune_fsi_set else None
+        parent = store.array('parent').tolist()[first:last + 1]
+        ott_ids = store.array('ott_id').tolist()[first:last + 1]
+        if mask is None:
+            parent = [p - first for p in parent]
+            parent[0] = -1
+        else:
+            rank = {}
+            kept_parent, kept_ids = [], []
+            for n, ott_id in enumerate(ott_ids):
+                if mask[first + n] != NOT_PRUNED:
+                    continue
+                rank[first + n] = len(kept_ids)
+                kept_parent.append(rank.get(parent[n], -1))
+                kept_ids.append(ott_id)
+            parent, ott_ids = kept_parent, kept_ids
+        write_binary_tree_arrays(filepath, parent, ott_ids)
+        return len(ott_ids)
 
     def get_anc_lineage(self, ott_id):
-        return create_anc_lineage_from_id2par(self.ott_id2par_ott_id, ott_id)
+        return self.taxonomy_store.get_anc_lineage(ott_id)
+
+    def is_ancestor(self, anc_ott_id, des_ott_id, proper=True):
+        """Constant-time (after ID lookup) test based on the preorder interval index."""
+        return self.taxonomy_store.is_ancestor(anc_ott_id, des_ott_id, proper=proper)
+
+    def subtree_size(self, ott_id):
+        return self.taxonomy_store.subtree_size(ott_id)
+
+    def ids_in_subtree(self, root_ott_id, ott_id_list):
+        return self.taxonomy_store.ids_in_subtree(root_ott_id, ott_id_list)
 
     def _debug_anc_spikes(self, ott_id_list):
         al = [self.get_anc_lineage(o) for o in ott_id_list]
@@ -781,48 +1138,54 @@ class OTT(object):
         for n, o in enumerate(ott_id_list):
             _LOG.debug(fmt.format(o, asl[n]))
 
-    def induced_tree(self, ott_id_list, create_monotypic_nodes=False):
+    def induced_tree(self, ott_id_list, create_monotypic_nodes=False, method='id2par', _class=TreeWithPathsInEdges):
+        """Returns the tree of the taxonomy induced by `ott_id_list` (None for an empty list).
+        `method` is 'id2par' (walk the OTT parent table from every ID) or 'preorder' (see
+        create_induced_tree_by_preorder; this uses the memory-mapped taxonomy store and LCA
+        index, so the pickled parent dict of the whole taxonomy is never loaded).
+        """
+        if method == 'preorder':
+            return create_induced_tree_by_preorder(self.taxonomy_store, self.lca_index, ott_id_list,
+                                                   create_monotypic_nodes=create_monotypic_nodes, _class=_class)
+        if method != 'id2par':
+            raise ValueError('Unknown induced tree method "{}"'.format(method))
         # self._debug_anc_spikes(ott_id_list)
-        return create_tree_from_id2par(self.ott_id2par_ott_id, ott_id_list,
+        return create_tree_from_id2par(self.ott_id2par_ott_id, ott_id_list, _class=_class,
                                        create_monotypic_nodes=create_monotypic_nodes)
 
     def check_if_above_root(self, curr_id, known_below_root, known_above_root, root_ott_id):
+        """Returns True if `curr_id` is not `root_ott_id` or one of its descendants.
+        Uses the preorder interval of the root, so no walk toward the root is needed. The
+        `known_below_root` and `known_above_root` sets are updated for the benefit of callers.
+        """
         if root_ott_id is None:
             return False
         if curr_id in known_below_root:
             return False
         if curr_id in known_above_root:
             return True
-        oi2poi = self.ott_id2par_ott_id
-        new_id_list = []
         assert curr_id is not None
-        while True:
-            new_id_list.append(curr_id)
-            if (curr_id is None) or (curr_id in known_above_root):
-                known_above_root.update(new_id_list)
-                return True
-            curr_id = oi2poi.get(curr_id)
-            if (curr_id in known_below_root) or (curr_id == root_ott_id):
-                known_below_root.update(new_id_list)
-                return False
+        store = self.taxonomy_store
+        first, last = store.preorder_interval(root_ott_id)
+        p = store.preorder_number(curr_id)
+        if p is not None and first <= p <= last:
+            known_below_root.add(curr_id)
+            return False
+        known_above_root.add(curr_id)
+        return True
 
     def check_if_in_pruned_subtree(self, curr_id, known_unpruned, known_pruned, to_prune_fsi_set):
         if curr_id in known_pruned:
             return True
         if curr_id in known_unpruned:
             return False
-        oi2poi = self.ott_id2par_ott_id
-        new_id_list = []
         assert curr_id is not None
-        while True:
-            new_id_list.append(curr_id)
-            if (self.has_flag_set_key_intersection(curr_id, to_prune_fsi_set)) or (curr_id in known_pruned):
-                known_pruned.update(new_id_list)
-                return True
-            curr_id = oi2poi.get(curr_id)
-            if (curr_id is None) or (curr_id in known_unpruned):
-                known_unpruned.update(new_id_list)
-                return False
+        p = self.taxonomy_store.preorder_number(curr_id)
+        if p is None or self.flag_prune_mask(to_prune_fsi_set)[p] == NOT_PRUNED:
+            known_unpruned.add(curr_id)
+            return False
+        known_pruned.add(curr_id)
+        return True
 
     def map_ott_ids(self, ott_id_list, to_prune_fsi_set, root_ott_id):
         """returns:
@@ -837,12 +1200,16 @@ class OTT(object):
         """
         mapped, unrecog, forward2unrecog, pruned, above_root, old2new = [], [], [], [], [], {}
         known_unpruned, known_pruned = set(), set()
-        known_above_root, known_below_root = set(), set()
-        oi2poi = self.ott_id2par_ott_id
+        store = self.taxonomy_store
+        if root_ott_id is None:
+            first, last = 0, len(store) - 1
+        else:
+            first, last = store.preorder_interval(root_ott_id)
         ft = self.forward_table
         for old_id in ott_id_list:
-            if old_id in oi2poi:
-                if self.check_if_above_root(old_id, known_above_root, known_below_root, root_ott_id):
+            p = store.preorder_number(old_id)
+            if p is not None:
+                if not (first <= p <= last):
                     above_root.append(old_id)
                 elif (to_prune_fsi_set is not None) and \
                         self.check_if_in_pruned_subtree(old_id, known_unpruned, known_pruned, to_prune_fsi_set):
@@ -854,7 +1221,7 @@ class OTT(object):
                 if new_id is None:
                     unrecog.append(old_id)
                 else:
-                    if new_id in oi2poi:
+                    if new_id in store:
                         if (to_prune_fsi_set is not None) and \
                                 self.check_if_in_pruned_subtree(new_id, known_unpruned, known_pruned, to_prune_fsi_set):
                             pruned.append(old_id)  # could be in a forward2pruned
@@ -888,34 +1255,85 @@ else:
         return pickle.load(open(fp, 'rb'))
 
 
-def _generate_parent(id2par, par_ott_id, ott2transitional):
-    par = ott2transitional.get(par_ott_id)
-    if par is not None:
-        return par
-    if par_ott_id == NONE_PAR:
-        return None
-    gp_id = id2par[par_ott_id]
-    gp = ott2transitional.get(gp_id)
-    if gp is None:
-        gp = _generate_parent(id2par, gp_id, ott2transitional)
-        if gp is None:
-            root = _TransitionalNode(ott_id=gp_id)
-            ott2transitional[gp_id] = root
-            return root
-    par = _TransitionalNode(ott_id=par_ott_id, par=gp)
-    ott2transitional[par_ott_id] = par
-    return par
+def _copy_cache_file(src_dir, dest_dir, fn, required=True):
+    src = os.path.join(src_dir, fn)
+    if not os.path.exists(src):
+        if required:
+            raise CacheNotFoundError(src)
+        return
+    dest = os.path.join(dest_dir, fn)
+    _LOG.debug('Copying "{s}" to "{d}"'.format(s=src, d=dest))
+    shutil.copyfile(src, dest)
 
 
 def make_tree_from_taxonomy(id2par):
+    """Returns a dict of OTT ID -> _TransitionalNode. Children are added in the
+    iteration order of `id2par`, which for a plain dict is not the order of taxonomy.tsv
+    (on python 2 it is hash order). So the order of siblings, and thus the preorder numbers,
+    are arbitrary, but all of the tables written from one tree agree on them.
+    """
     ott2transitional = {}
+    for ott_id in id2par.keys():
+        ott2transitional[ott_id] = _TransitionalNode(ott_id=ott_id)
     for ott_id, par_ott_id in id2par.items():
-        par = _generate_parent(id2par, par_ott_id, ott2transitional)
-        nd = _TransitionalNode(ott_id=ott_id, par=par)
-        ott2transitional[ott_id] = nd
+        if par_ott_id != NONE_PAR:
+            nd = ott2transitional[ott_id]
+            nd.par = ott2transitional[par_ott_id]
+            nd.par.add_child(nd)
     return ott2transitional
 
 
+def _write_preorder_tables(out_dir, id2par, root_ott_id, preorder_list=None):
+    """Writes the ottID2preorder, preorder2ottID and preorder2tuple pickles for the OTT IDs
+    in `preorder_list` (which are in preorder, starting with the root). If `preorder_list`
+    is None, the taxonomy is numbered in preorder first. Returns the list of OTT IDs in preorder.
+    """
+    if preorder_list is None:
+        _LOG.debug('Making heavy tree')
+        tt = make_tree_from_taxonomy(id2par)
+        _LOG.debug('preorder numbering nodes')
+        tt[root_ott_id].number_tree(0)
+        preorder_list = [None] * len(tt)
+        for ott_id, node in tt.items():
+            preorder_list[node.preorder_number] = ott_id
+        del tt
+    assert preorder_list[0] == root_ott_id
+    num_taxa = len(preorder_list)
+    _LOG.debug('creating ott_id <--> preorder maps')
+    ott_id2preorder = dict(zip(preorder_list, range(num_taxa)))
+    preorder2ott_id = dict(enumerate(preorder_list))
+    ott_id2preorder['root_ott_id'] = root_ott_id
+    ott_id2preorder['root'] = 0
+    preorder2ott_id['root'] = root_ott_id
+    preorder2ott_id['root_preorder'] = 0
+    _write_pickle(out_dir, 'ottID2preorder', ott_id2preorder)
+    _write_pickle(out_dir, 'preorder2ottID', preorder2ott_id)
+    _LOG.debug('creating tree representation with preorder # to tuples')
+    parent = [None] * num_taxa
+    next_sib = [None] * num_taxa
+    first_child = [None] * num_taxa
+    last_child = [None] * num_taxa
+    for n in range(1, num_taxa):
+        p = ott_id2preorder[id2par[preorder_list[n]]]
+        parent[n] = p
+        prev = last_child[p]
+        if prev is None:
+            first_child[p] = n
+        else:
+            next_sib[prev] = n
+        last_child[p] = n
+    preorder2tuples = {}
+    for n in range(num_taxa):
+        fc = first_child[n]
+        if fc is None:
+            preorder2tuples[n] = (parent[n], next_sib[n])
+        else:
+            preorder2tuples[n] = (parent[n], next_sib[n], fc, last_child[n])
+    preorder2tuples['root'] = 0
+    _write_pickle(out_dir, 'preorder2tuple', preorder2tuples)
+    return preorder_list
+
+
 def make_ott_to_children(id2par):
     ott2children = {}
     empty_tuple = tuple()
@@ -942,6 +1360,83 @@ class TaxonomyDes2AncLineage(object):
         return 'TaxonomyDes2AncLineage({l})'.format(l=repr(self._des_to_anc_list))
 
 
+def create_induced_tree_by_preorder(store, lca_index, ott_id_list, create_monotypic_nodes=False,
+                                    _class=TreeWithPathsInEdges):
+    """Returns the same tree as create_tree_from_id2par(ott_id2par, ott_id_list), with the
+    children of each node in preorder, without modifying `ott_id_list`.
+    The IDs are sorted by their preorder number in `store` (an OTTTaxonomyStore), and the
+    LCAs of adjacent IDs (from `lca_index`) are added. That set is closed under LCA, so the
+    parent of each node is the nearest ancestor on a stack of the nodes seen so far (the
+    "virtual tree" construction). Unless `create_monotypic_nodes` is True, out-degree-1
+    nodes (other than the root) are merged into the path of their child, as is done by
+    create_tree_from_id2par. The cost is O(k log k) for k IDs plus the number of taxa
+    in the paths of the induced tree.
+    Raises KeyError for an ID that is not in the taxonomy.
+    """
+    pre = sorted(set(store.preorder_numbers(ott_id_list, required=True)))
+    if not pre:
+        return None
+    ott_id_at = store.ott_id_at
+    tree = _class()
+    if len(pre) == 1:
+        tree._root = tree.create_leaf(ott_id_at(pre[0]))
+        return tree
+    virtual = sorted(set(pre).union(lca_index.adjacent_lca_preorders(pre)))
+    last_des = store.array('last_des')
+    parent = store.array('parent')
+    if is_large_batch(len(virtual), len(store)):
+        last_des, parent = last_des.tolist(), parent.tolist()
+        ott_id_at = store.array('ott_id').tolist().__getitem__
+    # virtual parent and number of virtual children of each virtual node
+    v_par = {}
+    num_children = dict((v, 0) for v in virtual)
+    stack = []
+    for v in virtual:
+        while stack and v > last_des[stack[-1]]:
+            stack.pop()
+        if stack:
+            v_par[v] = stack[-1]
+            num_children[stack[-1]] += 1
+        stack.append(v)
+    root = virtual[0]
+    tree._root = tree._new_node(_id=ott_id_at(root))
+    # node_for maps a virtual node to the tree node that it is in (or below, for a merged node),
+    #   and kept_for to the preorder # of that tree node
+    node_for = {root: tree._root}
+    kept_for = {root: root}
+    for v in virtual[1:]:
+        u = v_par[v]
+        if create_monotypic_nodes:
+            chain = []
+            p = v
+            while p != u:
+                chain.append(p)
+                p = parent[p]
+            par_node = node_for[u]
+            for p in reversed(chain):
+                n = tree._new_node(_id=ott_id_at(p), path_ids=[ott_id_at(p)])
+                par_node.add_child(n)
+                par_node = n
+            node_for[v] = par_node
+            continue
+        # nodes with one child are merged into the path of their child
+        anc, anc_pn = node_for[u], kept_for[u]
+        if num_children[v] == 1:
+            node_for[v], kept_for[v] = anc, anc_pn
+            continue
+        path_ids = []
+        p = v
+        while p != anc_pn:
+            path_ids.append(ott_id_at(p))
+            p = parent[p]
+        n = tree._new_node(_id=path_ids[0], path_ids=path_ids)
+        anc.add_child(n)
+        node_for[v], kept_for[v] = n, v
+    for nd in tree.postorder_node_iter():
+        tree._register_node(nd)
+    return tree
+
+
 def create_pruned_and_taxonomy_for_tip_ott_ids(tree_proxy, ott, create_monotypic_nodes=False):
     """returns a pair of trees:
         the first is that is a pruned version of tree_proxy created by pruning
@@ -972,7 +1467,8 @@ def create_pruned_and_taxonomy_for_tip_ott_ids(tree_proxy, ott, create_monotypic
                 ott_id_2_otu_par[node._id] = parent_id
             else:
                 ott_id_2_otu_par[node._id] = None
-    pruned_phylo = create_tree_from_id2par(ott_id_2_otu_par, ott_ids, create_monotypic_nodes=create_monotypic_nodes)
+    pruned_phylo = create_tree_from_id2par(ott_id_2_otu_par, list(ott_ids),
+                                           create_monotypic_nodes=create_monotypic_nodes)
     taxo_tree = ott.induced_tree(ott_ids)
     return pruned_phylo, taxo_tree
 
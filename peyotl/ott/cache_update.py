@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""Diffs the files of a new OTT release against the cached tables of an older
+release, and patches copies of the tables that are affected by the changes.
+
+Parsing the new taxonomy.tsv is unavoidable, but it is streamed and compared row
+by row against the old tables, so the new version is never materialized as a
+second full set of dicts. Name inversion is only redone for the names that the
+changes touch, and the new preorder is spliced from the old one (see patch_preorder).
+The patched tables are still pickled (and the taxonomy store written) whole, because
+those files can not be modified in place.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.str_util import is_str_type
+from peyotl.utility import get_logger
+from bisect import bisect_right
+
+_LOG = get_logger(__name__)
+
+# tables written by OTT._create_pickle_files (in addition to the taxonomy store)
+PATCHABLE_TABLES = ('ottID2parentOttId', 'ottID2names', 'name2ottID', 'homonym2ottID', 'nonhomonym2ottID',
+                    'ottID2uniq', 'uniq2ottID', 'ottID2ranks', 'ottID2sources', 'taxonomicSources',
+                    'ottID2flags', 'flagSetID2FlagSet', 'forwardingTable', 'root')
+PREORDER_TABLES = ('ottID2preorder', 'preorder2ottID', 'preorder2tuple')
+
+
+def _names_tuple(v):
+    if v is None:
+        return tuple()
+    if is_str_type(v):
+        return (v,)
+    return tuple(v)
+
+
+def _flag_list(flag_set):
+    if not flag_set:
+        return []
+    return sorted(flag_set)
+
+
+def _remove_from_name_map(name2id, name, ott_id):
+    prev = name2id.get(name)
+    if prev is None:
+        return
+    if isinstance(prev, tuple):
+        rem = tuple(i for i in prev if i != ott_id)
+        if len(rem) == 1:
+            name2id[name] = rem[0]
+        elif rem:
+            name2id[name] = rem
+        else:
+            del name2id[name]
+    elif prev == ott_id:
+        del name2id[name]
+
+
+def _add_to_name_map(name2id, name, ott_id):
+    prev = name2id.get(name)
+    if prev is None:
+        name2id[name] = ott_id
+    elif isinstance(prev, tuple):
+        if ott_id not in prev:
+            name2id[name] = prev + (ott_id,)
+    elif prev != ott_id:
+        name2id[name] = (prev, ott_id)
+
+
+class OTTCachePatch(object):
+    """Accumulates the differences between an old OTT cache and a new release.
+    `load_table` is a callable that returns an (unmodified) table of the old cache by name.
+    Tables are copied the first time that they are modified, so the old tables (which
+    may be shared with other OTT instances) are never mutated.
+    """
+
+    def __init__(self, load_table, old_version, new_version):
+        self._load_table = load_table
+        self._tables = {}
+        self.changed_tables = set()
+        self.topology_changed = False
+        self.primary_names_changed = False
+        self.flags_changed = False
+        self._names_affected = set()
+        self._new_primary = {}
+        self.change_log = {'old_version': old_version,
+                           'new_version': new_version,
+                           'added': [],
+                           'removed': [],
+                           'reparented': [],
+                           'renamed': [],
+                           'rank_changed': [],
+                           'uniqname_changed': [],
+                           'flags_changed': [],
+                           'sources_changed': [],
+                           'synonyms_added': [],
+                           'synonyms_removed': [],
+                           'forwards_added': {},
+                           'forwards_removed': {},
+                           'forwards_changed': {},
+                           }
+
+    def table(self, name):
+        t = self._tables.get(name)
+        if t is None:
+            t = self._load_table(name)
+            self._tables[name] = t
+        return t
+
+    def writable(self, name):
+        """Returns a private copy of the table `name` that can be modified."""
+        if name not in self.changed_tables:
+            t = self.table(name)
+            t = dict(t) if isinstance(t, dict) else set(t)
+            self._tables[name] = t
+            self.changed_tables.add(name)
+        return self._tables[name]
+
+    def _set_or_del(self, table_name, key, value):
+        if value:
+            self.writable(table_name)[key] = value
+        else:
+            self.writable(table_name).pop(key, None)
+
+    def _flag_set_key(self, f_list):
+        if not f_list:
+            return None
+        f_set = frozenset(f_list)
+        fsid2fs = self.table('flagSetID2FlagSet')
+        for k, v in fsid2fs.items():
+            if v == f_set:
+                return k
+        fsid2fs = self.writable('flagSetID2FlagSet')
+        k = 1 + max(fsid2fs.keys()) if fsid2fs else 0
+        fsid2fs[k] = f_set
+        return k
+
+    def diff_taxonomy(self, rows):
+        """`rows` is an iterable of parsed taxonomy.tsv rows (see taxonomy_parser.parse_taxonomy_chunk)"""
+        cl = self.change_log
+        id2par = self.table('ottID2parentOttId')
+        id2names = self.table('ottID2names')
+        id2rank = self.table('ottID2ranks')
+        id2uniq = self.table('ottID2uniq')
+        id2flag = self.table('ottID2flags')
+        fsid2fs = self.table('flagSetID2FlagSet')
+        id2source = self.table('ottID2sources')
+        seen = set()
+        new_root = None
+        for uid, par, name, rank, source, uniqname, f_list in rows:
+            seen.add(uid)
+            if par is None:
+                new_root = (name, uid)
+            is_new = uid not in id2par
+            if is_new:
+                cl['added'].append({'ott_id': uid, 'parent': par, 'name': name})
+                self.writable('ottID2parentOttId')[uid] = par
+                self.topology_changed = True
+                self._new_primary[uid] = name
+                self._names_affected.add(uid)
+                self.primary_names_changed = True
+            else:
+                old_par = id2par[uid]
+                if old_par != par:
+                    cl['reparented'].append({'ott_id': uid, 'old_parent': old_par, 'new_parent': par})
+                    self.writable('ottID2parentOttId')[uid] = par
+                    self.topology_changed = True
+                old_name = _names_tuple(id2names.get(uid))[0]
+                if old_name != name:
+                    cl['renamed'].append({'ott_id': uid, 'old_name': old_name, 'new_name': name})
+                    self._new_primary[uid] = name
+                    self._names_affected.add(uid)
+                    self.primary_names_changed = True
+            old_rank = None if is_new else id2rank.get(uid)
+            if (old_rank or None) != (rank or None):
+                if not is_new:
+                    cl['rank_changed'].append({'ott_id': uid, 'old_rank': old_rank, 'new_rank': rank or None})
+                self._set_or_del('ottID2ranks', uid, rank)
+            old_uniq = None if is_new else id2uniq.get(uid)
+            if (old_uniq or None) != (uniqname or None):
+                if not is_new:
+                    cl['uniqname_changed'].append({'ott_id': uid, 'old_uniqname': old_uniq,
+                                                   'new_uniqname': uniqname or None})
+                self._set_or_del('ottID2uniq', uid, uniqname)
+                u2i = self.writable('uniq2ottID')
+                if old_uniq and u2i.get(old_uniq) == uid:
+                    del u2i[old_uniq]
+                if uniqname:
+                    u2i[uniqname] = uid
+            old_fsi = None if is_new else id2flag.get(uid)
+            old_flags = _flag_list(fsid2fs.get(old_fsi)) if old_fsi is not None else []
+            new_flags = _flag_list(f_list)
+            if old_flags != new_flags:
+                if not is_new:
+                    cl['flags_changed'].append({'ott_id': uid, 'old_flags': old_flags, 'new_flags': new_flags})
+                self._set_or_del('ottID2flags', uid, self._flag_set_key(new_flags))
+                self.flags_changed = True
+            old_source = None if is_new else id2source.get(uid)
+            if (old_source or None) != (source or None):
+                if not is_new:
+                    cl['sources_changed'].append({'ott_id': uid, 'old_sources': old_source,
+                                                  'new_sources': source or None})
+                self._set_or_del('ottID2sources', uid, source)
+        for uid in id2par.keys():
+            if uid not in seen:
+                self._remove_taxon(uid)
+        new_id2par = self.table('ottID2parentOttId')
+        for uid, par in new_id2par.items():
+            if par is not None and par not in new_id2par:
+                raise ValueError('parent {} of {} not found in OTT parsing'.format(par, uid))
+        if 'ottID2sources' in self.changed_tables:
+            srcs = set()
+            for v in self.table('ottID2sources').values():
+                srcs.update(v.keys())
+            if srcs != self.table('taxonomicSources'):
+                self.writable('taxonomicSources')
+                self._tables['taxonomicSources'] = srcs
+        old_root = self.table('root')
+        if new_root is None:
+            raise ValueError('No root found in the new taxonomy')
+        if (old_root['name'], old_root['ott_id']) != new_root:
+            self.changed_tables.add('root')
+            self._tables['root'] = {'name': new_root[0], 'ott_id': new_root[1]}
+
+    def _remove_taxon(self, uid):
+        self.change_log['removed'].append(uid)
+        self.topology_changed = True
+        self.primary_names_changed = True
+        self._names_affected.add(uid)
+        for table_name in ('ottID2parentOttId', 'ottID2ranks', 'ottID2flags', 'ottID2sources'):
+            if uid in self.table(table_name):
+                del self.writable(table_name)[uid]
+        old_uniq = self.table('ottID2uniq').get(uid)
+        if old_uniq is not None:
+            del self.writable('ottID2uniq')[uid]
+            if self.table('uniq2ottID').get(old_uniq) == uid:
+                del self.writable('uniq2ottID')[old_uniq]
+
+    def diff_synonyms(self, syn_rows):
+        """`syn_rows` is an iterable of (name, uid) from the new synonyms.tsv. Must be
+        called after diff_taxonomy. Updates ottID2names and the name -> ID tables."""
+        id2par = self.table('ottID2parentOttId')
+        id2names = self.table('ottID2names')
+        new_syn = {}
+        for name, uid in syn_rows:
+            if uid in id2par:
+                new_syn.setdefault(uid, []).append(name)
+        cl = self.change_log
+        candidates = set(new_syn.keys())
+        for uid, v in id2names.items():
+            if not is_str_type(v):
+                candidates.add(uid)
+        for uid in candidates:
+            if uid not in id2par:
+                continue  # removed taxa are handled below
+            old_syns = list(_names_tuple(id2names.get(uid))[1:])
+            syns = new_syn.get(uid, [])
+            if old_syns != syns:
+                self._names_affected.add(uid)
+                for n in syns:
+                    if n not in old_syns:
+                        cl['synonyms_added'].append({'ott_id': uid, 'name': n})
+                for n in old_syns:
+                    if n not in syns:
+                        cl['synonyms_removed'].append({'ott_id': uid, 'name': n})
+        if not self._names_affected:
+            return
+        id2names = self.writable('ottID2names')
+        name2id = self.writable('name2ottID')
+        affected_names = set()
+        for uid in self._names_affected:
+            old_names = _names_tuple(id2names.get(uid))
+            for n in old_names:
+                _remove_from_name_map(name2id, n, uid)
+            affected_names.update(old_names)
+            if uid not in id2par:
+                id2names.pop(uid, None)
+                continue
+            primary = self._new_primary.get(uid)
+            if primary is None:
+                primary = old_names[0]
+            syns = new_syn.get(uid)
+            new_names = tuple([primary] + syns) if syns else (primary,)
+            id2names[uid] = new_names if syns else primary
+            for n in new_names:
+                _add_to_name_map(name2id, n, uid)
+            affected_names.update(new_names)
+        homonym2id = self.writable('homonym2ottID')
+        nonhomonym2id = self.writable('nonhomonym2ottID')
+        for name in affected_names:
+            homonym2id.pop(name, None)
+            nonhomonym2id.pop(name, None)
+            ott_ids = name2id.get(name)
+            if ott_ids is None:
+                continue
+            if isinstance(ott_ids, tuple) and len(ott_ids) > 1:
+                homonym2id[name] = ott_ids
+            else:
+                nonhomonym2id[name] = ott_ids
+
+    def diff_forwards(self, new_forward_table):
+        old = self.table('forwardingTable')
+        cl = self.change_log
+        for k, v in new_forward_table.items():
+            if k not in old:
+                cl['forwards_added'][k] = v
+            elif old[k] != v:
+                cl['forwards_changed'][k] = [old[k], v]
+        for k, v in old.items():
+            if k not in new_forward_table:
+                cl['forwards_removed'][k] = v
+        if cl['forwards_added'] or cl['forwards_changed'] or cl['forwards_removed']:
+            self.changed_tables.add('forwardingTable')
+            self._tables['forwardingTable'] = new_forward_table
+
+    def finish_change_log(self):
+        cl = self.change_log
+        counts = {}
+        for k, v in cl.items():
+            if isinstance(v, (list, dict)):
+                counts[k] = len(v)
+        cl['counts'] = counts
+        cl['changed_tables'] = sorted(self.changed_tables)
+        cl['topology_changed'] = self.topology_changed
+        return cl
+
+
+def patch_preorder(store, id2par, moved, removed):
+    """Returns the list of OTT IDs in preorder for the new topology, by splicing the preorder
+    of the old taxonomy `store` (see peyotl.ott.taxonomy_store), rather than numbering the
+    whole new tree. `id2par` is the new ID -> parent ID dict, `moved` the IDs that were added
+    or re-parented, and `removed` the IDs that were removed. The root must not have changed.
+    The old preorder is copied in slices. Removed taxa and the subtrees of moved taxa are cut
+    out, and each moved subtree is put after the last descendant of its new parent. So the
+    python-level work is proportional to the number of changes (plus the depth of nested moves).
+    """
+    old_ott_ids = store.array('ott_id').tolist()
+    last_des = store.array('last_des')
+    attach = {}  # new parent ID -> list of moved IDs
+    ranges = []  # (old first preorder #, old last preorder #, ID) of the moved taxa that are not new
+    for ott_id in moved:
+        attach.setdefault(id2par[ott_id], []).append(ott_id)
+        p = store.preorder_number(ott_id)
+        if p is not None:
+            ranges.append((p, last_des[p], ott_id))
+    ranges.sort()
+    # enclosing[i] is the index of the innermost range that contains range i (-1 for none)
+    starts, enclosing, stack = [], [], []
+    for i, (first, last, _) in enumerate(ranges):
+        while stack and ranges[stack[-1]][1] < first:
+            stack.pop()
+        enclosing.append(stack[-1] if stack else -1)
+        stack.append(i)
+        starts.append(first)
+
+    def _owner(p):
+        """index of the innermost moved range that holds old preorder # p (-1 for the root's)"""
+        i = bisect_right(starts, p) - 1
+        while i >= 0 and ranges[i][1] < p:
+            i = enclosing[i]
+        return i
+
+    # events of each block (-1 for the block of the root, i for ranges[i]):
+    #   (first, 0, last) cuts out [first, last], and (last_des, 1, -p, ID) attaches the moved
+    #   children of ID (at preorder # p) after its last descendant (deeper taxa first)
+    events = {}
+    for i, (first, last, _) in enumerate(ranges):
+        events.setdefault(enclosing[i], []).append((first, 0, last))
+    for ott_id in removed:
+        p = store.preorder_number(ott_id)
+        events.setdefault(_owner(p), []).append((p, 0, p))
+    for par_id in attach.keys():
+        p = store.preorder_number(par_id)
+        if p is not None:
+            events.setdefault(_owner(p), []).append((last_des[p], 1, -p, par_id))
+
+    def _block_steps(i):
+        """list of slices of the old preorder to copy and of moved IDs to emit for block i"""
+        if i < 0:
+            c, end = 0, len(old_ott_ids) - 1
+        else:
+            c, end = ranges[i][0], ranges[i][1]
+        steps = []
+        for ev in sorted(events.get(i, ())):
+            if ev[1] == 0:
+                if ev[0] > c:
+                    steps.append((c, ev[0]))
+                c = ev[2] + 1
+            else:
+                if ev[0] >= c:
+                    steps.append((c, ev[0] + 1))
+                    c = ev[0] + 1
+                steps.extend(attach[ev[3]])
+        if end >= c:
+            steps.append((c, end + 1))
+        return steps
+
+    range_index = dict((r[2], i) for i, r in enumerate(ranges))
+    preorder = []
+    step_iters = [iter(_block_steps(-1))]
+    while step_iters:
+        for step in step_iters[-1]:
+            if isinstance(step, tuple):
+                preorder.extend(old_ott_ids[step[0]:step[1]])
+            else:
+                i = range_index.get(step)
+                if i is None:  # a new taxon
+                    preorder.append(step)
+                    step_iters.append(iter(attach.get(step, ())))
+                else:
+                    step_iters.append(iter(_block_steps(i)))
+            break
+        else:
+            step_iters.pop()
+    if len(preorder) != len(id2par):
+        raise ValueError('Patched preorder has {} taxa, but the taxonomy has {}'.format(len(preorder), len(id2par)))
+    return preorder
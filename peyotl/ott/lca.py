@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Binary-lifting index for lowest common ancestor (MRCA) queries on the OTT taxonomy.
+
+The index is built from the taxonomy store (see peyotl.ott.taxonomy_store) and holds,
+for k = 1 ... K-1, the section 'up<k>' mapping a preorder # to the preorder # of
+its 2^k-th ancestor (-1 if the taxon is not that deep). Level 0 is the 'parent'
+array of the store. K is the number of bits needed for the depth of the taxonomy,
+so the index is small (the taxonomy is shallow) and a pairwise query takes
+O(log depth) steps.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.ott.taxonomy_store import is_large_batch
+from peyotl.utility.array_file import ArrayFile, write_array_file
+from peyotl.utility import get_logger
+
+_LOG = get_logger(__name__)
+LCA_INDEX_MAGIC = b'OTTLCA'
+LCA_INDEX_VERSION = 1
+
+
+def write_lca_index(filepath, store):
+    """Writes the binary-lifting tables for the OTTTaxonomyStore `store` to `filepath`"""
+    parent = store.array('parent').tolist()
+    num_taxa = len(parent)
+    depth = [0] * num_taxa
+    for n in range(1, num_taxa):
+        depth[n] = depth[parent[n]] + 1
+    max_depth = max(depth) if depth else 0
+    num_levels = max(1, max_depth.bit_length())
+    sections = []
+    prev = parent
+    for k in range(1, num_levels):
+        curr = [-1] * num_taxa
+        for n in range(num_taxa):
+            a = prev[n]
+            if a >= 0:
+                curr[n] = prev[a]
+        sections.append(('up{:d}'.format(k), 'i', curr))
+        prev = curr
+    sections.append(('depth', 'i', depth))
+    _LOG.debug('Creating "{p}" with {k:d} levels'.format(p=filepath, k=num_levels))
+    write_array_file(filepath, sections, LCA_INDEX_MAGIC, version=LCA_INDEX_VERSION)
+
+
+class OTTLCAIndex(object):
+    """Answers MRCA queries using an OTTTaxonomyStore and the tables written by write_lca_index."""
+
+    def __init__(self, filepath, store):
+        self.filepath = filepath
+        self._store = store
+        self._af = ArrayFile(filepath, magic=LCA_INDEX_MAGIC)
+        self.version = self._af.version
+        self._parent = store.array('parent')
+        self._last_des = store.array('last_des')
+        self._depth = self._af.array('depth')
+        self._up = [self._parent]
+        k = 1
+        while self._af.has_section('up{:d}'.format(k)):
+            self._up.append(self._af.array('up{:d}'.format(k)))
+            k += 1
+        self._up_desc = list(reversed(self._up))
+
+    def depth(self, ott_id):
+        """Number of edges between `ott_id` and the root of the taxonomy."""
+        return self._depth[self._store._req_preorder_number(ott_id)]
+
+    def lca_preorder(self, u, v):
+        """Returns the preorder # of the LCA of the taxa with preorder numbers `u` and `v`"""
+        if u > v:
+            u, v = v, u
+        last_des = self._last_des
+        if v <= last_des[u]:
+            return u
+        # u is not an ancestor of v. Lift u to the highest ancestor that is still
+        #   not an ancestor of v. Ancestors of u precede it in preorder, so
+        #   testing `v <= last_des[a]` is sufficient.
+        for up in self._up_desc:
+            a = up[u]
+            if a >= 0 and last_des[a] < v:
+                u = a
+        return self._parent[u]
+
+    def adjacent_lca_preorders(self, preorder_numbers):
+        """Returns the list of preorder #s of the LCAs of each adjacent pair of the sorted
+        list `preorder_numbers`. For a large batch, the parent array is copied into a list and
+        each LCA is found by walking up from the later taxon of the pair. No taxon is passed by
+        more than one of those walks, so the cost is bounded by the size of the induced tree.
+        """
+        if not is_large_batch(len(preorder_numbers), len(self._parent)):
+            lca = self.lca_preorder
+            return [lca(preorder_numbers[i - 1], v) for i, v in enumerate(preorder_numbers) if i > 0]
+        parent = self._parent.tolist()
+        r = []
+        for i in range(1, len(preorder_numbers)):
+            u, p = preorder_numbers[i - 1], preorder_numbers[i]
+            while p > u:
+                p = parent[p]
+            r.append(p)
+        return r
+
+    def mrca_preorder(self, preorder_numbers):
+        """The MRCA of a set of taxa is the LCA of the taxa with the min and max preorder #"""
+        if not preorder_numbers:
+            raise ValueError('MRCA requires at least one taxon')
+        return self.lca_preorder(min(preorder_numbers), max(preorder_numbers))
+
+    def mrca(self, ott_ids):
+        """Returns the OTT ID of the MRCA of the OTT IDs in `ott_ids` (KeyError for unknown IDs)."""
+        rpn = self._store._req_preorder_number
+        p = self.mrca_preorder([rpn(i) for i in ott_ids])
+        return self._store.ott_id_at(p)
+
+    def close(self):
+        self._af.close()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""Memory-mapped index of the names and synonyms of the OTT taxonomy for local name
+matching (exact, homonym and prefix/autocomplete queries) without the taxomachine services.
+
+Names are compared by their normalized key (see normalize_name). The index holds the
+sorted, distinct keys and, for each key, the list of matches (every taxon that has a
+name or synonym with that key):
+    'key_offset' key # -> start of the key in 'key_heap' (key # i is the utf-8 bytes
+        [key_offset[i], key_offset[i + 1]) of 'key_heap'). Keys are sorted bytewise, so
+        the keys that start with a prefix are a contiguous run.
+    'key_heap' utf-8 encoded keys
+    'match_start' key # -> first match of the key (the matches of key # i are
+        [match_start[i], match_start[i + 1]) )
+    'match_ott_id' match # -> OTT ID
+    'match_synonym' match # -> 1 if the matched name is a synonym (not the taxon's name)
+    'name_offset' and 'name_heap' match # -> the name (as it is spelled in the taxonomy)
+Within a key, the matches are ordered with the taxon names before synonyms and then by OTT ID.
+A match is returned as a tuple (OTT ID, matched name, is_synonym).
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.ott.taxonomy_store import is_large_batch
+from peyotl.utility.array_file import ArrayFile, int_typecode_for_range, write_array_file
+from peyotl.utility.str_util import is_str_type, UNICODE
+from peyotl.utility import get_logger
+from bisect import bisect_left
+import unicodedata
+
+_LOG = get_logger(__name__)
+NAME_INDEX_MAGIC = b'OTTNAMES'
+NAME_INDEX_VERSION = 1
+
+
+def normalize_name(name):
+    """Returns the key used to compare names: accents and other combining marks are
+    stripped (after NFKD decomposition), case is folded and runs of whitespace become
+    a single space. So u'M\\xfcller\\'s  Honeybee' -> u"muller's honeybee"."""
+    if not isinstance(name, UNICODE):
+        name = name.decode('utf-8')
+    d = unicodedata.normalize('NFKD', name)
+    s = u''.join(c for c in d if not unicodedata.combining(c))
+    try:
+        s = s.casefold()
+    except AttributeError:  # python 2
+        s = s.lower()
+    return u' '.join(s.split())
+
+
+def _key_bytes(name):
+    return normalize_name(name).encode('utf-8')
+
+
+def write_name_index(filepath, id2name):
+    """Writes the index to `filepath`. `id2name` maps an OTT ID to a name or a tuple
+    of names (the first is the name of the taxon, the rest are synonyms)."""
+    entries = set()
+    for ott_id, names in id2name.items():
+        if is_str_type(names):
+            names = (names,)
+        for n, name in enumerate(names):
+            entries.add((_key_bytes(name), 0 if n == 0 else 1, ott_id, name))
+    entries = sorted(entries)
+    keys, key_offset, match_start = [], [0], []
+    ott_ids, synonym, encoded_names, name_offset = [], bytearray(len(entries)), [], [0]
+    curr_key, key_heap_len, name_heap_len = None, 0, 0
+    for n, (key, is_syn, ott_id, name) in enumerate(entries):
+        if key != curr_key:
+            curr_key = key
+            keys.append(key)
+            key_heap_len += len(key)
+            key_offset.append(key_heap_len)
+            match_start.append(n)
+        ott_ids.append(ott_id)
+        synonym[n] = is_syn
+        b = name.encode('utf-8')
+        encoded_names.append(b)
+        name_heap_len += len(b)
+        name_offset.append(name_heap_len)
+    match_start.append(len(entries))
+    id_tc = int_typecode_for_range(min(ott_ids), max(ott_ids)) if ott_ids else 'i'
+    key_tc = 'I' if key_heap_len < (1 << 32) else 'Q'
+    name_tc = 'I' if name_heap_len < (1 << 32) else 'Q'
+    sections = [('key_offset', key_tc, key_offset),
+                ('key_heap', 'B', b''.join(keys)),
+                ('match_start', 'I', match_start),
+                ('match_ott_id', id_tc, ott_ids),
+                ('match_synonym', 'B', synonym),
+                ('name_offset', name_tc, name_offset),
+                ('name_heap', 'B', b''.join(encoded_names))]
+    _LOG.debug('Creating "{p}" with {k:d} keys for {m:d} names'.format(p=filepath, k=len(keys), m=len(entries)))
+    write_array_file(filepath, sections, NAME_INDEX_MAGIC, version=NAME_INDEX_VERSION)
+
+
+class OTTNameIndex(object):
+    """Read-only view of a name index file (see write_name_index)."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._af = ArrayFile(filepath, magic=NAME_INDEX_MAGIC)
+        self.version = self._af.version
+        if self.version != NAME_INDEX_VERSION:
+            return  # caller should check version and rebuild the index.
+        self._key_offset = self._af.array('key_offset')
+        self._match_start = self._af.array('match_start')
+        self._match_ott_id = self._af.array('match_ott_id')
+        self._match_synonym = self._af.array('match_synonym')
+        self._name_offset = self._af.array('name_offset')
+        self._num_keys = len(self._key_offset) - 1
+
+    def __len__(self):
+        """Number of distinct keys"""
+        return self._num_keys
+
+    @property
+    def nbytes(self):
+        return self._af.nbytes
+
+    def _key_at(self, i):
+        return self._af.raw_bytes('key_heap', self._key_offset[i], self._key_offset[i + 1])
+
+    def _all_keys(self):
+        offsets = self._key_offset.tolist()
+        heap = self._af.raw_bytes('key_heap', 0, offsets[-1])
+        return [heap[offsets[i]:offsets[i + 1]] for i in range(self._num_keys)]
+
+    def _bisect(self, key):
+        lo, hi = 0, self._num_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _matches(self, key_num):
+        r = []
+        for m in range(self._match_start[key_num], self._match_start[key_num + 1]):
+            name = self._af.raw_bytes('name_heap', self._name_offset[m], self._name_offset[m + 1]).decode('utf-8')
+            r.append((self._match_ott_id[m], name, self._match_synonym[m] == 1))
+        return r
+
+    def lookup(self, name):
+        """Returns the list of matches for the names and synonyms with the same key as `name`
+        (more than one OTT ID for a homonym, [] if there are no matches)."""
+        key = _key_bytes(name)
+        i = self._bisect(key)
+        if i < self._num_keys and self._key_at(i) == key:
+            return self._matches(i)
+        return []
+
+    def lookup_many(self, names):
+        """Returns a list with the matches (see lookup) of each element of `names`. For large
+        batches the keys are copied out of the file once, rather than once per binary search."""
+        names = list(names)
+        if not is_large_batch(len(names), self._num_keys):
+            return [self.lookup(i) for i in names]
+        keys = self._all_keys()
+        num_keys = self._num_keys
+        r = []
+        for name in names:
+            key = _key_bytes(name)
+            i = bisect_left(keys, key)
+            r.append(self._matches(i) if i < num_keys and keys[i] == key else [])
+        return r
+
+    def prefix_search(self, prefix, limit=None):
+        """Returns the matches for the keys that start with the normalized `prefix` (in the
+        sorted order of the keys), at most `limit` of them if `limit` is not None."""
+        key = _key_bytes(prefix)
+        r = []
+        i = self._bisect(key)
+        while i < self._num_keys and (limit is None or len(r) < limit):
+            if not self._key_at(i).startswith(key):
+                break
+            r.extend(self._matches(i))
+            i += 1
+        if limit is not None:
+            del r[limit:]
+        return r
+
+    def close(self):
+        self._af.close()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Process-wide registry of loaded OTT cache tables.
+
+Tables are keyed by (absolute OTT directory, OTT version) and by table name, so
+every OTT instance for the same taxonomy in a process shares a single copy of
+each table. Tables that are loaded before a process forks are shared with the
+child processes copy-on-write; the memory-mapped stores are shared through the
+OS page cache regardless of when they are opened.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility import get_logger
+import threading
+import sys
+import os
+
+_LOG = get_logger(__name__)
+
+
+class OTTTableRegistry(object):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables = {}
+
+    @staticmethod
+    def key_for(ott_dir, version):
+        return os.path.abspath(ott_dir), version
+
+    def get(self, key, name, loader):
+        """Returns the table `name` for `key`, calling `loader()` to create it if it
+        has not been loaded in this process."""
+        with self._lock:
+            d = self._tables.setdefault(key, {})
+            if name in d:
+                return d[name]
+            _LOG.debug('loading table "{n}" for {k}'.format(n=name, k=key))
+            obj = loader()
+            # loader may have rebuilt the caches (which discards the old dict for `key`)
+            self._tables.setdefault(key, {})[name] = obj
+            return obj
+
+    def put(self, key, name, obj):
+        with self._lock:
+            self._tables.setdefault(key, {})[name] = obj
+
+    def loaded_tables(self, key):
+        with self._lock:
+            return dict(self._tables.get(key, {}))
+
+    def discard(self, key=None):
+        """Forgets the tables for `key` (or all tables if `key` is None). Objects that are
+        still referenced by OTT instances stay alive until those instances are released."""
+        with self._lock:
+            if key is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(key, None)
+
+    def memory_usage(self, key=None):
+        """Returns a dict of {key: {table name: approximate # of bytes}}. Memory-mapped
+        stores report the size of the mapping (which is shared between processes)."""
+        with self._lock:
+            if key is None:
+                items = list(self._tables.items())
+            else:
+                items = [(key, self._tables.get(key, {}))]
+        return {k: dict((name, approx_sizeof(obj)) for name, obj in d.items()) for k, d in items}
+
+
+def approx_sizeof(obj):
+    """Approximate deep size (in bytes) of the builtin containers used in the OTT pickles."""
+    nbytes = getattr(obj, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        i = id(o)
+        if i in seen:
+            continue
+        seen.add(i)
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+    return total
+
+
+OTT_TABLE_REGISTRY = OTTTableRegistry()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""Chunked (and optionally multi-process) parsing of the OTT taxonomy.tsv and
+synonyms.tsv files for building the OTT caches.
+
+The files are read in large binary chunks that end on line boundaries. Each
+chunk is split into columns by a worker process (or in-process if only one
+worker is requested), and the parsed rows are yielded in file order.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.parallel import ordered_parallel_map
+from peyotl.utility import get_logger
+import time
+
+_LOG = get_logger(__name__)
+DEFAULT_CHUNK_SIZE = 1 << 23
+TAXONOMY_HEADER = b'uid\t|\tparent_uid\t|\tname\t|\trank\t|\tsourceinfo\t|\tuniqname\t|\tflags\t|\t\n'
+SYNONYMS_HEADER_PREFIX = b'name\t|\tuid\t|\ttype\t|\tuniqname'
+_SEP = b'\t|\t'
+
+
+class PhaseTimer(object):
+    """Records (and logs) the wall-clock time of successive phases of a job."""
+
+    def __init__(self, job_name):
+        self.job_name = job_name
+        self.timings = []
+        self._prev = time.time()
+
+    def end_phase(self, phase_name):
+        now = time.time()
+        elapsed = now - self._prev
+        self._prev = now
+        self.timings.append((phase_name, elapsed))
+        _LOG.info('{j}: "{p}" took {s:.2f} seconds'.format(j=self.job_name, p=phase_name, s=elapsed))
+        return elapsed
+
+    @property
+    def total(self):
+        return sum(i[1] for i in self.timings)
+
+
+def iter_line_chunks(fo, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields byte strings of roughly `chunk_size` read from the binary stream `fo`.
+    Every chunk (except, perhaps, the last) ends with a newline.
+    """
+    rem = b''
+    while True:
+        b = fo.read(chunk_size)
+        if not b:
+            if rem:
+                yield rem
+            return
+        if rem:
+            b = rem + b
+        i = b.rfind(b'\n')
+        if i < 0:
+            rem = b
+            continue
+        yield b[:i + 1]
+        rem = b[i + 1:]
+
+
+def parse_taxonomy_chunk(args):
+    """Worker function. `args` is (chunk, skip_prefixes).
+    Returns a list of (uid, parent_uid, name, rank, source_dict, uniqname, flag_tuple) for each row.
+    parent_uid is None for the root, source_dict and flag_tuple are None if those fields are empty.
+    Rows with a uniqname that starts with one of the `skip_prefixes` are omitted.
+    """
+    chunk, skip_prefixes = args
+    rows = []
+    for line in chunk.split(b'\n'):
+        if not line:
+            continue
+        ls = line.split(_SEP)
+        if len(ls) != 8 or ls[7].strip():
+            raise ValueError('Could not parse taxonomy line: {}'.format(repr(line)))
+        uniqname = ls[5].decode('utf-8')
+        if skip_prefixes and uniqname.startswith(skip_prefixes):
+            continue
+        par = ls[1]
+        par = int(par) if par else None
+        sourceinfo = ls[4]
+        if sourceinfo:
+            source = {}
+            for x in sourceinfo.decode('utf-8').split(','):
+                src, sid = x.split(':')
+                try:
+                    sid = int(sid)
+                except:
+                    pass
+                source[src] = sid
+        else:
+            source = None
+        flags = ls[6]
+        if flags:
+            f_list = flags.decode('utf-8').split(',')
+            f_list.sort()
+            flags = tuple(f_list)
+        else:
+            flags = None
+        rows.append((int(ls[0]), par, ls[2].decode('utf-8'), ls[3].decode('utf-8'), source, uniqname, flags))
+    return rows
+
+
+def parse_synonyms_chunk(chunk):
+    """Worker function. Returns a list of (name, uid) pairs."""
+    rows = []
+    for line in chunk.split(b'\n'):
+        if not line:
+            continue
+        ls = line.split(_SEP, 2)
+        rows.append((ls[0].decode('utf-8'), int(ls[1])))
+    return rows
+
+
+def iter_taxonomy_rows(filepath, skip_prefixes=None, num_workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Generator of the rows of taxonomy.tsv (see parse_taxonomy_chunk for the tuple layout)."""
+    skip_prefixes = tuple(skip_prefixes) if skip_prefixes else None
+    with open(filepath, 'rb') as fo:
+        first_line = fo.readline()
+        if first_line != TAXONOMY_HEADER:
+            raise ValueError('Unexpected header in "{}": {}'.format(filepath, repr(first_line)))
+        arg_it = ((c, skip_prefixes) for c in iter_line_chunks(fo, chunk_size))
+        for rows in ordered_parallel_map(parse_taxonomy_chunk, arg_it, num_workers):
+            for row in rows:
+                yield row
+
+
+def iter_synonym_rows(filepath, num_workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Generator of the (name, uid) pairs in synonyms.tsv"""
+    with open(filepath, 'rb') as fo:
+        first_line = fo.readline()
+        # modified to allow for final 'source column'
+        if not first_line.startswith(SYNONYMS_HEADER_PREFIX):
+            raise ValueError('Unexpected header in "{}": {}'.format(filepath, repr(first_line)))
+        for rows in ordered_parallel_map(parse_synonyms_chunk, iter_line_chunks(fo, chunk_size), num_workers):
+            for row in rows:
+                yield row
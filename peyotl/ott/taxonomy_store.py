@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""Compact, memory-mapped representation of the core of the OTT taxonomy.
+
+All of the per-taxon arrays are indexed by the preorder number of the taxon:
+    'ott_id' preorder # -> OTT ID
+    'parent' preorder # -> parent's preorder # (-1 for the root)
+    'last_des' preorder # -> preorder # of the last descendant of the taxon (the taxon
+        itself for a tip). So the subtree rooted at preorder # i is the interval
+        [i, last_des[i]], which makes ancestor tests a pair of integer comparisons.
+    'flag_set_id' preorder # -> key in the flagSetID2FlagSet dict (-1 for no flags)
+    'name_offset' preorder # -> start of the name in 'name_heap' (the name of
+        preorder # i is the utf-8 bytes [name_offset[i], name_offset[i + 1]) )
+    'name_heap' utf-8 encoded names
+    'sorted_ott_id' and 'sorted_pre' parallel arrays of OTT IDs sorted numerically and
+        the corresponding preorder numbers (for binary search lookup of an OTT ID).
+
+Pruning by flags uses a "prune mask": a bytearray indexed by preorder number that
+holds PRUNE_FLAGGED for taxa that carry one of the flags, PRUNE_INHERITED for the
+other members of their subtrees, and NOT_PRUNED for everything else.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.array_file import ArrayFile, int_typecode_for_range, write_array_file
+from peyotl.utility.str_util import is_str_type
+from peyotl.utility import get_logger
+from bisect import bisect_left
+import os
+
+_LOG = get_logger(__name__)
+TAXONOMY_STORE_MAGIC = b'OTTSTORE'
+TAXONOMY_STORE_VERSION = 2
+NO_FLAGS = -1
+NOT_PRUNED = 0
+PRUNE_FLAGGED = 1
+PRUNE_INHERITED = 2
+
+
+def is_large_batch(num_queries, num_taxa):
+    """True if `num_queries` binary searches (or other O(log n) lookups) in an array of `num_taxa`
+    items are likely to be slower than copying the array into a list (see preorder_numbers).
+    Copying costs much less per item than reading an item through an IntArrayView."""
+    return 8 * num_queries * max(1, num_taxa.bit_length()) >= num_taxa
+
+
+def write_taxonomy_store(filepath, preorder2ott_id, id2par, id2name, id2flag):
+    """Writes the store to `filepath`.
+    `preorder2ott_id` is a list of OTT IDs in preorder.
+    `id2par` maps an OTT ID to the OTT ID of its parent (None for the root)
+    `id2name` maps an OTT ID to a name or a tuple of names (the first is used).
+    `id2flag` maps an OTT ID to its flag set key (absent if the taxon has no flags).
+    """
+    num_taxa = len(preorder2ott_id)
+    ott_id2preorder = {}
+    for n, ott_id in enumerate(preorder2ott_id):
+        ott_id2preorder[ott_id] = n
+    parent = [-1] * num_taxa
+    flag_set_id = [NO_FLAGS] * num_taxa
+    name_offset = [0] * (num_taxa + 1)
+    encoded_names = []
+    curr_offset = 0
+    for n, ott_id in enumerate(preorder2ott_id):
+        par_id = id2par[ott_id]
+        if par_id is not None:
+            parent[n] = ott_id2preorder[par_id]
+        fsi = id2flag.get(ott_id)
+        if fsi is not None:
+            flag_set_id[n] = fsi
+        name = id2name.get(ott_id, u'')
+        if not is_str_type(name):
+            name = name[0]
+        b = name.encode('utf-8')
+        encoded_names.append(b)
+        curr_offset += len(b)
+        name_offset[n + 1] = curr_offset
+    name_heap = b''.join(encoded_names)
+    subtree_size = [1] * num_taxa
+    for n in range(num_taxa - 1, 0, -1):
+        subtree_size[parent[n]] += subtree_size[n]
+    last_des = [n + subtree_size[n] - 1 for n in range(num_taxa)]
+    sorted_ott_id = sorted(ott_id2preorder.keys())
+    sorted_pre = [ott_id2preorder[i] for i in sorted_ott_id]
+    id_tc = int_typecode_for_range(sorted_ott_id[0], sorted_ott_id[-1]) if sorted_ott_id else 'i'
+    heap_tc = 'I' if curr_offset < (1 << 32) else 'Q'
+    sections = [('ott_id', id_tc, preorder2ott_id),
+                ('parent', 'i', parent),
+                ('last_des', 'i', last_des),
+                ('flag_set_id', 'i', flag_set_id),
+                ('name_offset', heap_tc, name_offset),
+                ('name_heap', 'B', name_heap),
+                ('sorted_ott_id', id_tc, sorted_ott_id),
+                ('sorted_pre', 'i', sorted_pre)]
+    _LOG.debug('Creating "{p}"'.format(p=filepath))
+    write_array_file(filepath, sections, TAXONOMY_STORE_MAGIC, version=TAXONOMY_STORE_VERSION)
+
+
+class OTTTaxonomyStore(object):
+    """Read-only view of a taxonomy store file. Queries touch only the pages of
+    the file that they need, so no per-taxon python objects are created when
+    the store is opened.
+    """
+
+    def __init__(self, filepath):
+        if not os.path.exists(filepath):
+            raise ValueError('taxonomy store "{}" does not exist'.format(filepath))
+        self.filepath = filepath
+        self._af = ArrayFile(filepath, magic=TAXONOMY_STORE_MAGIC)
+        self.version = self._af.version
+        if self.version != TAXONOMY_STORE_VERSION:
+            return  # caller should check version and rebuild the store.
+        self._ott_id = self._af.array('ott_id')
+        self._parent = self._af.array('parent')
+        self._last_des = self._af.array('last_des')
+        self._flag_set_id = self._af.array('flag_set_id')
+        self._name_offset = self._af.array('name_offset')
+        self._sorted_ott_id = self._af.array('sorted_ott_id')
+        self._sorted_pre = self._af.array('sorted_pre')
+
+    def __len__(self):
+        return len(self._ott_id)
+
+    def __contains__(self, ott_id):
+        return self.preorder_number(ott_id) is not None
+
+    @property
+    def nbytes(self):
+        return self._af.nbytes
+
+    def array(self, name):
+        """Returns the preorder-indexed IntArrayView for the section `name` (e.g. 'parent')."""
+        return self._af.array(name)
+
+    @property
+    def root_ott_id(self):
+        return self._ott_id[0]
+
+    def preorder_number(self, ott_id):
+        """Returns the preorder number of `ott_id` or None if it is not in the taxonomy."""
+        s = self._sorted_ott_id
+        i = bisect_left(s, ott_id)
+        if i < len(s) and s[i] == ott_id:
+            return self._sorted_pre[i]
+        return None
+
+    def _req_preorder_number(self, ott_id):
+        p = self.preorder_number(ott_id)
+        if p is None:
+            raise KeyError('The OTT ID {} was not found'.format(ott_id))
+        return p
+
+    def preorder_numbers(self, ott_ids, required=False):
+        """Returns the list of preorder numbers of `ott_ids` (None for an ID that is not in the
+        taxonomy, or KeyError if `required` is True). For large batches the sorted ID array is
+        copied into a list once, so each binary search does not unpack items of the file.
+        """
+        ott_ids = list(ott_ids)
+        num_taxa = len(self._sorted_ott_id)
+        if not is_large_batch(len(ott_ids), num_taxa):
+            if required:
+                return [self._req_preorder_number(i) for i in ott_ids]
+            return [self.preorder_number(i) for i in ott_ids]
+        s = self._sorted_ott_id.tolist()
+        sorted_pre = self._sorted_pre.tolist()
+        r = []
+        for ott_id in ott_ids:
+            i = bisect_left(s, ott_id)
+            if i < num_taxa and s[i] == ott_id:
+                r.append(sorted_pre[i])
+            elif required:
+                raise KeyError('The OTT ID {} was not found'.format(ott_id))
+            else:
+                r.append(None)
+        return r
+
+    def ott_id_at(self, preorder_number):
+        return self._ott_id[preorder_number]
+
+    def parent_preorder_number(self, preorder_number):
+        return self._parent[preorder_number]
+
+    def name_at(self, preorder_number):
+        b = self._af.raw_bytes('name_heap',
+                               self._name_offset[preorder_number],
+                               self._name_offset[preorder_number + 1])
+        return b.decode('utf-8')
+
+    def get_name(self, ott_id):
+        p = self.preorder_number(ott_id)
+        if p is None:
+            return None
+        return self.name_at(p)
+
+    def get_parent(self, ott_id):
+        """Returns the OTT ID of the parent of `ott_id` (None for the root)."""
+        pp = self._parent[self._req_preorder_number(ott_id)]
+        if pp < 0:
+            return None
+        return self._ott_id[pp]
+
+    def get_flag_set_key(self, ott_id):
+        p = self.preorder_number(ott_id)
+        if p is None:
+            return None
+        fsi = self._flag_set_id[p]
+        if fsi == NO_FLAGS:
+            return None
+        return fsi
+
+    def last_descendant_preorder_number(self, preorder_number):
+        return self._last_des[preorder_number]
+
+    def preorder_interval(self, ott_id):
+        """Returns (preorder #, preorder # of last descendant) for `ott_id`."""
+        p = self._req_preorder_number(ott_id)
+        return p, self._last_des[p]
+
+    def is_ancestor(self, anc_ott_id, des_ott_id, proper=True):
+        """Returns True if `anc_ott_id` is an ancestor of `des_ott_id`. If `proper` is False,
+        a taxon is considered to be its own ancestor."""
+        a = self._req_preorder_number(anc_ott_id)
+        d = self._req_preorder_number(des_ott_id)
+        if proper and a == d:
+            return False
+        return a <= d <= self._last_des[a]
+
+    def subtree_size(self, ott_id):
+        """Returns the number of taxa in the subtree rooted at `ott_id` (including `ott_id`)."""
+        p = self._req_preorder_number(ott_id)
+        return 1 + self._last_des[p] - p
+
+    def ids_in_subtree(self, root_ott_id, ott_ids):
+        """Returns the list of elements of `ott_ids` that are `root_ott_id` or its descendants
+        (in input order). IDs that are not in the taxonomy are omitted."""
+        first, last = self.preorder_interval(root_ott_id)
+        pn = self.preorder_number
+        r = []
+        for ott_id in ott_ids:
+            p = pn(ott_id)
+            if p is not None and first <= p <= last:
+                r.append(ott_id)
+        return r
+
+    def flag_prune_mask(self, flag_set_keys):
+        """Returns a prune mask (see the module docstring) for the taxa whose flag set key
+        is in `flag_set_keys`. Subtrees are filled with slice assignments, so only the
+        flag_set_id array is scanned element by element."""
+        keys = frozenset(flag_set_keys)
+        num_taxa = len(self)
+        mask = bytearray(num_taxa)
+        if not keys:
+            return mask
+        flagged = [i for i, fsi in enumerate(self._flag_set_id) if fsi in keys]
+        last_des = self._last_des
+        covered = -1
+        for i in flagged:
+            if i > covered:
+                covered = last_des[i]
+                mask[i:covered + 1] = bytearray([PRUNE_INHERITED]) * (covered + 1 - i)
+        for i in flagged:
+            mask[i] = PRUNE_FLAGGED
+        return mask
+
+    def get_anc_lineage(self, ott_id):
+        """Returns a list from [ott_id, ott_id's par, ..., root ott_id]"""
+        p = self._req_preorder_number(ott_id)
+        par, oids = self._parent, self._ott_id
+        lineage = [ott_id]
+        p = par[p]
+        while p >= 0:
+            lineage.append(oids[p])
+            p = par[p]
+        return lineage
+
+    def close(self):
+        self._af.close()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""Compact binary serialization of trees (see TreeWithPathsInEdges.to_binary and
+write_binary), stored as a peyotl.utility.array_file with the sections:
+    'parent' node # -> node # of the parent (-1 for the root). Nodes are numbered in preorder.
+    'path_offset' (optional) node # -> start of the node's path IDs in the label list (n + 1
+        offsets). Node i's path is the labels [n + path_offset[i], n + path_offset[i + 1]).
+        An empty range means the default path (the node's ID, if it has one).
+    'edge_length' (optional) node # -> length of the edge above the node (NaN for none).
+The labels are the node IDs (one per node, in preorder) followed by the path IDs, either as
+    'int_label' the labels (if every label is an integer), or as
+    'label_kind' 0 for None, 1 for a string, 2 for an integer
+    'label_offset' start of each label in the 'label_heap' (number of labels + 1 offsets)
+    'label_heap' utf-8 encoded text of the labels.
+Reading only maps the file, so the arrays of a cached tree (e.g. a taxonomy subtree written
+by OTT.write_binary_subtree) can be used without building node objects, see BinaryTreeReader.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.array_file import ArrayFile, array_file_bytes, write_array_file
+from peyotl.utility.str_util import is_int_type, UNICODE
+from peyotl.utility import get_logger
+import gc
+
+_LOG = get_logger(__name__)
+BINARY_TREE_MAGIC = b'PEYTREE'
+BINARY_TREE_VERSION = 1
+_NO_LABEL, _STR_LABEL, _INT_LABEL = 0, 1, 2
+
+
+def _label_sections(labels):
+    if all(is_int_type(i) for i in labels):
+        return [('int_label', 'q', labels)]
+    kinds = bytearray(len(labels))
+    offsets = [0] * (len(labels) + 1)
+    encoded = []
+    curr = 0
+    for n, label in enumerate(labels):
+        if label is None:
+            kinds[n] = _NO_LABEL
+        else:
+            kinds[n] = _INT_LABEL if is_int_type(label) else _STR_LABEL
+            b = UNICODE(label).encode('utf-8')
+            encoded.append(b)
+            curr += len(b)
+        offsets[n + 1] = curr
+    offset_tc = 'I' if curr < (1 << 32) else 'Q'
+    return [('label_kind', 'B', kinds), ('label_offset', offset_tc, offsets), ('label_heap', 'B', b''.join(encoded))]
+
+
+def binary_tree_sections(parent, ids, paths=None, edge_lengths=None):
+    """Returns the array file sections for a tree in preorder. `parent` holds the preorder #
+    of the parent of each node (-1 for the root) and `ids` the node IDs. `paths` (optional)
+    maps a node # to a sequence of path IDs that is not the default path of the node.
+    `edge_lengths` (optional) holds the length of the edge above each node (None for no length).
+    """
+    labels = list(ids)
+    sections = [('parent', 'i', parent)]
+    if paths:
+        path_offset = [0] * (len(labels) + 1)
+        curr = 0
+        for n in range(len(labels)):
+            p = paths.get(n)
+            if p:
+                labels.extend(p)
+                curr += len(p)
+            path_offset[n + 1] = curr
+        sections.append(('path_offset', 'I', path_offset))
+    if edge_lengths is not None:
+        nan = float('nan')
+        sections.append(('edge_length', 'd', [nan if x is None else float(x) for x in edge_lengths]))
+    sections.extend(_label_sections(labels))
+    return sections
+
+
+def write_binary_tree_arrays(filepath, parent, ids, paths=None, edge_lengths=None):
+    """Writes a tree given as arrays in preorder (see binary_tree_sections) to `filepath`."""
+    write_array_file(filepath, binary_tree_sections(parent, ids, paths=paths, edge_lengths=edge_lengths),
+                     BINARY_TREE_MAGIC, version=BINARY_TREE_VERSION)
+
+
+def _tree_sections(tree, edge_length_fn=None):
+    ta = tree.traversal_arrays()
+    parent = ta.preorder_parents()
+    ids = []
+    paths = {}
+    lengths = None if edge_length_fn is None else []
+    for n, node in enumerate(ta.iter_nodes(ta.preorder)):
+        _id = node._id
+        ids.append(_id)
+        path_ids = tuple(node._path_ids)
+        if path_ids != ((_id,) if _id is not None else ()):
+            paths[n] = path_ids
+        if lengths is not None:
+            lengths.append(edge_length_fn(node))
+    return binary_tree_sections(parent, ids, paths=paths, edge_lengths=lengths)
+
+
+def tree_to_binary(tree, edge_length_fn=None):
+    """Returns the binary serialization of `tree` as a byte string (see the module docstring).
+    `edge_length_fn(node)` returns the length to store for a node (e.g.
+    peyotl.phylo.distance.edge_length_from_edge_info), by default no lengths are stored."""
+    return array_file_bytes(_tree_sections(tree, edge_length_fn), BINARY_TREE_MAGIC, version=BINARY_TREE_VERSION)
+
+
+def write_binary_tree(tree, filepath, edge_length_fn=None):
+    """Writes the binary serialization of `tree` to `filepath` (see tree_to_binary)."""
+    write_array_file(filepath, _tree_sections(tree, edge_length_fn), BINARY_TREE_MAGIC,
+                     version=BINARY_TREE_VERSION)
+
+
+class BinaryTreeReader(object):
+    """Read-only view of a binary tree (from a file, which is memory-mapped, or from the
+    bytes returned by tree_to_binary).
+        parent - the IntArrayView of the preorder # of the parent of each node,
+        label(i), path_ids(i) and edge_length(i) - the data for node # i,
+        tree(_class) - builds a tree of `_class`.
+    """
+
+    def __init__(self, filepath=None, data=None):
+        self._af = ArrayFile(filepath or '<bytes>', magic=BINARY_TREE_MAGIC, data=data)
+        if self._af.version != BINARY_TREE_VERSION:
+            self._af.close()
+            raise ValueError('Binary tree format version {} is not supported'.format(self._af.version))
+        self.parent = self._af.array('parent')
+        self._num_nodes = len(self.parent)
+        af = self._af
+        self._path_offset = af.array('path_offset') if af.has_section('path_offset') else None
+        self._edge_length = af.array('edge_length') if af.has_section('edge_length') else None
+        if af.has_section('int_label'):
+            self._int_label = af.array('int_label')
+        else:
+            self._int_label = None
+            self._label_kind = af.array('label_kind')
+            self._label_offset = af.array('label_offset')
+
+    def __len__(self):
+        return self._num_nodes
+
+    def label(self, i):
+        if self._int_label is not None:
+            return self._int_label[i]
+        kind = self._label_kind[i]
+        if kind == _NO_LABEL:
+            return None
+        t = self._af.raw_bytes('label_heap', self._label_offset[i], self._label_offset[i + 1]).decode('utf-8')
+        return int(t) if kind == _INT_LABEL else t
+
+    def path_ids(self, i):
+        if self._path_offset is not None:
+            start, end = self._path_offset[i], self._path_offset[i + 1]
+            if start < end:
+                n = self._num_nodes
+                return tuple(self.label(n + j) for j in range(start, end))
+        label = self.label(i)
+        return () if label is None else (label,)
+
+    def edge_length(self, i):
+        if self._edge_length is None:
+            return None
+        x = self._edge_length[i]
+        return None if x != x else x
+
+    def _all_labels(self):
+        if self._int_label is not None:
+            return self._int_label.tolist()
+        kinds = self._label_kind.tolist()
+        offsets = self._label_offset.tolist()
+        heap = self._af.raw_bytes('label_heap', 0, offsets[-1])
+        labels = []
+        for n, kind in enumerate(kinds):
+            if kind == _NO_LABEL:
+                labels.append(None)
+                continue
+            t = heap[offsets[n]:offsets[n + 1]].decode('utf-8')
+            labels.append(int(t) if kind == _INT_LABEL else t)
+        return labels
+
+    def tree(self, _class=None):
+        """Returns a new tree (TreeWithPathsInEdges by default). Stored edge lengths become
+        node.edge.edge_info (as floats)."""
+        if _class is None:
+            from peyotl.phylo.tree import TreeWithPathsInEdges
+            _class = TreeWithPathsInEdges
+        num_nodes = self._num_nodes
+        labels = self._all_labels()
+        paths = {}
+        if self._path_offset is not None:
+            path_offset = self._path_offset.tolist()
+            for n in range(num_nodes):
+                start, end = path_offset[n], path_offset[n + 1]
+                if start < end:
+                    paths[n] = labels[num_nodes + start:num_nodes + end]
+        lengths = None
+        if self._edge_length is not None:
+            lengths = [None if x != x else x for x in self._edge_length.tolist()]
+        # every object allocated while the tree is built stays reachable, so pausing the cyclic
+        #   garbage collector (which would rescan them over and over) roughly halves the time.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return _class._from_preorder_arrays(self.parent.tolist(), labels[:num_nodes], paths, lengths)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def close(self):
+        self._af.close()
+
+
+def tree_from_binary(data, _class=None):
+    """Returns a tree (see BinaryTreeReader.tree) from the bytes returned by tree_to_binary."""
+    reader = BinaryTreeReader(data=data)
+    try:
+        return reader.tree(_class=_class)
+    finally:
+        reader.close()
+
+
+def read_binary_tree(filepath, _class=None):
+    """Returns a tree (see BinaryTreeReader.tree) from a file written by write_binary_tree."""
+    reader = BinaryTreeReader(filepath=filepath)
+    try:
+        return reader.tree(_class=_class)
+    finally:
+        reader.close()
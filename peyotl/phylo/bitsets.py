@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""Collections of clades (sets of leaf indices) stored as bitsets, with kernels that
+compare every clade of one collection with every clade of another.
+
+Two backends are provided:
+    'bigint' - one python long per clade (always available; the representation used
+        by TreeWithPathsInEdges.add_bits4subtree_ids),
+    'numpy' - a (# clades) x (# 64-bit words) uint64 matrix; the kernels work on
+        blocks of clade pairs at a time (only available if numpy can be imported).
+get_bitset_backend('auto') returns the numpy backend when it is available.
+The numpy kernels derive every pairwise relation from intersection sizes (see
+peyotl.phylo.compat.split_comparison_from_counts), so both backends return the
+same split comparison codes as compare_bits_as_splits.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.phylo.compat import SplitComparison
+from peyotl.utility import get_logger
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_LOG = get_logger(__name__)
+
+
+def _popcount(x):
+    return bin(x).count('1')
+
+
+class BigIntCladeBitsets(object):
+    """Clades as python longs. Matrices are returned as lists of lists."""
+    backend_name = 'bigint'
+
+    def __init__(self, rows, num_leaves):
+        self.rows = list(rows)
+        self.num_leaves = num_leaves
+        self._sizes = None
+
+    @classmethod
+    def from_leaf_indices(cls, index_lists, num_leaves):
+        rows = []
+        for indices in index_lists:
+            b = 0
+            for i in indices:
+                b |= 1 << i
+            rows.append(b)
+        return cls(rows, num_leaves)
+
+    @classmethod
+    def from_children(cls, child_lists, leaf_rows, num_leaves):
+        """`child_lists` lists, for each clade in postorder, the row indices of its child
+        clades (or None for a leaf, whose leaf index is the next item of `leaf_rows`)."""
+        rows = []
+        leaf_it = iter(leaf_rows)
+        for c in child_lists:
+            if c is None:
+                rows.append(1 << next(leaf_it))
+            else:
+                b = 0
+                for i in c:
+                    b |= rows[i]
+                rows.append(b)
+        return cls(rows, num_leaves)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def subset_rows(self, row_indices):
+        return self.__class__([self.rows[i] for i in row_indices], self.num_leaves)
+
+    def as_int(self, i):
+        return self.rows[i]
+
+    def sizes(self):
+        if self._sizes is None:
+            self._sizes = [_popcount(b) for b in self.rows]
+        return self._sizes
+
+    def intersection_counts(self, other):
+        return [[_popcount(a & b) for b in other.rows] for a in self.rows]
+
+    def intersects(self, other):
+        return [[bool(a & b) for b in other.rows] for a in self.rows]
+
+    def is_subset(self, other):
+        """[i][j] is True if clade i of self is a subset of clade j of `other`"""
+        return [[(a & b) == a for b in other.rows] for a in self.rows]
+
+    def compare_as_splits(self, other):
+        """[i][j] is the SplitComparison value (an int) of clade i of self and clade j of
+        `other`. Each row is a bytearray."""
+        universe = (1 << self.num_leaves) - 1
+        return [bytearray(_compare_int_row(a, other.rows, universe)) for a in self.rows]
+
+    def incompatible_pairs(self, other, rooted=False):
+        """Returns the (i, j) pairs of clade i of self and clade j of `other` that overlap without
+        either containing the other. Unless `rooted` is True, pairs that together cover every
+        leaf (and so are compatible as unrooted splits) are not reported."""
+        universe = (1 << self.num_leaves) - 1
+        pairs = []
+        other_rows = other.rows
+        for i, a in enumerate(self.rows):
+            for j, b in enumerate(other_rows):
+                x = a & b
+                if x and x != a and x != b and (rooted or (a | b) != universe):
+                    pairs.append((i, j))
+        return pairs
+
+    @staticmethod
+    def stack_rows(parts):
+        rows = []
+        for p in parts:
+            rows.extend(p)
+        return rows
+
+
+_UI = SplitComparison.UNROOTED_INCOMPATIBLE.value
+_UC = SplitComparison.UNROOTED_COMPAT.value
+_RC = SplitComparison.ROOTED_COMPAT.value
+_UE = SplitComparison.UNROOTED_EQUIVALENT.value
+_RE = SplitComparison.ROOTED_EQUIVALENT.value
+
+
+def _compare_int_row(a, rows, universe):
+    """compare_bits_as_splits(a, b, universe).value for each b in `rows` (inlined, as enum access is slow)"""
+    out = []
+    for b in rows:
+        i = a & b
+        if not i:
+            out.append(_UE if (a | b) == universe else _UC)
+        elif i == a or i == b:
+            out.append(_RE if a == b else _RC)
+        else:
+            out.append(_UC if (a | b) == universe else _UI)
+    return out
+
+
+class NumpyCladeBitsets(object):
+    """Clades as rows of a uint64 word matrix. Matrices are returned as numpy arrays."""
+    backend_name = 'numpy'
+    # number of bytes of (row & row) temporaries to create in one step
+    block_bytes = 1 << 24
+
+    def __init__(self, words, num_leaves):
+        self.words = words
+        self.num_leaves = num_leaves
+        self._sizes = None
+
+    @staticmethod
+    def num_words(num_leaves):
+        return max(1, (num_leaves + 63) // 64)
+
+    @classmethod
+    def from_leaf_indices(cls, index_lists, num_leaves):
+        index_lists = list(index_lists)
+        words = numpy.zeros((len(index_lists), cls.num_words(num_leaves)), dtype=numpy.uint64)
+        for r, indices in enumerate(index_lists):
+            idx = numpy.asarray(list(indices), dtype=numpy.int64)
+            if len(idx):
+                bits = numpy.left_shift(numpy.uint64(1), (idx % 64).astype(numpy.uint64))
+                numpy.bitwise_or.at(words[r], idx // 64, bits)
+        return cls(words, num_leaves)
+
+    @classmethod
+    def from_children(cls, child_lists, leaf_rows, num_leaves):
+        child_lists = list(child_lists)
+        words = numpy.zeros((len(child_lists), cls.num_words(num_leaves)), dtype=numpy.uint64)
+        leaf_it = iter(leaf_rows)
+        for r, c in enumerate(child_lists):
+            if c is None:
+                i = next(leaf_it)
+                words[r, i // 64] = numpy.uint64(1) << numpy.uint64(i % 64)
+            else:
+                numpy.bitwise_or.reduce(words[c], axis=0, out=words[r])
+        return cls(words, num_leaves)
+
+    def __len__(self):
+        return self.words.shape[0]
+
+    def subset_rows(self, row_indices):
+        return self.__class__(self.words[numpy.asarray(row_indices, dtype=numpy.int64)], self.num_leaves)
+
+    def as_int(self, i):
+        b = 0
+        for w in reversed(self.words[i].tolist()):
+            b = (b << 64) | w
+        return b
+
+    def sizes(self):
+        if self._sizes is None:
+            self._sizes = _numpy_popcount(self.words)
+        return self._sizes
+
+    def _blocks(self, other):
+        """Yields (start, end, intersection popcount matrix) for blocks of the rows of self"""
+        per_row = max(1, len(other) * self.words.shape[1] * 8)
+        step = max(1, self.block_bytes // per_row)
+        for start in range(0, len(self), step):
+            end = min(len(self), start + step)
+            inter = self.words[start:end, None, :] & other.words[None, :, :]
+            yield start, end, _numpy_popcount(inter)
+
+    def intersection_counts(self, other):
+        out = numpy.empty((len(self), len(other)), dtype=numpy.int64)
+        for start, end, counts in self._blocks(other):
+            out[start:end] = counts
+        return out
+
+    def intersects(self, other):
+        return self.intersection_counts(other) > 0
+
+    def is_subset(self, other):
+        return self.intersection_counts(other) == self.sizes()[:, None]
+
+    def compare_as_splits(self, other):
+        inter = self.intersection_counts(other)
+        a = self.sizes()[:, None]
+        b = other.sizes()[None, :]
+        n = self.num_leaves
+        out = numpy.full(inter.shape, SplitComparison.UNROOTED_INCOMPATIBLE.value, dtype=numpy.uint8)
+        out[(inter > 0) & (a + b - inter == n)] = SplitComparison.UNROOTED_COMPAT.value
+        nested = (inter > 0) & ((inter == a) | (inter == b))
+        out[nested] = SplitComparison.ROOTED_COMPAT.value
+        out[nested & (a == b)] = SplitComparison.ROOTED_EQUIVALENT.value
+        disjoint = inter == 0
+        out[disjoint] = SplitComparison.UNROOTED_COMPAT.value
+        out[disjoint & (a + b == n)] = SplitComparison.UNROOTED_EQUIVALENT.value
+        return out
+
+    def incompatible_pairs(self, other, rooted=False):
+        sizes = self.sizes()
+        b = other.sizes()[None, :]
+        n = self.num_leaves
+        pairs = []
+        for start, end, inter in self._blocks(other):
+            a = sizes[start:end, None]
+            mask = (inter > 0) & (inter != a) & (inter != b)
+            if not rooted:
+                mask &= (a + b - inter) != n
+            ii, jj = numpy.nonzero(mask)
+            pairs.extend(zip((ii + start).tolist(), jj.tolist()))
+        return pairs
+
+    @staticmethod
+    def stack_rows(parts):
+        return numpy.concatenate(list(parts), axis=0)
+
+
+if numpy is not None:
+    _BYTE_POPCOUNT = numpy.array([_popcount(i) for i in range(256)], dtype=numpy.uint8)
+
+
+def _numpy_popcount(words):
+    """Sums the set bits over the last axis of a uint64 array."""
+    as_bytes = numpy.ascontiguousarray(words).view(numpy.uint8)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=numpy.int64)
+
+
+_BACKENDS = {'bigint': BigIntCladeBitsets}
+if numpy is not None:
+    _BACKENDS['numpy'] = NumpyCladeBitsets
+
+
+def available_bitset_backends():
+    return sorted(_BACKENDS.keys())
+
+
+def get_bitset_backend(name='auto'):
+    """Returns the clade bitset class for `name` ('bigint', 'numpy' or 'auto')."""
+    if name is None or name == 'auto':
+        return _BACKENDS.get('numpy', BigIntCladeBitsets)
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        if name == 'numpy':
+            raise ValueError('The "numpy" bitset backend requires numpy')
+        raise ValueError('Unknown bitset backend "{}"'.format(name))
+
+
+def tree_clade_bitsets(tree, leaf_index=None, backend='auto', include_leaves=False):
+    """Returns (clade bitsets, list of nodes) for the internal nodes of `tree` (and its
+    leaves if `include_leaves` is True), in postorder. Bit i of a clade is set if the
+    leaf with leaf_index[leaf ID] == i is below the node. If `leaf_index` is None, the
+    leaves are numbered in postorder; leaves that are not in `leaf_index` are ignored.
+    `backend` is a backend name or one of the clade bitset classes.
+    """
+    cls = backend if isinstance(backend, type) else get_bitset_backend(backend)
+    if leaf_index is None:
+        leaf_index = {}
+        for nd in tree.postorder_node_iter():
+            if nd.is_leaf:
+                leaf_index[nd._id] = len(leaf_index)
+    num_leaves = max(leaf_index.values()) + 1 if leaf_index else 0
+    row_of = {}
+    nodes = []
+    child_lists = []
+    leaf_rows = []
+    for nd in tree.postorder_node_iter():
+        if nd.is_leaf:
+            i = leaf_index.get(nd._id)
+            if i is None:
+                continue
+            child_lists.append(None)
+            leaf_rows.append(i)
+        else:
+            c = [row_of[id(k)] for k in nd.child_iter() if id(k) in row_of]
+            child_lists.append(c)
+        row_of[id(nd)] = len(nodes)
+        nodes.append(nd)
+    bitsets = cls.from_children(child_lists, leaf_rows, num_leaves)
+    if include_leaves:
+        return bitsets, nodes
+    keep = [r for r, c in enumerate(child_lists) if c is not None]
+    return bitsets.subset_rows(keep), [nodes[r] for r in keep]
+
+
+def clade_bitsets_from_sets(clades, leaf_index, backend='auto'):
+    """Returns clade bitsets for an iterable of collections of leaf IDs. Bit
+    leaf_index[leaf ID] is set for each ID (IDs that are not in `leaf_index` are ignored)."""
+    cls = backend if isinstance(backend, type) else get_bitset_backend(backend)
+    num_leaves = max(leaf_index.values()) + 1 if leaf_index else 0
+    index_lists = [[leaf_index[i] for i in c if i in leaf_index] for c in clades]
+    return cls.from_leaf_indices(index_lists, num_leaves)
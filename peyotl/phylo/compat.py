@@ -53,6 +53,22 @@ def compare_sets_as_splits(one_set, other, el_universe):
     return SplitComparison.UNROOTED_INCOMPATIBLE
 
 
+def split_comparison_from_counts(num_inter, size_one, size_other, num_leaves):
+    """Returns the SplitComparison of two clades from the size of their intersection,
+    their sizes, and the number of leaves in the universe."""
+    if num_inter == 0:
+        if size_one + size_other == num_leaves:
+            return SplitComparison.UNROOTED_EQUIVALENT
+        return SplitComparison.UNROOTED_COMPAT
+    if num_inter == size_one or num_inter == size_other:
+        if size_one == size_other:
+            return SplitComparison.ROOTED_EQUIVALENT
+        return SplitComparison.ROOTED_COMPAT
+    if size_one + size_other - num_inter == num_leaves:
+        return SplitComparison.UNROOTED_COMPAT
+    return SplitComparison.UNROOTED_INCOMPATIBLE
+
+
 def compare_bits_as_splits(one_set, other, el_universe):
     intersection_b = one_set & other
     if intersection_b == 0:
@@ -68,3 +84,73 @@ def compare_bits_as_splits(one_set, other, el_universe):
     if el_universe == union_b:
         return SplitComparison.UNROOTED_COMPAT
     return SplitComparison.UNROOTED_INCOMPATIBLE
+
+
+def _check_split_collections(one, other):
+    if type(one) is not type(other):
+        raise ValueError('Split collections must use the same bitset backend')
+    if one.num_leaves != other.num_leaves:
+        raise ValueError('Split collections must use the same leaf numbering')
+
+
+def _row_chunks(one, num_workers):
+    """Yields (first row index, clade bitsets) for the tasks of `num_workers` processes"""
+    num_rows = len(one)
+    if num_workers <= 1:
+        yield 0, one
+        return
+    step = max(1, -(-num_rows // (4 * num_workers)))
+    for start in range(0, num_rows, step):
+        yield start, one.subset_rows(range(start, min(num_rows, start + step)))
+
+
+def _compare_split_chunk(args):
+    chunk, other = args
+    return chunk.compare_as_splits(other)
+
+
+def _incompatible_split_chunk(args):
+    start, chunk, other, rooted = args
+    return [(i + start, j) for i, j in chunk.incompatible_pairs(other, rooted=rooted)]
+
+
+def compare_split_collections(one, other, num_workers=1):
+    """Returns a matrix `m` in which m[i][j] is the SplitComparison value of split i of `one`
+    and split j of `other`. The collections are clade bitsets (see peyotl.phylo.bitsets) of
+    the same backend and leaf numbering. The matrix holds one byte per pair: a list of
+    bytearrays for the bigint backend, or a uint8 array for the numpy backend.
+    Blocks of rows are computed by `num_workers` processes.
+    """
+    from peyotl.utility.parallel import ordered_parallel_map
+    _check_split_collections(one, other)
+    arg_it = ((chunk, other) for _, chunk in _row_chunks(one, num_workers))
+    return one.stack_rows(ordered_parallel_map(_compare_split_chunk, arg_it, num_workers))
+
+
+def find_incompatible_splits(one, other, rooted=False, num_workers=1):
+    """Returns the sorted list of (i, j) pairs for which split i of `one` conflicts with split j
+    of `other` (see compare_split_collections for the arguments). If `rooted` is True, the
+    splits are treated as clades, so pairs that are only compatible when one of them is
+    inverted are also reported.
+    """
+    from peyotl.utility.parallel import ordered_parallel_map
+    _check_split_collections(one, other)
+    arg_it = ((start, chunk, other, rooted) for start, chunk in _row_chunks(one, num_workers))
+    pairs = []
+    for p in ordered_parallel_map(_incompatible_split_chunk, arg_it, num_workers):
+        pairs.extend(p)
+    return pairs
+
+
+def splits_incompatible_with_tree(splits, tree, rooted=False, backend='auto', num_workers=1):
+    """Returns the indices of the `splits` (collections of leaf IDs) that conflict with at least
+    one clade of `tree`. Leaf IDs that are not leaves of `tree` are ignored."""
+    from peyotl.phylo.bitsets import clade_bitsets_from_sets, tree_clade_bitsets
+    leaf_index = {}
+    for nd in tree.postorder_node_iter():
+        if nd.is_leaf:
+            leaf_index[nd._id] = len(leaf_index)
+    tree_bits = tree_clade_bitsets(tree, leaf_index=leaf_index, backend=backend)[0]
+    split_bits = clade_bitsets_from_sets(splits, leaf_index, backend=type(tree_bits))
+    pairs = find_incompatible_splits(split_bits, tree_bits, rooted=rooted, num_workers=num_workers)
+    return sorted(set(i for i, _ in pairs))
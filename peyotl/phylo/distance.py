@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+"""Distances between trees, computed from the splits (bipartitions of the leaves) that
+their edges display. Trees are compared as unrooted trees on the leaves that they share.
+
+    robinson_foulds_distance - the number of splits that are in only one of the trees,
+    weighted_robinson_foulds_distance - the sum over all splits of the absolute
+        difference of the lengths of the edges that display the split in each tree
+        (0 for a tree that lacks the split),
+    matching_split_distance - the cost of a minimum cost matching of the splits of the
+        two trees, where matching two splits costs the number of leaves that must move
+        to turn one into the other (Bogdanowicz and Giaro 2012). Unmatched splits are
+        matched with the trivial split of all of the leaves.
+
+The splits of a tree are read from the bits4subtree_ids fields set by
+TreeWithPathsInEdges.add_bits4subtree_ids (see TreeSplits), and are compared by hashing
+them. If two trees have the same leaf set, robinson_foulds_distance instead uses Day's
+algorithm (clusters as intervals of a leaf numbering), which takes linear time and does
+not create a bitset per split.
+all_pairs_tree_distances computes the matrix of distances between a list of trees.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.parallel import default_num_workers, shared_ordered_parallel_map
+from peyotl.utility import get_logger
+
+_LOG = get_logger(__name__)
+
+
+def _popcount(x):
+    return bin(x).count('1')
+
+
+def edge_length_from_edge_info(node):
+    """Returns the length of the edge above `node` (the node.edge.edge_info stored by the
+    newick parsers when `edge_info` is True) or 0.0 if there is none."""
+    e = node._edge
+    x = getattr(e, 'edge_info', None) if e is not None else None
+    if not x:
+        return 0.0
+    return float(x)
+
+
+def leaf_bits_for_trees(trees):
+    """Returns a dict of leaf ID -> bit for the union of the leaves of `trees`"""
+    leaf_bits = {}
+    for tree in trees:
+        for nd in tree.postorder_node_iter():
+            if nd.is_leaf and nd._id not in leaf_bits:
+                leaf_bits[nd._id] = 1 << len(leaf_bits)
+    return leaf_bits
+
+
+class TreeSplits(object):
+    """The clade (bits4subtree_ids) of each non-root node of a tree, and the length of the
+    edge above it. `leaf_bits` maps leaf ID -> bit (leaves that are not in it are ignored).
+    If `edge_length` is None, every edge has length 1.0.
+    """
+
+    def __init__(self, tree, leaf_bits, edge_length=None):
+        tree.add_bits4subtree_ids(leaf_bits)
+        self.leaf_mask = tree.root.bits4subtree_ids
+        self.clades = []
+        for nd in tree.postorder_node_iter():
+            if nd._parent is not None:
+                length = 1.0 if edge_length is None else edge_length(nd)
+                self.clades.append((nd.bits4subtree_ids, length))
+        self._full_splits = {}
+
+    def splits(self, mask=None, pendant=False):
+        """Returns a dict of split -> edge length for the tree restricted to the leaves in `mask`
+        (default: all of its leaves). A split is stored as the bits of its side that lacks the
+        lowest leaf of `mask`. Edges that display the same split (e.g. the two edges at a root
+        of degree 2) are merged by summing their lengths. Splits that separate one leaf are
+        only included if `pendant` is True.
+        """
+        if mask is None or mask == self.leaf_mask:
+            d = self._full_splits.get(pendant)
+            if d is None:
+                d = self._restricted_splits(self.leaf_mask, pendant)
+                self._full_splits[pendant] = d
+            return d
+        return self._restricted_splits(mask, pendant)
+
+    def _restricted_splits(self, mask, pendant):
+        n = _popcount(mask)
+        low = mask & -mask
+        min_size = 1 if pendant else 2
+        max_size = n - min_size
+        d = {}
+        for c, length in self.clades:
+            c &= mask
+            if c & low:
+                c ^= mask
+            k = _popcount(c)
+            if min_size <= k <= max_size:
+                d[c] = d.get(c, 0.0) + length
+        return d
+
+
+def _rf_from_splits(one, other):
+    mask = one.leaf_mask & other.leaf_mask
+    a, b = one.splits(mask), other.splits(mask)
+    if len(a) > len(b):
+        a, b = b, a
+    return len(a) + len(b) - 2 * sum(1 for s in a if s in b)
+
+
+def _weighted_rf_from_splits(one, other):
+    mask = one.leaf_mask & other.leaf_mask
+    a, b = one.splits(mask, pendant=True), other.splits(mask, pendant=True)
+    total = 0.0
+    for s, length in a.items():
+        total += abs(length - b.get(s, 0.0))
+    for s, length in b.items():
+        if s not in a:
+            total += length
+    return total
+
+
+def _matching_from_splits(one, other):
+    mask = one.leaf_mask & other.leaf_mask
+    n = _popcount(mask)
+    a, b = list(one.splits(mask).keys()), list(other.splits(mask).keys())
+    size = max(len(a), len(b))
+    a.extend([0] * (size - len(a)))
+    b.extend([0] * (size - len(b)))
+    cost = []
+    for x in a:
+        row = []
+        for y in b:
+            k = _popcount(x ^ y)
+            row.append(min(k, n - k))
+        cost.append(row)
+    return _min_cost_assignment(cost)
+
+
+def _min_cost_assignment(cost):
+    """Returns the total cost of a minimum cost perfect matching of the rows and columns of
+    the square matrix `cost` (the O(n^3) Hungarian algorithm with potentials)."""
+    n = len(cost)
+    inf = float('inf')
+    u = [0] * (n + 1)
+    v = [0] * (n + 1)
+    match = [0] * (n + 1)  # match[column] = row (1-based; 0 for none)
+    way = [0] * (n + 1)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        min_v = [inf] * (n + 1)
+        used = [False] * (n + 1)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta, j1 = inf, 0
+            for j in range(1, n + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < min_v[j]:
+                        min_v[j] = cur
+                        way[j] = j0
+                    if min_v[j] < delta:
+                        delta, j1 = min_v[j], j
+            for j in range(n + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_v[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    return sum(cost[match[j] - 1][j - 1] for j in range(1, n + 1))
+
+
+def _adjacency(tree):
+    """Returns (list of neighbor index lists, list of leaf IDs (None for internal nodes))"""
+    neighbors, leaf_ids = [], []
+    stack = [(tree.root, -1)]
+    while stack:
+        nd, p = stack.pop()
+        i = len(neighbors)
+        neighbors.append([] if p < 0 else [p])
+        if p >= 0:
+            neighbors[p].append(i)
+        leaf_ids.append(nd._id if nd.is_leaf else None)
+        for c in nd.child_iter():
+            stack.append((c, i))
+    return neighbors, leaf_ids
+
+
+def _rerooted_postorder(neighbors, start):
+    """Returns (postorder list of node indices, parent index list) for the tree rerooted at `start`"""
+    par = [-1] * len(neighbors)
+    preorder = [start]
+    par[start] = start
+    stack = [start]
+    while stack:
+        i = stack.pop()
+        for j in neighbors[i]:
+            if par[j] == -1:
+                par[j] = i
+                preorder.append(j)
+                stack.append(j)
+    par[start] = -1
+    preorder.reverse()
+    return preorder, par
+
+
+def _cluster_intervals(neighbors, leaf_ids, root_leaf_id, leaf_number):
+    """Generator of (min, max, size) of the leaf numbers below each node (other than the
+    root leaf) of the tree rerooted at the leaf with ID `root_leaf_id`, skipping nodes with
+    fewer than 2 non-empty subtrees. Leaves are numbered in postorder (and stored in
+    `leaf_number`) if `leaf_number` is empty."""
+    start = leaf_ids.index(root_leaf_id)
+    postorder, par = _rerooted_postorder(neighbors, start)
+    numbering = not leaf_number
+    n = len(neighbors)
+    lo, hi, size, branches = [n] * n, [-1] * n, [0] * n, [0] * n
+    for i in postorder:
+        if i == start:
+            continue
+        lid = leaf_ids[i]
+        if lid is not None:
+            if numbering:
+                leaf_number[lid] = len(leaf_number)
+            x = leaf_number[lid]
+            lo[i], hi[i], size[i] = x, x, 1
+        elif branches[i] > 1:
+            yield lo[i], hi[i], size[i]
+        p = par[i]
+        if size[i] and p != start:
+            branches[p] += 1
+            size[p] += size[i]
+            if lo[i] < lo[p]:
+                lo[p] = lo[i]
+            if hi[i] > hi[p]:
+                hi[p] = hi[i]
+
+
+def _day_rf(tree1, tree2, leaf_ids):
+    """Robinson-Foulds distance by Day's algorithm for trees with the same set of leaf IDs"""
+    num_leaves = len(leaf_ids)
+    root_leaf_id = next(iter(leaf_ids))
+    leaf_number = {}
+    nbrs, lids = _adjacency(tree1)
+    clusters = set()
+    for lo, hi, size in _cluster_intervals(nbrs, lids, root_leaf_id, leaf_number):
+        if 2 <= size <= num_leaves - 2:
+            clusters.add((lo, hi))
+    num_shared, num_other = 0, 0
+    nbrs, lids = _adjacency(tree2)
+    for lo, hi, size in _cluster_intervals(nbrs, lids, root_leaf_id, leaf_number):
+        if 2 <= size <= num_leaves - 2:
+            num_other += 1
+            if hi - lo + 1 == size and (lo, hi) in clusters:
+                num_shared += 1
+    return len(clusters) + num_other - 2 * num_shared
+
+
+def _leaf_id_set(tree):
+    return set(nd._id for nd in tree.postorder_node_iter() if nd.is_leaf)
+
+
+def robinson_foulds_distance(tree1, tree2):
+    """Returns the number of splits (of the leaves shared by the trees) that are displayed
+    by only one of the trees."""
+    ids1 = _leaf_id_set(tree1)
+    if ids1 == _leaf_id_set(tree2):
+        if len(ids1) < 4:
+            return 0
+        return _day_rf(tree1, tree2, ids1)
+    leaf_bits = leaf_bits_for_trees([tree1, tree2])
+    return _rf_from_splits(TreeSplits(tree1, leaf_bits), TreeSplits(tree2, leaf_bits))
+
+
+def weighted_robinson_foulds_distance(tree1, tree2, edge_length=edge_length_from_edge_info):
+    """Returns the weighted Robinson-Foulds distance: sum over the splits (including those of
+    the edges to leaves) of the difference of the edge lengths in the two trees.
+    `edge_length(node)` returns the length of the edge above a node."""
+    leaf_bits = leaf_bits_for_trees([tree1, tree2])
+    return _weighted_rf_from_splits(TreeSplits(tree1, leaf_bits, edge_length),
+                                    TreeSplits(tree2, leaf_bits, edge_length))
+
+
+def matching_split_distance(tree1, tree2):
+    """Returns the matching split distance of the trees (see the module docstring). The cost
+    grows with the cube of the number of splits."""
+    leaf_bits = leaf_bits_for_trees([tree1, tree2])
+    return _matching_from_splits(TreeSplits(tree1, leaf_bits), TreeSplits(tree2, leaf_bits))
+
+
+_METRICS = {'rf': _rf_from_splits,
+            'weighted_rf': _weighted_rf_from_splits,
+            'matching': _matching_from_splits}
+
+def _distance_row(splits, args):
+    i, metric = args
+    fn = _METRICS[metric]
+    one = splits[i]
+    return [fn(one, other) for other in splits[i + 1:]]
+
+
+def all_pairs_tree_distances(trees, metric='rf', num_workers=None, edge_length=edge_length_from_edge_info):
+    """Returns the symmetric matrix (list of lists) of distances between each pair of `trees`.
+    `metric` is 'rf', 'weighted_rf' or 'matching'; `edge_length` is only used for 'weighted_rf'.
+    The splits of each tree are found once, then rows of the matrix are computed by a pool of
+    `num_workers` processes (default: one per CPU).
+    """
+    if metric not in _METRICS:
+        raise ValueError('Unknown tree distance "{}"'.format(metric))
+    if num_workers is None:
+        num_workers = default_num_workers()
+    trees = list(trees)
+    leaf_bits = leaf_bits_for_trees(trees)
+    if metric != 'weighted_rf':
+        edge_length = None
+    splits = [TreeSplits(t, leaf_bits, edge_length) for t in trees]
+    n = len(trees)
+    zero = 0.0 if metric == 'weighted_rf' else 0
+    matrix = [[zero] * n for _ in range(n)]
+    rows = shared_ordered_parallel_map(_distance_row, splits, ((i, metric) for i in range(n)), num_workers)
+    for i, row in enumerate(rows):
+        for k, d in enumerate(row):
+            j = i + 1 + k
+            matrix[i][j] = d
+            matrix[j][i] = d
+    return matrix
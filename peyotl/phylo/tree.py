@@ -1,29 +1,42 @@
 #!/usr/bin/env python
-from peyotl.utility.tokenizer import NewickEvents
+from peyotl.utility.tokenizer import NewickEvents, NewickTokenType
 from peyotl.utility import get_logger
+from array import array
+from collections import deque
+from itertools import islice
 import sys
 
 _LOG = get_logger(__name__)
 
 
-def _write_node_info_newick(out, node, **kwargs):  # TODO
-    """writes a label other info (e.g. branch lengths) based on
-    kwargs:
-        #TODO
-    """
-    out.write(str(node._id))
+# number of pieces of text that write_newick collects before each write to the output stream
+NEWICK_WRITE_BUFFER_SIZE = 8192
+
+
+def newick_node_id(node):
+    """Default label function of write_newick: the ID of the node (None for no label)."""
+    return node._id
+
+
+def newick_edge_info(node):
+    """Edge length function for write_newick that writes back the text after the colon
+    stored by the newick parsers when `edge_info` is True (None if there is none)."""
+    e = node._edge
+    if e is None:
+        return None
+    return getattr(e, 'edge_info', None)
 
 
 class ExtensibleObject(object):
     pass
 
 
-class Node(object):
-    def __init__(self, _id=None):
-        self._id = _id
-        self._children = []
-        self._parent = None
-        self._edge = None
+class _BaseNode(object):
+    """Traversal API shared by the node classes. Subclasses provide `_id`, `_children`,
+    `_parent`, `_edge` and `_tree` (as attributes, slots or properties). `_tree` is the
+    tree that created the node (None for a node created on its own); add_child and
+    replace_child drop the cached traversal orders of that tree."""
+    __slots__ = ()
 
     @property
     def parent(self):
@@ -37,7 +50,7 @@ class Node(object):
 
     def sib_iter(self):
         if self._parent is None:
-            raise StopIteration
+            return
         for c in self._parent.child_iter():
             if c is not self:
                 yield c
@@ -68,21 +81,27 @@ class Node(object):
         encountered twice: once right before its descendants, and once right
         after its last descendant
         """
-        stack = [self]
-        while stack:
-            node = stack.pop()
-            if node.is_leaf:
-                if leaf_fn:
+        if self.is_leaf:
+            if leaf_fn:
+                leaf_fn(self)
+            return
+        # parallel stacks of the open internal nodes and iterators over their children
+        nodes = [self]
+        child_iters = [iter(self._children)]
+        before_fn(self)
+        while nodes:
+            for node in child_iters[-1]:
+                children = node._children
+                if children:
+                    before_fn(node)
+                    nodes.append(node)
+                    child_iters.append(iter(children))
+                elif leaf_fn:
                     leaf_fn(node)
-                while node.is_last_child_of_parent:
-                    node = node._parent
-                    if node:
-                        after_fn(node)
-                    else:
-                        break
+                break
             else:
-                before_fn(node)
-                stack.extend([i for i in reversed(node._children)])
+                child_iters.pop()
+                after_fn(nodes.pop())
 
     def preorder_iter(self, filter_fn=None):
         """ From DendroPy
@@ -92,12 +111,20 @@ class Node(object):
         only returned if no filter_fn is given or if filter_fn returns
         True.
         """
-        stack = [self]
-        while stack:
-            node = stack.pop()
-            if filter_fn is None or filter_fn(node):
-                yield node
-            stack.extend([i for i in reversed(node._children)])
+        if filter_fn is None or filter_fn(self):
+            yield self
+        # stack of iterators over the children of the open internal nodes
+        child_iters = [iter(self._children)]
+        while child_iters:
+            for node in child_iters[-1]:
+                if filter_fn is None or filter_fn(node):
+                    yield node
+                children = node._children
+                if children:
+                    child_iters.append(iter(children))
+                break
+            else:
+                child_iters.pop()
 
     def postorder_iter(self, filter_fn=None):
         """From DendroPy
@@ -107,16 +134,19 @@ class Node(object):
         node is only returned if no filter_fn is given or if filter_fn
         returns True.
         """
-        stack = [(self, False)]
-        while stack:
-            node, state = stack.pop()
-            if state:
+        # parallel stacks of the nodes on the current path and iterators over their children
+        nodes = [self]
+        child_iters = [iter(self._children)]
+        while nodes:
+            for c in child_iters[-1]:
+                nodes.append(c)
+                child_iters.append(iter(c._children))
+                break
+            else:
+                child_iters.pop()
+                node = nodes.pop()
                 if filter_fn is None or filter_fn(node):
                     yield node
-            else:
-                stack.append((node, True))
-                if node._children:
-                    stack.extend([(n, False) for n in node.children_reversed_iter()])
 
     def children_iter(self, filter_fn=None):
         if self._children:
@@ -131,6 +161,9 @@ class Node(object):
                     yield i
 
     def add_child(self, child):
+        tree = self._tree
+        if tree is not None:
+            tree._traversal = None
         child._child_index_in_parent = len(self._children)
         self._children.append(child)
         child._parent = self
@@ -139,6 +172,9 @@ class Node(object):
         self._parent.add_child(sib)
 
     def replace_child(self, old_child, new_c):
+        tree = self._tree
+        if tree is not None:
+            tree._traversal = None
         i = old_child._child_index_in_parent
         assert self._children[i] is old_child
         del old_child._child_index_in_parent
@@ -147,6 +183,15 @@ class Node(object):
         new_c._parent = self
 
 
+class Node(_BaseNode):
+    def __init__(self, _id=None):
+        self._id = _id
+        self._children = []
+        self._parent = None
+        self._edge = None
+        self._tree = None
+
+
 class NodeWithPathInEdges(Node):
     def __init__(self, _id=None, path_ids=None):
         Node.__init__(self, _id)
@@ -160,11 +205,118 @@ class NodeWithPathInEdges(Node):
         self._path_set = set(self._path_ids)
 
 
+class SlottedNode(_BaseNode):
+    """Node without a per-instance __dict__. Only the attributes used by the tree
+    classes in this module (and add_bits4subtree_ids) can be set on it, so code that
+    decorates nodes with arbitrary attributes (e.g. peyotl.evaluate_tree) needs Node.
+    """
+    __slots__ = ('_id', '_children', '_parent', '_edge', '_tree', '_child_index_in_parent', 'bits4subtree_ids')
+
+    def __init__(self, _id=None):
+        self._id = _id
+        self._children = []
+        self._parent = None
+        self._edge = None
+        self._tree = None
+
+
+class SlottedNodeWithPathInEdges(SlottedNode):
+    """Slotted NodeWithPathInEdges. The path is stored as a tuple and the set of path IDs
+    is created on demand."""
+    __slots__ = ('_path_ids',)
+
+    def __init__(self, _id=None, path_ids=None):
+        SlottedNode.__init__(self, _id)
+        if path_ids is not None:
+            self._path_ids = tuple(path_ids)
+        elif _id is not None:
+            self._path_ids = (_id,)
+        else:
+            self._path_ids = ()
+
+    @property
+    def _path_set(self):
+        return frozenset(self._path_ids)
+
+
+class TraversalArrays(object):
+    """Traversal orders of a tree (see TreeWithPathsInEdges.traversal_arrays). Nodes are
+    identified by an index: the preorder rank for trees of node objects, or the storage
+    index for ArrayTreeWithPathsInEdges.
+        preorder - array of node indices in preorder,
+        postorder - array of node indices in postorder,
+        parent - array of the parent index of each node index (-1 for the root).
+    node(i) returns the node with index i.
+    """
+    __slots__ = ('preorder', 'postorder', 'parent', '_nodes', '_tree', '_root_key')
+
+    def __init__(self, preorder, postorder, parent, nodes, tree, root_key):
+        self.preorder = preorder
+        self.postorder = postorder
+        self.parent = parent
+        self._nodes = nodes
+        self._tree = tree
+        self._root_key = root_key
+
+    def __len__(self):
+        return len(self.preorder)
+
+    def node(self, i):
+        if self._nodes is None:
+            return _ArrayNodeView(self._tree, i)
+        return self._nodes[i]
+
+    def preorder_parents(self):
+        """Returns the array of the preorder rank of the parent of each node (-1 for the root),
+        indexed by preorder rank."""
+        if self._nodes is not None:
+            return self.parent
+        rank = {}
+        for k, i in enumerate(self.preorder):
+            rank[i] = k
+        parent = self.parent
+        return array('i', [-1 if parent[i] < 0 else rank[parent[i]] for i in self.preorder])
+
+    def iter_nodes(self, order, filter_fn=None):
+        """Generator of the nodes for the indices in `order` (for which filter_fn(node) is True)"""
+        nodes = self._nodes
+        if nodes is None:
+            tree = self._tree
+            it = (_ArrayNodeView(tree, i) for i in order)
+        elif order is self.preorder:
+            it = iter(nodes)
+        else:
+            it = (nodes[i] for i in order)
+        if filter_fn is None:
+            return it
+        return (nd for nd in it if filter_fn(nd))
+
+
+def _postorder_from_preorder_parents(parent):
+    """Returns the postorder (array of preorder ranks) for a sequence of the preorder ranks of
+    the parents of the nodes (in preorder). The subtrees that end just before node i are
+    those on the path from node i - 1 up to (but not including) the parent of i."""
+    postorder = []
+    emit = postorder.append
+    for i in range(1, len(parent)):
+        j = i - 1
+        p = parent[i]
+        while j != p:
+            emit(j)
+            j = parent[j]
+    j = len(parent) - 1
+    while j >= 0:
+        emit(j)
+        j = parent[j]
+    return array('i', postorder)
+
+
 class _TreeWithNodeIDs(object):
     def __init__(self):
         self._id2node = {}
         self._leaves = set()
         self._root = None
+        self._traversal = None
 
     @property
     def root(self):
@@ -186,24 +338,129 @@ class _TreeWithNodeIDs(object):
     def do_full_check_of_invariants(self, testCase, **kwargs):
         _do_full_check_of_tree_invariants(self, testCase, **kwargs)
 
-    def write_newick(self, out, **kwargs):
-        def _open_newick(node):
-            if node.is_first_child_of_parent:
-                out.write('(')
-            else:
-                out.write(',(')
-
-        def _t(node):
-            if not node.is_first_child_of_parent:
-                out.write(',')
-            _write_node_info_newick(out, node, **kwargs)
-
-        def _a(node):
-            out.write(')')
-            _write_node_info_newick(out, node, **kwargs)
+    def write_newick(self,
+                     out,
+                     label_fn=newick_node_id,
+                     edge_length_fn=None,
+                     internal_labels=True,
+                     path_id_comments=False,
+                     quote_labels=True,
+                     buffer_size=NEWICK_WRITE_BUFFER_SIZE):
+        """Writes the tree (terminated by ";\n") to the text stream `out`.
+        `label_fn(node)` returns the label of a node (None for no label). Labels are passed
+            through quote_newick_name unless `quote_labels` is False.
+        `edge_length_fn(node)` returns the length of the edge above a node (None for no
+            length), e.g. newick_edge_info. By default no edge lengths are written.
+        If `internal_labels` is False, only the tips are labelled.
+        If `path_id_comments` is True, a node whose edge holds more than one ID (see
+            NodeWithPathInEdges) is followed by a comment of its path IDs:
+            [&path_ids=<ID>,<parent's ID>,...]
+        The text is written in chunks of `buffer_size` pieces, so a large tree takes few
+        calls to out.write (`out` can be a gzip stream, see write_newick_file).
+        """
+        from peyotl.nexson_syntax import quote_newick_name
+        buf = []
+        add = buf.append
+        ta = self.traversal_arrays()
+        preorder, parent = ta.preorder, ta.parent
+        node_at = ta.node if ta._nodes is None else ta._nodes.__getitem__
+
+        def _close(i, stop):
+            """adds the info of tip i, then ")" and the info of each ancestor up to (not including) `stop`"""
+            is_leaf = True
+            while True:
+                node = node_at(i)
+                if is_leaf or internal_labels:
+                    label = label_fn(node)
+                    if label is not None:
+                        add(quote_newick_name(label) if quote_labels else label)
+                if path_id_comments:
+                    path_ids = node._path_ids
+                    if len(path_ids) > 1:
+                        add(u'[&path_ids={}]'.format(u','.join([u'{}'.format(x) for x in path_ids])))
+                if edge_length_fn is not None:
+                    length = edge_length_fn(node)
+                    if length is not None:
+                        add(u':{}'.format(length))
+                i = parent[i]
+                if i == stop:
+                    return
+                add(')')
+                is_leaf = False
+
+        prev = None
+        for i in preorder:
+            if prev is not None:
+                p = parent[i]
+                if p == prev:
+                    add('(')
+                else:
+                    _close(prev, p)
+                    add(',')
+                if len(buf) >= buffer_size:
+                    out.write(''.join(buf))
+                    del buf[:]
+            prev = i
+        if prev is not None:
+            _close(prev, -1)
+        add(';\n')
+        out.write(''.join(buf))
+
+    def to_binary(self, edge_length_fn=None):
+        """Returns the compact binary serialization of the tree (see peyotl.phylo.binary_tree)."""
+        from peyotl.phylo.binary_tree import tree_to_binary
+        return tree_to_binary(self, edge_length_fn=edge_length_fn)
+
+    def write_binary(self, filepath, edge_length_fn=None):
+        """Writes the binary serialization of the tree to `filepath` (see read_binary)."""
+        from peyotl.phylo.binary_tree import write_binary_tree
+        write_binary_tree(self, filepath, edge_length_fn=edge_length_fn)
+
+    @classmethod
+    def from_binary(cls, data):
+        """Returns a tree of this class from the bytes returned by to_binary."""
+        from peyotl.phylo.binary_tree import tree_from_binary
+        return tree_from_binary(data, _class=cls)
+
+    @classmethod
+    def read_binary(cls, filepath):
+        """Returns a tree of this class from a file written by write_binary."""
+        from peyotl.phylo.binary_tree import read_binary_tree
+        return read_binary_tree(filepath, _class=cls)
+
+    @classmethod
+    def _from_preorder_arrays(cls, parent, ids, paths, edge_lengths):
+        """Returns a tree with nodes given in preorder: `parent` (preorder # of the parent of
+        each node, -1 for the root), `ids` (node IDs), `paths` (dict of node # -> path IDs, for
+        nodes that do not have the default path) and `edge_lengths` (None, or a list holding
+        the edge_info of each node, None for no edge info). Nodes without an ID are not registered."""
+        tree = cls()
+        new_node = tree._new_node
+        nodes = []
+        for n, _id in enumerate(ids):
+            node = new_node(_id=_id, path_ids=paths.get(n))
+            nodes.append(node)
+            p = parent[n]
+            if p >= 0:
+                nodes[p].add_child(node)
+        if edge_lengths is not None:
+            for node, x in zip(nodes, edge_lengths):
+                if x is not None:
+                    node.edge.edge_info = x
+        if nodes:
+            tree._root = nodes[0]
+        register = tree._register_node
+        for node in nodes:
+            if node._id is not None:
+                register(node)
+        return tree
 
-        self._root.before_after_apply(before_fn=_open_newick, after_fn=_a, leaf_fn=_t)
-        out.write(';\n')
+    def write_newick_file(self, filepath, compress=None, **kwargs):
+        """Writes the tree (see write_newick) as utf-8 to `filepath`. The output is gzipped
+        if `compress` is True (or if `compress` is None and `filepath` ends with ".gz")."""
+        from peyotl.utility.input_output import open_text_for_write
+        with open_text_for_write(filepath, compress=compress) as out:
+            self.write_newick(out, **kwargs)
 
 
 class SpikeTreeError(Exception):
@@ -212,7 +469,9 @@ class SpikeTreeError(Exception):
 
 
 class TreeWithPathsInEdges(_TreeWithNodeIDs):
-    def __init__(self, id_to_par_id=None, newick_events=None):
+    _node_class = NodeWithPathInEdges
+
+    def __init__(self, id_to_par_id=None, newick_events=None, newick_tokens=None):
         _TreeWithNodeIDs.__init__(self)
         if id_to_par_id:
             self._id2par = id_to_par_id
@@ -222,40 +481,103 @@ class TreeWithPathsInEdges(_TreeWithNodeIDs):
             self._root_tail_hits_real_root = False
             if newick_events is not None:
                 self._build_from_newick_events(newick_events)
+            elif newick_tokens is not None:
+                self._build_from_newick_tokens(newick_tokens)
+
+    def _new_node(self, _id=None, path_ids=None):
+        node = self._node_class(_id=_id, path_ids=path_ids)
+        node._tree = self
+        return node
+
+    def _map_id_to_node(self, _id, node):
+        self._id2node[_id] = node
 
     def _build_from_newick_events(self, ev):
         iev = iter(ev)
         assert next(iev)['type'] == NewickEvents.OPEN_SUBTREE
-        self._root = NodeWithPathInEdges(_id=None)
+        self._root = self._new_node(_id=None)
         curr = self._root
         prev = NewickEvents.OPEN_SUBTREE
         for event in iev:
             t = event['type']
             if t == NewickEvents.OPEN_SUBTREE:
-                n = NodeWithPathInEdges(_id=None)
+                n = self._new_node(_id=None)
                 if prev == NewickEvents.OPEN_SUBTREE:
                     curr.add_child(n)
                 else:
                     curr.add_sib(n)
                 curr = n
             elif t == NewickEvents.TIP:
-                n = NodeWithPathInEdges(_id=event['label'])
+                n = self._new_node(_id=event['label'])
                 if prev == NewickEvents.OPEN_SUBTREE:
                     curr.add_child(n)
                 else:
                     curr.add_sib(n)
                 curr = n
-                self._id2node[n._id] = n
-                self._leaves.add(curr)
+                self._map_id_to_node(n._id, n)
+                self._leaves.add(n._id)
             else:
                 assert t == NewickEvents.CLOSE_SUBTREE
                 curr = curr._parent
                 x = event.get('label')
                 if x is not None:
                     curr._id = x
-                    self._id2node[x] = curr
+                    self._map_id_to_node(x, curr)
             prev = t
-        assert curr is self._root
+        assert curr == self._root
+
+    def _build_from_newick_tokens(self, tokens, edge_info=False):
+        """Builds the tree from (NewickTokenType, text) tuples (see
+        peyotl.utility.tokenizer.iter_newick_tokens) without creating event dicts.
+        Edge info is only stored (as node.edge.edge_info) if `edge_info` is True. COMMENT
+        tokens are added to node.edge.comments of the node that they follow (or of the next
+        node, if they follow a "(" or ",")."""
+        stack = []
+        prev = NewickTokenType.NONE
+        last = None  # the most recently completed node
+        pending_comments = None
+        for tt, text in tokens:
+            if tt is NewickTokenType.OPEN:
+                n = self._new_node(_id=None)
+                if stack:
+                    stack[-1].add_child(n)
+                else:
+                    self._root = n
+                stack.append(n)
+                if pending_comments:
+                    n.edge.comments = pending_comments
+                    pending_comments = None
+            elif tt is NewickTokenType.LABEL:
+                if prev is NewickTokenType.CLOSE:
+                    last._id = text
+                    self._map_id_to_node(text, last)
+                else:
+                    last = self._new_node(_id=text)
+                    stack[-1].add_child(last)
+                    self._map_id_to_node(text, last)
+                    self._leaves.add(text)
+                    if pending_comments:
+                        last.edge.comments = pending_comments
+                        pending_comments = None
+            elif tt is NewickTokenType.CLOSE:
+                last = stack.pop()
+            elif tt is NewickTokenType.EDGE_INFO:
+                if edge_info:
+                    last.edge.edge_info = text
+            elif tt is NewickTokenType.COMMENT:
+                if prev is NewickTokenType.OPEN or prev is NewickTokenType.COMMA:
+                    if pending_comments is None:
+                        pending_comments = []
+                    pending_comments.append(text)
+                else:
+                    e = last.edge
+                    try:
+                        e.comments.append(text)
+                    except AttributeError:
+                        e.comments = [text]
+                continue
+            prev = tt
+        assert not stack
 
     @property
     def leaf_ids(self):
@@ -265,7 +587,7 @@ class TreeWithPathsInEdges(_TreeWithNodeIDs):
         return iter(self._leaves)
 
     def create_leaf(self, node_id, register_node=True):
-        n = NodeWithPathInEdges(_id=node_id)
+        n = self._new_node(_id=node_id)
         self._add_node(n, register_node=register_node)
         return n
 
@@ -286,21 +608,71 @@ class TreeWithPathsInEdges(_TreeWithNodeIDs):
     def leaves(self):
         return [self._id2node[i] for i in self._leaves]
 
+    def _traversal_root_key(self):
+        return self._root
+
+    def traversal_arrays(self):
+        """Returns the TraversalArrays for the current topology. They are cached on the tree
+        and rebuilt after the root is replaced or the children of one of its nodes are
+        changed with add_child or replace_child (code that edits _children directly, or
+        that adds nodes that were not created by this tree, must call invalidate_traversals)."""
+        ta = self._traversal
+        if ta is None or ta._root_key != self._traversal_root_key():
+            ta = self._build_traversal_arrays()
+            self._traversal = ta
+        return ta
+
+    def invalidate_traversals(self):
+        self._traversal = None
+
+    def _build_traversal_arrays(self):
+        nodes = []
+        parent = []
+        root = self._root
+        if root is not None:
+            nodes.append(root)
+            parent.append(-1)
+            # parallel stacks of the preorder # of the open internal nodes and iterators over their children
+            par_stack = [0]
+            child_iters = [iter(root._children)]
+            add_node, add_parent = nodes.append, parent.append
+            while child_iters:
+                for nd in child_iters[-1]:
+                    add_parent(par_stack[-1])
+                    children = nd._children
+                    if children:
+                        par_stack.append(len(nodes))
+                        child_iters.append(iter(children))
+                    add_node(nd)
+                    break
+                else:
+                    child_iters.pop()
+                    par_stack.pop()
+        preorder = array('i', range(len(nodes)))
+        postorder = _postorder_from_preorder_parents(parent)
+        return TraversalArrays(preorder, postorder, array('i', parent), nodes, self, root)
+
     def postorder_node_iter(self, nd=None, filter_fn=None):
         if nd is None:
-            nd = self._root
+            if self._root is None:
+                return iter(())
+            ta = self.traversal_arrays()
+            return ta.iter_nodes(ta.postorder, filter_fn)
         return nd.postorder_iter(filter_fn=filter_fn)
 
     def preorder_node_iter(self, nd=None, filter_fn=None):
         if nd is None:
-            nd = self._root
+            if self._root is None:
+                return iter(())
+            ta = self.traversal_arrays()
+            return ta.iter_nodes(ta.preorder, filter_fn)
         return nd.preorder_iter(filter_fn=filter_fn)
 
     def __iter__(self):
-        return self._root.preorder_iter()
+        return self.preorder_node_iter()
 
     def add_bits4subtree_ids(self, relevant_ids):
-        """Adds a long integer bits4subtree_ids to each node (Fails cryptically if that field is already present!)
+        """Adds a long integer bits4subtree_ids to each node (replacing any earlier value).
         relevant_ids can be a dict of _id to bit representation.
         If it is not supplied, a dict will be created by registering the leaf._id into a dict (and returning the dict)
         the bits4subtree_ids will have a 1 bit if the _id is at or descended from this node and 0 if it is not
@@ -316,35 +688,294 @@ class TreeWithPathsInEdges(_TreeWithNodeIDs):
             bit = 1
         self.bits2internal_node = {}
         for node in self.postorder_node_iter():
-            p = node._parent
-            if p is None:
-                if not node.is_leaf:
-                    self.bits2internal_node[node.bits4subtree_ids] = node
-                continue
-            if not hasattr(p, 'bits4subtree_ids'):
-                p.bits4subtree_ids = 0
             i = node._id
-            # _LOG.debug('node._id ={}'.format(i))
-            # _LOG.debug('Before par mrca... = {}'.format(p.bits4subtree_ids))
-            if checking:
-                b = relevant_ids.get(i)
-                if b:
-                    if node.is_leaf:
-                        node.bits4subtree_ids = b
-                    else:
-                        node.bits4subtree_ids |= b
-            else:
-                if node.is_leaf:
-                    relevant_ids[i] = bit
-                    node.bits4subtree_ids = bit
+            if node.is_leaf:
+                if checking:
+                    b = relevant_ids.get(i, 0)
+                else:
+                    relevant_ids[i] = b = bit
                     bit <<= 1
-            if not node.is_leaf:
-                self.bits2internal_node[node.bits4subtree_ids] = node
-            # _LOG.debug('while add bitrep... self.bits2internal_node = {}'.format(self.bits2internal_node))
-            p.bits4subtree_ids |= node.bits4subtree_ids
+            else:
+                b = relevant_ids.get(i, 0) if checking else 0
+                for c in node.child_iter():
+                    b |= c.bits4subtree_ids
+                self.bits2internal_node[b] = node
+            node.bits4subtree_ids = b
         return relevant_ids
 
 
+class SlottedTreeWithPathsInEdges(TreeWithPathsInEdges):
+    """TreeWithPathsInEdges built from SlottedNodeWithPathInEdges nodes."""
+    _node_class = SlottedNodeWithPathInEdges
+
+
+class _ArrayNodeView(_BaseNode):
+    """Transient handle on node `index` of an ArrayTreeWithPathsInEdges. Views are created
+    on demand, so compare them with == rather than `is`."""
+    __slots__ = ('_tree', '_index')
+
+    def __init__(self, tree, index):
+        self._tree = tree
+        self._index = index
+
+    def __eq__(self, other):
+        return isinstance(other, _ArrayNodeView) and other._tree is self._tree and other._index == self._index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._index)
+
+    def _get_id(self):
+        return self._tree._ids[self._index]
+
+    def _set_id(self, _id):
+        self._tree._ids[self._index] = _id
+
+    _id = property(_get_id, _set_id)
+
+    @property
+    def _path_ids(self):
+        p = self._tree._paths.get(self._index)
+        if p is not None:
+            return p
+        _id = self._tree._ids[self._index]
+        return () if _id is None else (_id,)
+
+    @property
+    def _path_set(self):
+        return frozenset(self._path_ids)
+
+    @property
+    def _edge(self):
+        return self._tree._edges.get(self._index)
+
+    @property
+    def _parent(self):
+        p = self._tree._par[self._index]
+        if p < 0:
+            return None
+        return _ArrayNodeView(self._tree, p)
+
+    @property
+    def _children(self):
+        t = self._tree
+        c = []
+        i = t._first_child[self._index]
+        while i >= 0:
+            c.append(_ArrayNodeView(t, i))
+            i = t._next_sib[i]
+        return c
+
+    @property
+    def edge(self):
+        e = self._tree._edges.get(self._index)
+        if e is None:
+            e = ExtensibleObject()
+            self._tree._edges[self._index] = e
+        return e
+
+    def _get_bits(self):
+        try:
+            return self._tree._bits[self._index]
+        except KeyError:
+            raise AttributeError('bits4subtree_ids')
+
+    def _set_bits(self, b):
+        self._tree._bits[self._index] = b
+
+    bits4subtree_ids = property(_get_bits, _set_bits)
+
+    @property
+    def is_leaf(self):
+        return self._tree._first_child[self._index] < 0
+
+    @property
+    def is_first_child_of_parent(self):
+        t = self._tree
+        p = t._par[self._index]
+        return p < 0 or t._first_child[p] == self._index
+
+    @property
+    def is_last_child_of_parent(self):
+        t = self._tree
+        return t._par[self._index] < 0 or t._next_sib[self._index] < 0
+
+    def sib_iter(self):
+        p = self._parent
+        if p is None:
+            return
+        for c in p.child_iter():
+            if c._index != self._index:
+                yield c
+
+    def add_child(self, child):
+        t = self._tree
+        t._traversal = None
+        ci, pi = child._index, self._index
+        t._par[ci] = pi
+        last = t._last_child[pi]
+        if last < 0:
+            t._first_child[pi] = ci
+        else:
+            t._next_sib[last] = ci
+        t._last_child[pi] = ci
+
+    def replace_child(self, old_child, new_c):
+        """Puts `new_c` in the place of `old_child` among the children of this node.
+        `old_child` is left without a parent or next sibling."""
+        t = self._tree
+        t._traversal = None
+        oi, ni, pi = old_child._index, new_c._index, self._index
+        assert t._par[oi] == pi
+        first_child, next_sib = t._first_child, t._next_sib
+        if first_child[pi] == oi:
+            first_child[pi] = ni
+        else:
+            i = first_child[pi]
+            while next_sib[i] != oi:
+                i = next_sib[i]
+            next_sib[i] = ni
+        if t._last_child[pi] == oi:
+            t._last_child[pi] = ni
+        next_sib[ni] = next_sib[oi]
+        t._par[ni] = pi
+        next_sib[oi] = -1
+        t._par[oi] = -1
+
+
+class ArrayTreeWithPathsInEdges(TreeWithPathsInEdges):
+    """TreeWithPathsInEdges that stores the topology in parallel int arrays (parent,
+    first child, next sibling and last child indices) plus a list of node IDs, rather than
+    in node objects. Nodes returned by the traversal API are _ArrayNodeView handles.
+    Paths in edges are only stored for nodes whose path is more than their own ID.
+    """
+
+    def __init__(self, id_to_par_id=None, newick_events=None, newick_tokens=None):
+        self._ids = []
+        self._par = array('i')
+        self._first_child = array('i')
+        self._next_sib = array('i')
+        self._last_child = array('i')
+        self._paths = {}
+        self._edges = {}
+        self._bits = {}
+        self._root_index = -1
+        TreeWithPathsInEdges.__init__(self, id_to_par_id=id_to_par_id, newick_events=newick_events,
+                                      newick_tokens=newick_tokens)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _get_root(self):
+        if self._root_index < 0:
+            return None
+        return _ArrayNodeView(self, self._root_index)
+
+    def _set_root(self, n):
+        self._root_index = -1 if n is None else n._index
+
+    _root = property(_get_root, _set_root)
+
+    def _traversal_root_key(self):
+        return self._root_index
+
+    def _build_traversal_arrays(self):
+        first_child, next_sib, par = self._first_child, self._next_sib, self._par
+        preorder = array('i')
+        postorder = array('i')
+        root = self._root_index
+        i = root
+        while i >= 0:
+            preorder.append(i)
+            c = first_child[i]
+            if c >= 0:
+                i = c
+                continue
+            # climb until a node with a next sibling is found, leaving each subtree
+            postorder.append(i)
+            while i != root and next_sib[i] < 0:
+                i = par[i]
+                postorder.append(i)
+            i = -1 if i == root else next_sib[i]
+        return TraversalArrays(preorder, postorder, par, None, self, root)
+
+    def _new_node(self, _id=None, path_ids=None):
+        index = len(self._ids)
+        self._ids.append(_id)
+        for a in (self._par, self._first_child, self._next_sib, self._last_child):
+            a.append(-1)
+        if path_ids is not None:
+            path_ids = tuple(path_ids)
+            if path_ids != ((_id,) if _id is not None else ()):
+                self._paths[index] = path_ids
+        return _ArrayNodeView(self, index)
+
+    def _map_id_to_node(self, _id, node):
+        self._id2node[_id] = node._index
+
+    def _register_node(self, node):
+        i = node._id
+        self._id2node[i] = node._index
+        if node.is_leaf:
+            self._leaves.add(i)
+        elif i in self._leaves:
+            self._leaves.remove(i)
+        for i in node._path_ids:
+            self._id2node[i] = node._index
+
+    def find_node(self, _id):
+        return _ArrayNodeView(self, self._id2node[_id])
+
+    @property
+    def leaves(self):
+        return [self.find_node(i) for i in self._leaves]
+
+    def parent_indices(self):
+        """Returns the array of parent indices (-1 for the root)."""
+        return self._par
+
+    @classmethod
+    def _from_preorder_arrays(cls, parent, ids, paths, edge_lengths):
+        """Fills the arrays directly (storage index = preorder #), see
+        TreeWithPathsInEdges._from_preorder_arrays."""
+        tree = cls()
+        num_nodes = len(ids)
+        tree._ids = list(ids)
+        tree._par = array('i', parent)
+        first_child = array('i', [-1]) * num_nodes
+        next_sib = array('i', [-1]) * num_nodes
+        last_child = array('i', [-1]) * num_nodes
+        for i in range(1, num_nodes):
+            p = parent[i]
+            if first_child[p] < 0:
+                first_child[p] = i
+            else:
+                next_sib[last_child[p]] = i
+            last_child[p] = i
+        tree._first_child, tree._next_sib, tree._last_child = first_child, next_sib, last_child
+        id2node = tree._id2node
+        for n, path_ids in paths.items():
+            path_ids = tuple(path_ids)
+            tree._paths[n] = path_ids
+            for i in path_ids:
+                id2node[i] = n
+        for n, _id in enumerate(ids):
+            if _id is not None:
+                id2node[_id] = n
+                if first_child[n] < 0:
+                    tree._leaves.add(_id)
+        if edge_lengths is not None:
+            for n, x in enumerate(edge_lengths):
+                if x is not None:
+                    e = ExtensibleObject()
+                    e.edge_info = x
+                    tree._edges[n] = e
+        tree._root_index = 0 if num_nodes else -1
+        return tree
+
+
 def create_anc_lineage_from_id2par(id2par_id, ott_id):
     """Returns a list from [ott_id, ott_id's par, ..., root ott_id]"""
     curr = ott_id
@@ -362,14 +993,16 @@ def create_tree_from_id2par(id2par,
                             id_list,
                             _class=TreeWithPathsInEdges,
                             create_monotypic_nodes=False):
+    """Returns the tree induced by the IDs in `id_list` (a sequence, which is not modified)
+    from the ID -> parent ID dict `id2par` (None for an empty list)."""
     if not id_list:
         return None
-    f = id_list.pop(0)
+    f = id_list[0]
     anc_spike = create_anc_lineage_from_id2par(id2par, f)
     # _LOG.debug('anc_spike = {}'.format(anc_spike))
     assert f == anc_spike[0]
     tree = _class(id_to_par_id=id2par)
-    if not id_list:
+    if len(id_list) == 1:
         n = tree.create_leaf(f)
         tree._root = n
         del tree._id2par
@@ -381,7 +1014,7 @@ def create_tree_from_id2par(id2par,
         par = anc_spike[n + 1]
         realized_to_children[par] = {child}
     id_set = {f}
-    for ott_id in id_list:
+    for ott_id in islice(id_list, 1, None):
         id_set.add(ott_id)
         if ott_id in realized_to_children:
             _LOG.debug('element of id_list is a duplicate or ancestor or another element')
@@ -407,11 +1040,11 @@ def create_tree_from_id2par(id2par,
         root_nd = rc.pop()
         rc = realized_to_children[root_nd]
     # Now create a map from parent to (leaf_or_internal_des, [child, grandchild, ..., par_of_leaf_or_internal])
-    to_process = [root_nd]
-    tree._root = NodeWithPathInEdges(_id=root_nd)
+    to_process = deque([root_nd])
+    tree._root = tree._new_node(_id=root_nd)
     id2tree_node = {root_nd: tree._root}
     while to_process:
-        nd_id = to_process.pop(0)
+        nd_id = to_process.popleft()
         nd = id2tree_node[nd_id]
         c_id_set = realized_to_children[nd_id]
         for child_id in c_id_set:
@@ -428,7 +1061,7 @@ def create_tree_from_id2par(id2par,
                 path_ids.append(des_id)
                 path_ids.reverse()
             # _LOG.debug('NodeWithPathInEdges({}, path_ids={})'.format(des_id, path_ids))
-            nn = NodeWithPathInEdges(des_id, path_ids=path_ids)
+            nn = tree._new_node(des_id, path_ids=path_ids)
             id2tree_node[des_id] = nn
             nd.add_child(nn)
             if dc_id_set:
@@ -529,11 +1162,74 @@ def _do_full_check_of_tree_invariants(tree, testCase, id2par=None, leaf_ids=None
         TreeWithPathsInEdges(newick_events=nef)
 
 
-def parse_newick(newick=None, stream=None, filepath=None, _class=TreeWithPathsInEdges):
-    from peyotl.utility.tokenizer import NewickEventFactory, NewickTokenizer
-    nt = NewickTokenizer(stream=stream, newick=newick, filepath=filepath)
-    nef = NewickEventFactory(tokenizer=nt)
-    return _class(newick_events=nef)
+def parse_newick(newick=None, stream=None, filepath=None, _class=TreeWithPathsInEdges, edge_info=False):
+    """Returns a tree for a single newick string. If `edge_info` is True, the text after each
+    colon (e.g. the branch length) is stored as node.edge.edge_info."""
+    from peyotl.utility.tokenizer import iter_newick_tokens
+    tokens = iter_newick_tokens(stream=stream, newick=newick, filepath=filepath)
+    if not edge_info:
+        return _class(newick_tokens=tokens)
+    tree = _class()
+    tree._build_from_newick_tokens(tokens, edge_info=True)
+    return tree
+
+
+def _is_not_semicolon(token):
+    return token[0] is not NewickTokenType.SEMICOLON
+
+
+def iter_newick_trees(stream=None, newick=None, filepath=None, _class=TreeWithPathsInEdges,
+                      edge_info=False, comments=False, byte_range=None):
+    """Generator of the trees in a newick tree-set: any number of trees, each terminated
+    by a semicolon. The input is tokenized in chunks and each tree is built as soon as
+    its semicolon is read, so only one tree is held in memory at a time (by this
+    function). `edge_info` and `comments` are stored as described in
+    TreeWithPathsInEdges._build_from_newick_tokens.
+    If `byte_range` is a (start, end) pair, only those bytes of `filepath` are read; the
+    range must start and end at tree boundaries (see newick_tree_byte_ranges).
+    """
+    from peyotl.utility.tokenizer import ByteRangeReader, iter_newick_tokens
+    from itertools import chain, takewhile
+    import codecs
+    if byte_range is not None:
+        with ByteRangeReader(filepath, byte_range[0], byte_range[1]) as raw:
+            stream = codecs.getreader('utf-8')(raw)
+            for tree in iter_newick_trees(stream=stream, _class=_class, edge_info=edge_info, comments=comments):
+                yield tree
+        return
+    tokens = iter_newick_tokens(stream=stream, newick=newick, filepath=filepath, keep_comments=comments,
+                                multiple_trees=True)
+    for first in tokens:
+        tree = _class()
+        tree._build_from_newick_tokens(chain((first,), takewhile(_is_not_semicolon, tokens)), edge_info=edge_info)
+        yield tree
+
+
+def _map_newick_trees_in_range(args):
+    filepath, byte_range, fn, _class, edge_info, comments = args
+    return [fn(tree) for tree in iter_newick_trees(filepath=filepath, byte_range=byte_range, _class=_class,
+                                                   edge_info=edge_info, comments=comments)]
+
+
+def map_newick_trees(filepath, fn, num_workers=None, num_ranges=None, _class=TreeWithPathsInEdges,
+                     edge_info=False, comments=False):
+    """Yields fn(tree) for each tree in the newick tree-set `filepath` (in file order).
+    The file is split into `num_ranges` (default 4 * `num_workers`) byte ranges of whole
+    trees, and the ranges are parsed by a pool of `num_workers` processes (default: one
+    per CPU). `fn` must be picklable (e.g. a module-level function), and so must its
+    return values.
+    """
+    from peyotl.utility.parallel import default_num_workers, ordered_parallel_map
+    from peyotl.utility.tokenizer import newick_tree_byte_ranges
+    if num_workers is None:
+        num_workers = default_num_workers()
+    if num_ranges is None:
+        num_ranges = 4 * num_workers
+    ranges = newick_tree_byte_ranges(filepath, max(1, num_ranges))
+    arg_it = ((filepath, r, fn, _class, edge_info, comments) for r in ranges)
+    for results in ordered_parallel_map(_map_newick_trees_in_range, arg_it, num_workers):
+        for r in results:
+            yield r
 
 
 def parse_id2par_dict(id2par=None,
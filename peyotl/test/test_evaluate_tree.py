@@ -0,0 +1,150 @@
+#! /usr/bin/env python
+from peyotl.evaluate_tree import score_rootings_against_taxonomy
+from peyotl.phylo.tree import create_tree_from_id2par
+from peyotl.utility import get_logger
+import unittest
+import random
+
+_LOG = get_logger(__name__)
+
+
+def _random_id2par(leaves, rng, prefix):
+    """Random (possibly multifurcating) tree with `leaves` as the tips"""
+    id2par = {prefix: None}
+    to_split = [(prefix, list(leaves))]
+    n = 0
+    while to_split:
+        par, group = to_split.pop()
+        if len(group) == 1:
+            id2par[group[0]] = par
+            continue
+        rng.shuffle(group)
+        num_parts = rng.choice([2, 2, 3]) if len(group) > 2 else 2
+        cuts = sorted(rng.sample(range(1, len(group)), num_parts - 1))
+        for part in [group[i:j] for i, j in zip([0] + cuts, cuts + [len(group)])]:
+            if len(part) == 1:
+                id2par[part[0]] = par
+            else:
+                n += 1
+                nd = '{}{}'.format(prefix, n)
+                id2par[nd] = par
+                to_split.append((nd, part))
+    return id2par
+
+
+def _rerooted_and_collapsed(id2par, leaves, rng, prefix):
+    """Reroots the tree at a random internal node, collapses a random subset of its edges
+    and renames the internal nodes."""
+    adj = {}
+    for c, p in id2par.items():
+        if p is not None:
+            adj.setdefault(c, []).append(p)
+            adj.setdefault(p, []).append(c)
+    leaf_set = set(leaves)
+    internals = sorted(i for i in adj if i not in leaf_set)
+    root = rng.choice(internals)
+    new_id2par = {root: None}
+    stack = [root]
+    while stack:
+        nd = stack.pop()
+        for nb in adj[nd]:
+            if nb not in new_id2par:
+                new_id2par[nb] = nd
+                stack.append(nb)
+    for nd in internals:
+        if nd != root and rng.random() < 0.3:
+            p = new_id2par[nd]
+            for c, cp in list(new_id2par.items()):
+                if cp == nd:
+                    new_id2par[c] = p
+            del new_id2par[nd]
+    rename = dict((i, '{}{}'.format(prefix, n)) for n, i in enumerate(sorted(new_id2par)) if i not in leaf_set)
+    return dict((rename.get(c, c), rename.get(p, p)) for c, p in new_id2par.items())
+
+
+def _brute_force_scores(phylo, taxo):
+    leaves = frozenset(phylo.leaf_ids)
+    below = {}
+    for nd in phylo.postorder_node_iter():
+        if nd.is_leaf:
+            below[nd] = frozenset([nd._id])
+        else:
+            below[nd] = frozenset().union(*[below[c] for c in nd.child_iter()])
+    edges = [nd for nd in phylo.preorder_node_iter() if nd._parent is not None]
+    taxa = set()
+    for nd in taxo.preorder_node_iter():
+        if not nd.is_leaf and nd._parent is not None:
+            s = frozenset(i for i in (t._id for t in nd.preorder_iter()) if i in leaves)
+            if 1 < len(s) < len(leaves):
+                taxa.add(s)
+
+    def _score(clusters):
+        disp, inc = 0, 0
+        for t in taxa:
+            if t in clusters:
+                disp += 1
+            if any((c & t) and not (c <= t or t <= c) for c in clusters):
+                inc += 1
+        return disp, inc
+
+    def _is_desc(nd, anc):
+        while nd is not None:
+            if nd is anc:
+                return True
+            nd = nd._parent
+        return False
+
+    scores = {}
+    for x in phylo.preorder_node_iter():
+        if x.is_leaf:
+            continue
+        clusters = set(below[e] if not _is_desc(x, e) else leaves - below[e] for e in edges)
+        scores[('node', x._id)] = _score(clusters)
+    for r in edges:
+        clusters = set(below[e] if not _is_desc(r, e) or e is r else leaves - below[e] for e in edges)
+        clusters.add(leaves - below[r])
+        scores[('edge', r._parent._id, r._id)] = _score(clusters)
+    return scores
+
+
+class TestEvaluateTree(unittest.TestCase):
+    def testScoresMatchBruteForce(self):
+        rng = random.Random(12)
+        for rep in range(60):
+            leaves = ['l{}'.format(i) for i in range(rng.randint(3, 14))]
+            p_id2par = _random_id2par(leaves, rng, 'p')
+            phylo = create_tree_from_id2par(p_id2par, list(leaves))
+            if rep % 2:
+                t_id2par = _rerooted_and_collapsed(p_id2par, leaves, rng, 't')
+            else:
+                t_id2par = _random_id2par(leaves, rng, 't')
+            taxo = create_tree_from_id2par(t_id2par, list(leaves))
+            result = score_rootings_against_taxonomy(phylo, taxo)
+            exp = _brute_force_scores(phylo, taxo)
+            found = {}
+            for nd in phylo.preorder_node_iter():
+                if not nd.is_leaf:
+                    found[('node', nd._id)] = nd.rooting_here_score
+                if nd._parent is not None:
+                    found[('edge', nd._parent._id, nd._id)] = nd.edge.rooting_here_score
+            self.assertEqual(found, exp)
+            best = max(exp.values(), key=lambda s: (s[0], -s[1]))
+            self.assertEqual(result['best_score'], best)
+            self.assertEqual(sorted(result['best_rootings']), sorted(k for k, v in exp.items() if v == best))
+            self.assertEqual(result['current_score'], exp[('node', phylo.root._id)])
+
+    def testCompatibleTaxonomy(self):
+        p_id2par = {'r': None, 'a': 'r', 'b': 'r', 'h': 'a', 'p': 'a', 'g': 'b', 'o': 'b'}
+        t_id2par = {'T': None, 'hp': 'T', 'go': 'T', 'h': 'hp', 'p': 'hp', 'g': 'go', 'o': 'go'}
+        phylo = create_tree_from_id2par(p_id2par, ['h', 'p', 'g', 'o'])
+        taxo = create_tree_from_id2par(t_id2par, ['h', 'p', 'g', 'o'])
+        result = score_rootings_against_taxonomy(phylo, taxo)
+        self.assertEqual(result['current_score'], (2, 0))
+        self.assertEqual(result['best_score'], (2, 0))
+        self.assertEqual(sorted(result['best_rootings']), [('edge', 'r', 'a'), ('edge', 'r', 'b'), ('node', 'r')])
+        self.assertEqual(result['num_taxa'], 2)
+        self.assertEqual(phylo.find_node('h').edge.rooting_here_score, (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
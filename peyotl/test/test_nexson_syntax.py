@@ -1,6 +1,9 @@
 #! /usr/bin/env python
 from peyotl.nexson_syntax import (can_convert_nexson_forms,
                                   convert_nexson_format,
+                                  convert_to_nexml,
+                                  get_ot_study_info_from_nexml,
+                                  write_obj_as_nexml,
                                   DIRECT_HONEY_BADGERFISH,
                                   BADGER_FISH_NEXSON_VERSION,
                                   BY_ID_HONEY_BADGERFISH,
@@ -8,8 +11,11 @@ from peyotl.nexson_syntax import (can_convert_nexson_forms,
                                   sort_arbitrarily_ordered_nexson)
 from peyotl.test.support import equal_blob_check
 from peyotl.test.support import pathmap
+from peyotl.utility.str_util import flush_utf_8_writer, get_utf_8_string_io_writer
 from peyotl.utility import get_logger
 import unittest
+import codecs
+import copy
 import os
 
 _LOG = get_logger(__name__)
@@ -102,6 +108,110 @@ class TestConvert(unittest.TestCase):
             b = convert_nexson_format(obj, BY_ID_HONEY_BADGERFISH)
             equal_blob_check(self, '', b, b_expect)
 
+    def testSinglePassSameAsViaHBF1_0(self):
+        """0.0 <-> 1.2 is done in one pass, it should match going through 1.0"""
+        for src, dest in [(BADGER_FISH_NEXSON_VERSION, BY_ID_HONEY_BADGERFISH),
+                          (BY_ID_HONEY_BADGERFISH, BADGER_FISH_NEXSON_VERSION)]:
+            for fn in ['S15515.json', os.path.join('9', 'v1.0.json'), os.path.join('otu', 'v0.0.json')]:
+                obj = convert_nexson_format(pathmap.nexson_obj(fn), src)
+                # copying both, so that the dicts (and the order of the meta lists) are the same
+                expected = convert_nexson_format(copy.deepcopy(obj), DIRECT_HONEY_BADGERFISH, current_format=src)
+                expected = convert_nexson_format(expected, dest, current_format=DIRECT_HONEY_BADGERFISH)
+                b = convert_nexson_format(copy.deepcopy(obj), dest, current_format=src)
+                self.assertEqual(b, expected)
+
+    def testConversionReusesDicts(self):
+        obj = pathmap.nexson_obj(os.path.join('9', 'v0.0.json'))
+        nex = obj['nexml']
+        deposit = [i for i in nex['meta'] if i.get('@rel') == 'ot:dataDeposit'][0]
+        otus = nex['otus']
+        nodes = dict((i['@id'], i) for i in nex['trees']['tree'][0]['node'])
+        convert_nexson_format(obj, DIRECT_HONEY_BADGERFISH)
+        self.assertIs(nex['^ot:dataDeposit'], deposit)
+        self.assertEqual(deposit, {'@href': 'http://purl.org/phylo/treebase/phylows/study/TB2:S10149'})
+        convert_nexson_format(obj, BY_ID_HONEY_BADGERFISH)
+        self.assertIs(nex['otusById']['otus9'], otus)
+        tree = list(nex['treesById'].values())[0]['treeById']
+        node_by_id = list(tree.values())[0]['nodeById']
+        self.assertEqual(set(node_by_id.keys()), set(nodes.keys()))
+        for nid, node in node_by_id.items():
+            self.assertIs(node, nodes[nid])
+        convert_nexson_format(obj, BADGER_FISH_NEXSON_VERSION)
+        for node in nex['trees']['tree'][0]['node']:
+            self.assertIs(node, nodes[node['@id']])
+
+    def testKeepOldStructs(self):
+        obj = pathmap.nexson_obj(os.path.join('9', 'v1.0.json'))
+        b = convert_nexson_format(obj, BY_ID_HONEY_BADGERFISH, remove_old_structs=False)
+        self.assertIn('otus', b['nexml'])
+        self.assertIn('otusById', b['nexml'])
+
+
+class TestNexml2NexsonStream(unittest.TestCase):
+    def _check_same(self, versions=(BADGER_FISH_NEXSON_VERSION, DIRECT_HONEY_BADGERFISH, BY_ID_HONEY_BADGERFISH),
+                    **kwargs):
+        for v in versions:
+            exp = get_ot_study_info_from_nexml(nexson_syntax_version=v, streaming=False, **kwargs)
+            self.assertEqual(get_ot_study_info_from_nexml(nexson_syntax_version=v, **kwargs), exp)
+        return exp
+
+    def testTreebaseFile(self):
+        fp = os.path.join(pathmap.TESTS_DATA_DIR, 'nexml', 'S15515.xml')
+        o = self._check_same(src=fp)
+        self.assertNotIn('characters', o['nexml'])
+        self.assertTrue(o['nexml']['treesById'])
+        with codecs.open(fp, 'r', encoding='utf-8') as fo:
+            self.assertEqual(get_ot_study_info_from_nexml(src=fo), o)
+
+    def testRoundTripCorpus(self):
+        for d in RT_DIRS:
+            blob = pathmap.nexson_obj(os.path.join(d, 'v1.2.json'))
+            self._check_same(nexml_content=convert_to_nexml(blob).encode('utf-8'))
+
+    def testOtherNodes(self):
+        content = b'''<?xml version="1.0"?><nex:nexml xmlns:nex="http://www.nexml.org/2009"
+          xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" id="n" about="#n">a &amp; <!-- c -->b<![CDATA[ x ]]>
+          <?pi d?><characters id="c"><meta xsi:type="nex:LiteralMeta" property="p">x</meta></characters>
+          <meta xsi:type="nex:LiteralMeta" property="ot:n" datatype="xsd:int">3</meta>
+          <meta xsi:type="nex:LiteralMeta" property="two"><a/><b/></meta>
+          <meta xsi:type="nex:ResourceMeta" rel="r"><meta xsi:type="nex:LiteralMeta" property="b" content="y"/></meta>
+          </nex:nexml>'''
+        # not a study (no otus), so it can not be converted to the by-ID syntax
+        o = self._check_same(versions=(DIRECT_HONEY_BADGERFISH,), nexml_content=content)
+        n = o['nexml']
+        self.assertEqual(n['$'], u'a &b')
+        self.assertEqual(n['^ot:n'], 3)
+        self.assertNotIn('^two', n)
+        self.assertEqual(n['^r'], {'^b': u'y'})
+        self.assertEqual((n['#comment'], n['#cdata-section'], n['pi']), ([{}], [{}], [{}]))
+
+
+def _nexml(blob, **kwargs):
+    f, wrapper = get_utf_8_string_io_writer()
+    write_obj_as_nexml(blob, wrapper, **kwargs)
+    flush_utf_8_writer(wrapper)
+    return f.getvalue()
+
+
+class TestNexson2NexmlStream(unittest.TestCase):
+    def testSameAsMinidom(self):
+        for d in RT_DIRS:
+            for v in ('v1.0.json', 'v1.2.json'):
+                blob = pathmap.nexson_obj(os.path.join(d, v))
+                for kwargs in ({}, {'addindent': '  ', 'newl': '\n'}, {'otu_label': 'ot:ottTaxonName'}):
+                    exp = _nexml(blob, streaming=False, **kwargs)
+                    self.assertEqual(_nexml(blob, **kwargs), exp)
+                    self.assertIn('nexml', blob)
+
+    def testEscapingAndEmptyElements(self):
+        blob = {'nexml': {'@id': 'n', '@nexml2json': '1.0.0', '^ot:comment': 'a < b & "c"', '^ot:flag': True,
+                          'otus': [{'@id': 'o', 'otu': [{'@id': 'u', '^ot:originalLabel': 'x>y'}]}]}}
+        for kwargs in ({}, {'addindent': ' ', 'newl': '\n'}):
+            found = _nexml(blob, **kwargs)
+            self.assertEqual(found, _nexml(blob, streaming=False, **kwargs))
+        self.assertIn(u'label="x&gt;y"', found)
+        self.assertIn(u'>a &lt; b &amp; &quot;c&quot;</meta>', found)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,451 @@
+#! /usr/bin/env python
+from peyotl.ott import OTT, make_ott_to_children, make_tree_from_taxonomy, write_newick_ott
+from peyotl.ott.cache_update import patch_preorder
+from peyotl.ott.name_index import normalize_name
+from peyotl.ott.taxonomy_parser import iter_synonym_rows, iter_taxonomy_rows
+from peyotl.ott.taxonomy_store import (NOT_PRUNED, PRUNE_FLAGGED, PRUNE_INHERITED, OTTTaxonomyStore,
+                                       write_taxonomy_store)
+from peyotl.phylo.entities import OTULabelStyleEnum
+from peyotl.phylo.tree import TreeWithPathsInEdges
+from peyotl.utility.str_util import StringIO
+from peyotl.test.support import pathmap
+from peyotl.utility import get_logger
+import unittest
+import random
+import codecs
+import tempfile
+import shutil
+import os
+
+_LOG = get_logger(__name__)
+_OTT_SRC = os.path.join(pathmap.TESTS_DATA_DIR, 'ott')
+
+
+def _copy_test_ott():
+    """Returns a temp copy of the test taxonomy (so that caches are not written into the test data dir)."""
+    d = tempfile.mkdtemp()
+    ott_dir = os.path.join(d, 'ott')
+    shutil.copytree(_OTT_SRC, ott_dir)
+    return ott_dir
+
+
+def _induced_tree_summary(tree):
+    """Set of (node ID, path IDs, parent ID) for the nodes of an induced tree (ignores the order of children)."""
+    r = set()
+    for nd in tree.preorder_node_iter():
+        par_id = None if nd._parent is None else nd._parent._id
+        r.add((nd._id, tuple(nd._path_ids) if nd._parent is not None else None, par_id))
+    return r
+
+
+def _all_names(id2names):
+    """Set of the distinct normalized names in an ottID2names table"""
+    r = set()
+    for v in id2names.values():
+        r.update(normalize_name(i) for i in ((v,) if isinstance(v, type(u'')) or isinstance(v, str) else v))
+    return r
+
+
+class TestOTT(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ott_dir = _copy_test_ott()
+        cls.ott = OTT(ott_dir=cls.ott_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(os.path.split(cls.ott_dir)[0])
+
+    def testStoreMatchesPickles(self):
+        store = self.ott.taxonomy_store
+        id2par = self.ott.ott_id2par_ott_id
+        self.assertEqual(len(store), len(id2par))
+        self.assertEqual(store.root_ott_id, self.ott.root_ott_id)
+        for ott_id, par_id in id2par.items():
+            self.assertEqual(store.get_parent(ott_id), par_id)
+            self.assertEqual(store.get_flag_set_key(ott_id), self.ott.get_flag_set_key(ott_id))
+            names = self.ott.ott_id_to_names[ott_id]
+            exp = names if isinstance(names, type(u'')) or isinstance(names, str) else names[0]
+            self.assertEqual(store.get_name(ott_id), exp)
+
+    def testNamesAndLineage(self):
+        self.assertEqual(self.ott.get_name(8), u'Homo sapiens')
+        self.assertEqual(self.ott.get_name(11), u'Apis mellifera')
+        self.assertIsNone(self.ott.get_name(15))  # skipped "environmental samples"
+        self.assertIsNone(self.ott.get_name(12345))
+        self.assertEqual(self.ott.get_anc_lineage(8), [8, 6, 4, 2, 1])
+        self.assertEqual(self.ott.get_anc_lineage(1), [1])
+        self.assertRaises(KeyError, self.ott.get_anc_lineage, 12345)
+
+    def testIntervals(self):
+        o = self.ott
+        self.assertTrue(o.is_ancestor(4, 8))
+        self.assertTrue(o.is_ancestor(1, 17))
+        self.assertFalse(o.is_ancestor(8, 8))
+        self.assertTrue(o.is_ancestor(8, 8, proper=False))
+        self.assertFalse(o.is_ancestor(8, 4))
+        self.assertFalse(o.is_ancestor(5, 8))
+        self.assertEqual(o.subtree_size(1), len(o.ott_id2par_ott_id))
+        self.assertEqual(o.subtree_size(7), 5)
+        self.assertEqual(o.subtree_size(8), 1)
+        self.assertEqual(o.ids_in_subtree(4, [12, 8, 4, 12345, 17, 2]), [8, 4, 17])
+        for ott_id in o.ott_id2par_ott_id.keys():
+            lineage = set(o.get_anc_lineage(ott_id))
+            for other in o.ott_id2par_ott_id.keys():
+                self.assertEqual(o.is_ancestor(other, ott_id, proper=False), other in lineage)
+
+    def testMapOttIds(self):
+        o = self.ott
+        above, below = set(), set()
+        self.assertTrue(o.check_if_above_root(2, below, above, 4))
+        self.assertFalse(o.check_if_above_root(4, below, above, 4))
+        self.assertFalse(o.check_if_above_root(10, below, above, 4))
+        prune = o.convert_flag_string_set_to_union(['incertae_sedis'])
+        r = o.map_ott_ids([8, 17, 12, 12345, 16, 10], prune, 4)
+        mapped, unrecog, forward2unrecog, pruned, above_root, old2new = r
+        self.assertEqual(mapped, [8, 10])
+        self.assertEqual(unrecog, [12345])
+        self.assertEqual(pruned, [17, 16])
+        self.assertEqual(above_root, [12])
+
+    def testMRCA(self):
+        o = self.ott
+        self.assertEqual(o.mrca([8, 9]), 6)
+        self.assertEqual(o.mrca([8, 17]), 4)
+        self.assertEqual(o.mrca([8]), 8)
+        self.assertEqual(o.mrca([6, 8]), 6)
+        self.assertEqual(o.mrca([20, 14, 8]), 1)
+        self.assertEqual(o.mrca_many([[10, 17], [12, 20], (13,)]), [7, 5, 13])
+        self.assertRaises(KeyError, o.mrca, [8, 12345])
+        self.assertRaises(ValueError, o.mrca, [])
+        ids = list(o.ott_id2par_ott_id.keys())
+        for a in ids:
+            al = o.get_anc_lineage(a)
+            for b in ids:
+                bs = set(o.get_anc_lineage(b))
+                exp = [i for i in al if i in bs][0]
+                self.assertEqual(o.mrca([a, b]), exp)
+        self.assertEqual(o.lca_index.depth(17), 5)
+
+    def testNameIndex(self):
+        o = self.ott
+        self.assertEqual(normalize_name(u'  M\xfcller\'s   HONEYBEE '), u"muller's honeybee")
+        self.assertEqual(o.find_names(u'homo  SAPIENS'), [(8, u'Homo sapiens', False)])
+        self.assertEqual(o.find_names(u'muller\'s honeybee'), [(11, u'M\xfcller\'s honeybee', True)])
+        self.assertEqual(o.find_names(u'morus'), [(18, u'Morus', False), (19, u'Morus', False)])
+        self.assertEqual(o.find_names(u'orphan synonym'), [])
+        self.assertEqual(o.find_names(u'Mor'), [])
+        names = [u'Morus', u'human', u'PLANTAE', u'bogus', u'Homo sapiens']
+        found = o.match_names(names)
+        self.assertEqual(found, dict((n, o.find_names(n)) for n in names))
+        self.assertEqual(found[u'PLANTAE'], [(5, u'Plantae', True)])
+        self.assertEqual(found[u'bogus'], [])
+        self.assertEqual([i[0] for i in o.autocomplete_name(u'mor')], [18, 19, 20])
+        self.assertEqual(o.autocomplete_name(u'MORUS a'), [(20, u'Morus alba', False)])
+        self.assertEqual(len(o.autocomplete_name(u'mor', limit=2)), 2)
+        self.assertEqual(o.autocomplete_name(u'zzz'), [])
+        self.assertEqual(len(o.autocomplete_name(u'', limit=None)), sum(len(o.find_names(n)) for n in
+                                                                         _all_names(o.ott_id_to_names)))
+
+    def testNameIndexRebuiltFromNames(self):
+        ott_dir = _copy_test_ott()
+        try:
+            OTT(ott_dir=ott_dir).taxonomy_store  # builds the caches
+            os.remove(os.path.join(ott_dir, 'ottNameIndex.bin'))
+            o = OTT(ott_dir=ott_dir)
+            self.assertEqual(o.find_names(u'E. coli K-12'), [])
+            self.assertEqual(o.find_names(u'escherichia coli k-12'), [(14, u'Escherichia coli K-12', True)])
+            self.assertTrue(os.path.exists(os.path.join(ott_dir, 'ottNameIndex.bin')))
+        finally:
+            shutil.rmtree(os.path.split(ott_dir)[0])
+
+    def testInducedTreeByPreorder(self):
+        o = self.ott
+        # the root is left out, because the id2par method rejects it
+        ids = sorted(i for i, p in o.ott_id2par_ott_id.items() if p is not None)
+        rng = random.Random(5)
+        id_lists = [[8], [8, 9], [4, 8], [2, 8, 9], [8, 9, 10, 11, 12, 13, 20]]
+        id_lists.extend(rng.sample(ids, rng.randint(2, len(ids))) for _ in range(30))
+        for id_list in id_lists:
+            for monotypic in (False, True):
+                orig = list(id_list)
+                exp = o.induced_tree(id_list, create_monotypic_nodes=monotypic)
+                self.assertEqual(id_list, orig)
+                found = o.induced_tree(id_list, create_monotypic_nodes=monotypic, method='preorder')
+                self.assertEqual(id_list, orig)
+                self.assertEqual(_induced_tree_summary(found), _induced_tree_summary(exp))
+                self.assertEqual(set(found.leaf_ids), set(exp.leaf_ids))
+        store, lca_index = o.taxonomy_store, o.lca_index
+        self.assertEqual(store.preorder_numbers([8, 12345, 1]), [store.preorder_number(8), None, 0])
+        self.assertRaises(KeyError, store.preorder_numbers, [8, 12345], required=True)
+        pre = sorted(store.preorder_numbers(ids))
+        exp = [lca_index.lca_preorder(pre[i - 1], pre[i]) for i in range(1, len(pre))]
+        self.assertEqual(lca_index.adjacent_lca_preorders(pre), exp)
+        self.assertIsNone(o.induced_tree([], method='preorder'))
+        self.assertRaises(KeyError, o.induced_tree, [8, 12345], method='preorder')
+        self.assertRaises(ValueError, o.induced_tree, [8, 9], method='bogus')
+
+    def testSharedTables(self):
+        o = self.ott
+        o.preload()
+        other = OTT(ott_dir=self.ott_dir)
+        self.assertIs(other.ott_id_to_names, o.ott_id_to_names)
+        self.assertIs(other.taxonomy_store, o.taxonomy_store)
+        self.assertIs(other.forward_table, o.forward_table)
+        mu = other.memory_usage()
+        self.assertIn('ottID2names', mu)
+        self.assertIn('taxonomyStore', mu)
+        self.assertTrue(mu['ottID2names'] > 0)
+        self.assertRaises(ValueError, o.preload, ['bogus'])
+        o.preload(['uniq2ottID'])
+        self.assertIn('uniq2ottID', o.memory_usage())
+
+    def testNewickFromStore(self):
+        o = self.ott
+        o2c = make_ott_to_children(o.ott_id2par_ott_id)
+        for root in (None, 4, 7, 16):
+            for flags in (None, ['incertae_sedis'], o.TREEMACHINE_SUPPRESS_FLAGS):
+                for style in (OTULabelStyleEnum.OTT_ID, OTULabelStyleEnum.CURRENT_LABEL_OTT_ID):
+                    exp_out, out = StringIO(), StringIO()
+                    r = o.root_ott_id if root is None else root
+                    exp_log = write_newick_ott(exp_out, o, o2c, r, style, flags, create_log_dict=True)
+                    log = o.write_newick(out, root_ott_id=root, label_style=style, prune_flags=flags,
+                                         create_log_dict=True)
+                    self.assertEqual(out.getvalue(), exp_out.getvalue())
+                    self.assertEqual(log, exp_log)
+        out = StringIO()
+        o.write_newick(out, root_ott_id=7, prune_flags=['incertae_sedis'])
+        self.assertEqual(out.getvalue(), u"('Drosophila melanogaster','Apis mellifera')Arthropoda;")
+
+    def testFlagPruneMask(self):
+        o = self.ott
+        mask = o.flag_prune_mask(['incertae_sedis', 'hidden'])
+        self.assertIs(o.flag_prune_mask(['hidden', 'incertae_sedis']), mask)
+        store = o.taxonomy_store
+        self.assertEqual(mask[store.preorder_number(16)], PRUNE_FLAGGED)
+        self.assertEqual(mask[store.preorder_number(17)], PRUNE_INHERITED)
+        self.assertEqual(mask[store.preorder_number(19)], PRUNE_FLAGGED)
+        self.assertEqual(mask[store.preorder_number(8)], NOT_PRUNED)
+        prune = o.convert_flag_string_set_to_union(['extinct_inherited'])
+        self.assertTrue(o.check_if_in_pruned_subtree(11, set(), set(), prune))
+        self.assertFalse(o.check_if_in_pruned_subtree(10, set(), set(), prune))
+        known_unpruned = set()
+        self.assertFalse(o.check_if_in_pruned_subtree(987654, known_unpruned, set(), prune))
+        self.assertEqual(known_unpruned, {987654})
+
+    def testBinarySubtree(self):
+        o = self.ott
+        fp = os.path.join(os.path.split(self.ott_dir)[0], 'subtree.bin')
+        id2par = o.ott_id2par_ott_id
+        for root, flags in ((None, None), (4, None), (4, ['incertae_sedis', 'hidden'])):
+            num_written = o.write_binary_subtree(fp, root_ott_id=root, prune_flags=flags)
+            tree = TreeWithPathsInEdges.read_binary(fp)
+            found = set((nd._id, None if nd._parent is None else nd._parent._id) for nd in tree.preorder_node_iter())
+            self.assertEqual(len(found), num_written)
+            if root is None:
+                self.assertEqual(found, set(id2par.items()))
+                continue
+            self.assertIn((4, None), found)
+            pruned = set([16, 17, 19]) if flags else set()
+            exp = set((i, p) for i, p in id2par.items() if o.is_ancestor(4, i) and i not in pruned)
+            self.assertEqual(found - set([(4, None)]), exp)
+
+    def testColdStore(self):
+        self.ott.taxonomy_store  # make sure the cache exists
+        store = OTTTaxonomyStore(os.path.join(self.ott_dir, 'taxonomyStore.bin'))
+        try:
+            self.assertEqual(store.get_anc_lineage(20), [20, 18, 5, 2, 1])
+            self.assertTrue(17 in store)
+            self.assertFalse(15 in store)
+        finally:
+            store.close()
+
+
+class TestOTTCacheBuild(unittest.TestCase):
+    def testChunkedParallelParse(self):
+        tax_fp = os.path.join(_OTT_SRC, 'taxonomy.tsv')
+        serial = list(iter_taxonomy_rows(tax_fp, skip_prefixes=('environmental samples (',)))
+        self.assertEqual(len(serial), 19)
+        self.assertEqual(serial[0], (1, None, u'life', u'no rank', None, u'', None))
+        self.assertEqual(serial[14][-1], (u'incertae_sedis', u'unclassified'))
+        parallel = list(iter_taxonomy_rows(tax_fp, skip_prefixes=('environmental samples (',),
+                                           num_workers=2, chunk_size=64))
+        self.assertEqual(serial, parallel)
+        syn_fp = os.path.join(_OTT_SRC, 'synonyms.tsv')
+        self.assertEqual(list(iter_synonym_rows(syn_fp)), list(iter_synonym_rows(syn_fp, num_workers=2, chunk_size=32)))
+
+    def testIterativeTreeBuild(self):
+        # children listed before parents, and a lineage deeper than the recursion limit
+        id2par = {i: i - 1 for i in range(5000, 0, -1)}
+        id2par[0] = None
+        tt = make_tree_from_taxonomy(id2par)
+        self.assertEqual(len(tt), 5001)
+        self.assertEqual(tt[0].number_tree(0), 5001)
+        self.assertEqual(tt[4999].preorder_number, 4999)
+
+    def testTimedRebuild(self):
+        ott_dir = _copy_test_ott()
+        try:
+            ott = OTT(ott_dir=ott_dir, cache_build_workers=2)
+            self.assertEqual(ott.get_anc_lineage(17), [17, 16, 7, 4, 2, 1])
+            phases = [i[0] for i in ott.cache_build_timings]
+            self.assertIn('parse taxonomy', phases)
+            self.assertIn('taxonomy store', phases)
+            self.assertEqual(ott.get_ott_ids(u'human'), 8)
+        finally:
+            shutil.rmtree(os.path.split(ott_dir)[0])
+
+    def testIncrementalUpdate(self):
+        old_dir = _copy_test_ott()
+        par_dir = os.path.split(old_dir)[0]
+        new_dir = os.path.join(par_dir, 'new_ott')
+        full_dir = os.path.join(par_dir, 'full_ott')
+        try:
+            shutil.copytree(_OTT_SRC, new_dir)
+            _write_modified_release(new_dir)
+            shutil.copytree(new_dir, full_dir)
+            ott = OTT(ott_dir=old_dir, cache_build_workers=1)
+            ott.preload()
+            log_fp = os.path.join(par_dir, 'changes.json')
+            cl = ott.update_caches(new_dir, change_log_filepath=log_fp)
+            self.assertTrue(os.path.exists(log_fp))
+            self.assertEqual(cl['new_version'], u'ott0.1test')
+            self.assertEqual([i['ott_id'] for i in cl['added']], [21])
+            self.assertEqual(cl['removed'], [13])
+            self.assertEqual(cl['reparented'], [{'ott_id': 20, 'old_parent': 18, 'new_parent': 12}])
+            self.assertEqual([i['ott_id'] for i in cl['renamed']], [9])
+            self.assertEqual([i['ott_id'] for i in cl['flags_changed']], [8])
+            self.assertEqual(cl['synonyms_added'], [{'ott_id': 21, 'name': u'chimp'}])
+            self.assertEqual(cl['synonyms_removed'], [{'ott_id': 19, 'name': u'gannet'}])
+            self.assertEqual(list(cl['forwards_added'].keys()), [u'104'])
+            self.assertEqual(ott.version, u'ott0.1test')
+            self.assertEqual(ott.get_anc_lineage(20), [20, 12, 5, 2, 1])
+            self.assertEqual(ott.get_name(9), u'Mus musculus domesticus')
+            self.assertEqual(ott.mrca([21, 8]), 6)
+            self.assertEqual(ott.find_names(u'Chimp'), [(21, u'chimp', True)])
+            self.assertEqual(ott.find_names(u'gannet'), [])
+            self.assertRaises(KeyError, ott.get_anc_lineage, 13)
+            full = OTT(ott_dir=full_dir, cache_build_workers=1)
+            self._assert_same_caches(ott, full)
+        finally:
+            shutil.rmtree(par_dir)
+
+    def testPatchPreorder(self):
+        rng = random.Random(3)
+        d = tempfile.mkdtemp()
+        try:
+            for trial in range(40):
+                id2par = {0: None}
+                for i in range(1, 200):
+                    id2par[i] = rng.randrange(max(0, i - 20), i)
+                fp = os.path.join(d, 'store{}.bin'.format(trial))
+                tt = make_tree_from_taxonomy(id2par)
+                tt[0].number_tree(0)
+                old_preorder = sorted(id2par.keys(), key=lambda i: tt[i].preorder_number)
+                write_taxonomy_store(fp, old_preorder, id2par, {}, {})
+                store = OTTTaxonomyStore(fp)
+                new_id2par = dict(id2par)
+                removed = rng.sample(range(1, 200), rng.randint(0, 5))
+                for r in removed:
+                    del new_id2par[r]
+                kept = sorted(new_id2par.keys())
+                moved = set()
+                for i in kept:
+                    par = new_id2par[i]
+                    if par in removed or (i and rng.random() < 0.05):
+                        new_id2par[i] = rng.choice([j for j in kept if not _is_in_subtree(new_id2par, j, i)])
+                        moved.add(i)
+                next_id = 1000
+                for _ in range(rng.randint(0, 6)):  # new lineages
+                    par = rng.choice(kept)
+                    for _ in range(rng.randint(1, 3)):
+                        new_id2par[next_id] = par
+                        moved.add(next_id)
+                        par = next_id
+                        next_id += 1
+                moved = [i for i in moved if i not in removed]
+                found = patch_preorder(store, new_id2par, moved, removed)
+                self.assertEqual(sorted(found), sorted(new_id2par.keys()))
+                # each taxon must follow its parent or a descendant of its parent
+                path = []
+                for i in found:
+                    while path and path[-1] != new_id2par[i]:
+                        path.pop()
+                    self.assertTrue(bool(path) or i == 0)
+                    path.append(i)
+        finally:
+            shutil.rmtree(d)
+
+    def _assert_same_caches(self, upd, full):
+        self.assertEqual(upd.ott_id2par_ott_id, full.ott_id2par_ott_id)
+        self.assertEqual(upd.ott_id_to_names, full.ott_id_to_names)
+        self.assertEqual(upd.ott_id_to_ranks, full.ott_id_to_ranks)
+        self.assertEqual(upd.ott_id_to_sources, full.ott_id_to_sources)
+        self.assertEqual(upd.taxonomic_sources, full.taxonomic_sources)
+        self.assertEqual(upd.forward_table, full.forward_table)
+        self.assertEqual(upd.root_ott_id, full.root_ott_id)
+        for fn in ('uniq2ottID', 'ottID2uniq'):
+            self.assertEqual(upd._load_pickled(fn), full._load_pickled(fn))
+
+        def _as_sets(d):
+            return dict((k, frozenset(v) if isinstance(v, tuple) else frozenset([v])) for k, v in d.items())
+
+        for fn in ('name2ottID', 'homonym2ottID', 'nonhomonym2ottID'):
+            self.assertEqual(_as_sets(upd._load_pickled(fn)), _as_sets(full._load_pickled(fn)))
+        for ott_id in full.ott_id2par_ott_id.keys():
+            self.assertEqual(upd.get_anc_lineage(ott_id), full.get_anc_lineage(ott_id))
+            self.assertEqual(upd.get_name(ott_id), full.get_name(ott_id))
+            self.assertEqual(upd.subtree_size(ott_id), full.subtree_size(ott_id))
+            uf, ff = upd.get_flag_set_key(ott_id), full.get_flag_set_key(ott_id)
+            self.assertEqual(upd.flag_set_id_to_flag_set.get(uf), full.flag_set_id_to_flag_set.get(ff))
+
+
+def _is_in_subtree(id2par, ott_id, anc_id):
+    """True if `anc_id` is `ott_id` or one of its ancestors (or if a removed ancestor is found)."""
+    while ott_id is not None:
+        if ott_id == anc_id:
+            return True
+        ott_id = id2par.get(ott_id, anc_id)
+    return False
+
+
+def _replace_in_file(fp, pairs):
+    with codecs.open(fp, 'r', encoding='utf-8') as fo:
+        content = fo.read()
+    for old, new in pairs:
+        assert old in content
+        content = content.replace(old, new)
+    with codecs.open(fp, 'w', encoding='utf-8') as fo:
+        fo.write(content)
+
+
+def _write_modified_release(ott_dir):
+    """Edits a copy of the test taxonomy into a "new release": taxon 21 added, 13 removed, 20
+    moved from 18 to 12, 9 renamed, a flag added to 8, a synonym added and removed, and a new forward."""
+    tax_fp = os.path.join(ott_dir, 'taxonomy.tsv')
+    with codecs.open(tax_fp, 'r', encoding='utf-8') as fo:
+        lines = fo.readlines()
+    new_lines = []
+    for line in lines:
+        ls = line.split('\t|\t')
+        if ls[0] == '13':
+            continue
+        if ls[0] == '20':
+            ls[1] = '12'
+        elif ls[0] == '9':
+            ls[2] = u'Mus musculus domesticus'
+        elif ls[0] == '8':
+            ls[6] = u'hidden'
+        new_lines.append(u'\t|\t'.join(ls))
+    new_lines.append(u'21\t|\t6\t|\tPan troglodytes\t|\tspecies\t|\tncbi:9598\t|\t\t|\t\t|\t\n')
+    with codecs.open(tax_fp, 'w', encoding='utf-8') as fo:
+        fo.write(u''.join(new_lines))
+    _replace_in_file(os.path.join(ott_dir, 'synonyms.tsv'), [(u'gannet\t|\t19', u'chimp\t|\t21')])
+    with codecs.open(os.path.join(ott_dir, 'forwards.tsv'), 'a', encoding='utf-8') as fo:
+        fo.write(u'104\t9\n')
+    with codecs.open(os.path.join(ott_dir, 'version.txt'), 'w', encoding='utf-8') as fo:
+        fo.write(u'ott0.1test\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+from peyotl.phylo.binary_tree import BinaryTreeReader
+from peyotl.phylo.tree import (create_tree_from_id2par, newick_edge_info, parse_newick, ArrayTreeWithPathsInEdges,
+                               SlottedTreeWithPathsInEdges, TreeWithPathsInEdges)
+from peyotl.utility.str_util import StringIO
+from peyotl.utility import get_logger
+import unittest
+import tempfile
+import shutil
+import os
+
+_LOG = get_logger(__name__)
+
+_ID2PAR = {1: None, 2: 1, 3: 2, 4: 3, 5: 3, 6: 1, 7: 6, 8: 7, 9: 7}
+_CLASSES = (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges)
+
+
+def _newick(tree, **kwargs):
+    o = StringIO()
+    tree.write_newick(o, **kwargs)
+    return o.getvalue()
+
+
+def _summary(tree):
+    """(ID, path IDs, parent ID) of each node in preorder"""
+    return [(nd._id, tuple(nd._path_ids), None if nd._parent is None else nd._parent._id)
+            for nd in tree.preorder_node_iter()]
+
+
+class TestBinaryTree(unittest.TestCase):
+    def testNewickRoundTrip(self):
+        nwk = "((h:1,'p q':2)hp:3,(g:0.5,Po),x)r;"
+        for cls in _CLASSES:
+            tree = parse_newick(newick=nwk, _class=cls, edge_info=True)
+            data = tree.to_binary(edge_length_fn=newick_edge_info)
+            for out_cls in _CLASSES:
+                found = out_cls.from_binary(data)
+                self.assertIsInstance(found, out_cls)
+                self.assertEqual(_newick(found, edge_length_fn=newick_edge_info),
+                                 "((h:1.0,'p q':2.0)hp:3.0,(g:0.5,Po),x)r;\n")
+                self.assertEqual(sorted(found.leaf_ids), ['Po', 'g', 'h', 'p q', 'x'])
+                self.assertEqual(found.find_node('hp'), found.find_node('h')._parent)
+            self.assertEqual(_newick(TreeWithPathsInEdges.from_binary(tree.to_binary())), _newick(tree))
+
+    def testPathsAndFiles(self):
+        d = tempfile.mkdtemp()
+        try:
+            for monotypic in (False, True):
+                tree = create_tree_from_id2par(_ID2PAR, [4, 5, 8, 9], create_monotypic_nodes=monotypic)
+                fp = os.path.join(d, 'tree.bin')
+                tree.write_binary(fp)
+                for cls in _CLASSES:
+                    found = cls.read_binary(fp)
+                    self.assertEqual(_summary(found), _summary(tree))
+                    self.assertEqual(sorted(found.leaf_ids), [4, 5, 8, 9])
+                reader = BinaryTreeReader(filepath=fp)
+                try:
+                    self.assertEqual(len(reader), len(_summary(tree)))
+                    self.assertEqual(reader.parent[0], -1)
+                    self.assertEqual(reader.label(0), 1)
+                    self.assertIsNone(reader.edge_length(0))
+                    exp = dict((nd._id, tuple(nd._path_ids)) for nd in tree.preorder_node_iter())
+                    self.assertEqual(dict((reader.label(i), reader.path_ids(i)) for i in range(len(reader))), exp)
+                finally:
+                    reader.close()
+        finally:
+            shutil.rmtree(d)
+        self.assertRaises(ValueError, BinaryTreeReader, data=b'NOTATREE' + b'\0' * 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
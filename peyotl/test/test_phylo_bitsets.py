@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+from peyotl.phylo.bitsets import (available_bitset_backends, get_bitset_backend, tree_clade_bitsets,
+                                  BigIntCladeBitsets)
+from peyotl.phylo.compat import (SplitComparison, compare_bits_as_splits, compare_sets_as_splits,
+                                 compare_split_collections, find_incompatible_splits,
+                                 split_comparison_from_counts, splits_incompatible_with_tree)
+from peyotl.phylo.tree import parse_newick
+from peyotl.utility import get_logger
+import unittest
+import random
+
+_LOG = get_logger(__name__)
+
+
+def _as_list(m):
+    return [list(row) for row in m]
+
+
+class TestCladeBitsets(unittest.TestCase):
+    def _random_clades(self, rng, num_leaves, num_clades):
+        return [rng.sample(range(num_leaves), rng.randint(0, num_leaves)) for _ in range(num_clades)]
+
+    def testSplitComparisonFromCounts(self):
+        uni = frozenset(range(6))
+        rng = random.Random(3)
+        for _ in range(200):
+            a = frozenset(rng.sample(range(6), rng.randint(1, 5)))
+            b = frozenset(rng.sample(range(6), rng.randint(1, 5)))
+            exp = compare_sets_as_splits(a, b, uni)
+            self.assertEqual(split_comparison_from_counts(len(a & b), len(a), len(b), 6), exp)
+
+    def testBackendsAgree(self):
+        rng = random.Random(1)
+        for num_leaves in (3, 64, 65, 130):
+            one = self._random_clades(rng, num_leaves, 9)
+            other = self._random_clades(rng, num_leaves, 7)
+            universe = (1 << num_leaves) - 1
+            for name in available_bitset_backends():
+                cls = get_bitset_backend(name)
+                a = cls.from_leaf_indices(one, num_leaves)
+                b = cls.from_leaf_indices(other, num_leaves)
+                self.assertEqual([a.as_int(i) for i in range(len(a))],
+                                 [sum(1 << j for j in set(c)) for c in one])
+                self.assertEqual(list(a.sizes()), [len(set(c)) for c in one])
+                self.assertEqual(_as_list(a.intersection_counts(b)),
+                                 [[len(set(x) & set(y)) for y in other] for x in one])
+                self.assertEqual(_as_list(a.is_subset(b)), [[set(x) <= set(y) for y in other] for x in one])
+                self.assertEqual(_as_list(a.intersects(b)), [[bool(set(x) & set(y)) for y in other] for x in one])
+                exp = [[compare_bits_as_splits(a.as_int(i), b.as_int(j), universe).value for j in range(len(b))]
+                       for i in range(len(a))]
+                self.assertEqual(_as_list(a.compare_as_splits(b)), exp)
+
+    def testTreeCladeBitsets(self):
+        tree = parse_newick(newick='((h,p)hp,(g,(o,q)oq)goq)r;')
+        leaf_index = dict((i, n) for n, i in enumerate('hpgoq'))
+        for name in available_bitset_backends():
+            bits, nodes = tree_clade_bitsets(tree, leaf_index=leaf_index, backend=name)
+            self.assertEqual([n._id for n in nodes], ['hp', 'oq', 'goq', 'r'])
+            self.assertEqual([bits.as_int(i) for i in range(len(bits))], [3, 24, 28, 31])
+            bits, nodes = tree_clade_bitsets(tree, backend=name, include_leaves=True)
+            self.assertEqual(len(nodes), 9)
+            self.assertEqual(bits.num_leaves, 5)
+        bits, nodes = tree_clade_bitsets(tree, leaf_index={'h': 0, 'o': 1}, backend=BigIntCladeBitsets)
+        self.assertEqual(bits.rows, [1, 2, 2, 3])
+        self.assertRaises(ValueError, get_bitset_backend, 'bogus')
+        self.assertEqual(SplitComparison(bits.compare_as_splits(bits)[0][3]), SplitComparison.ROOTED_COMPAT)
+
+    def testSplitCollections(self):
+        rng = random.Random(5)
+        num_leaves = 20
+        one = self._random_clades(rng, num_leaves, 23)
+        other = self._random_clades(rng, num_leaves, 11)
+        universe = (1 << num_leaves) - 1
+        for name in available_bitset_backends():
+            cls = get_bitset_backend(name)
+            a = cls.from_leaf_indices(one, num_leaves)
+            b = cls.from_leaf_indices(other, num_leaves)
+            exp = [[compare_bits_as_splits(a.as_int(i), b.as_int(j), universe) for j in range(len(b))]
+                   for i in range(len(a))]
+            for num_workers in (1, 2):
+                m = compare_split_collections(a, b, num_workers=num_workers)
+                self.assertEqual(_as_list(m), [[c.value for c in row] for row in exp])
+                found = find_incompatible_splits(a, b, num_workers=num_workers)
+                self.assertEqual(found, [(i, j) for i, row in enumerate(exp) for j, c in enumerate(row)
+                                         if c == SplitComparison.UNROOTED_INCOMPATIBLE])
+                found = find_incompatible_splits(a, b, rooted=True, num_workers=num_workers)
+                self.assertEqual(found, [(i, j) for i, x in enumerate(one) for j, y in enumerate(other)
+                                         if set(x) & set(y) and not (set(x) <= set(y) or set(y) <= set(x))])
+        self.assertRaises(ValueError, compare_split_collections, BigIntCladeBitsets([1], 3),
+                          BigIntCladeBitsets([1], 4))
+
+    def testSplitsIncompatibleWithTree(self):
+        tree = parse_newick(newick='((h,p)hp,(g,(o,q)oq)goq)r;')
+        splits = [('h', 'p'), ('p', 'g'), ('g', 'o', 'x'), ('h', 'p', 'g'), ('o', 'q', 'h')]
+        for name in available_bitset_backends():
+            self.assertEqual(splits_incompatible_with_tree(splits, tree, backend=name), [1, 2, 4])
+            self.assertEqual(splits_incompatible_with_tree(splits, tree, rooted=True, backend=name,
+                                                           num_workers=2), [1, 2, 3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
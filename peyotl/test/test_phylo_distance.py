@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+from peyotl.phylo.distance import (all_pairs_tree_distances, matching_split_distance, robinson_foulds_distance,
+                                   weighted_robinson_foulds_distance)
+from peyotl.phylo.tree import parse_newick, ArrayTreeWithPathsInEdges
+from peyotl.utility import get_logger
+from itertools import permutations
+import unittest
+import random
+
+_LOG = get_logger(__name__)
+
+
+def _random_newick(leaves, rng):
+    """Random (possibly multifurcating) tree with branch lengths"""
+    def _subtree(group):
+        if len(group) == 1:
+            return '{}:{}'.format(group[0], rng.randint(1, 4))
+        num_parts = min(len(group), rng.choice([2, 2, 3]))
+        cuts = sorted(rng.sample(range(1, len(group)), num_parts - 1))
+        parts = [group[i:j] for i, j in zip([0] + cuts, cuts + [len(group)])]
+        return '({}):{}'.format(','.join(_subtree(p) for p in parts), rng.randint(1, 4))
+
+    group = list(leaves)
+    rng.shuffle(group)
+    return _subtree(group) + ';'
+
+
+def _splits(newick, shared):
+    """Brute force: dict of split (frozenset of the side without the smallest leaf) -> length"""
+    tree = parse_newick(newick=newick, edge_info=True)
+    first = min(shared)
+    below = {}
+    out = {}
+    for nd in tree.postorder_node_iter():
+        if nd.is_leaf:
+            below[id(nd)] = frozenset([nd._id]) & shared
+        else:
+            below[id(nd)] = frozenset().union(*[below[id(c)] for c in nd.child_iter()])
+        if nd._parent is not None:
+            s = below[id(nd)]
+            if first in s:
+                s = shared - s
+            if 0 < len(s) < len(shared):
+                out[s] = out.get(s, 0.0) + float(nd.edge.edge_info)
+    return out
+
+
+def _brute_force(newick1, newick2, shared):
+    a, b = _splits(newick1, shared), _splits(newick2, shared)
+    nontrivial_a = [s for s in a if 1 < len(s) < len(shared) - 1]
+    nontrivial_b = [s for s in b if 1 < len(s) < len(shared) - 1]
+    rf = len(set(nontrivial_a) ^ set(nontrivial_b))
+    wrf = sum(abs(a.get(s, 0.0) - b.get(s, 0.0)) for s in set(a) | set(b))
+    size = max(len(nontrivial_a), len(nontrivial_b))
+    pa = nontrivial_a + [frozenset()] * (size - len(nontrivial_a))
+    pb = nontrivial_b + [frozenset()] * (size - len(nontrivial_b))
+    n = len(shared)
+
+    def _cost(x, y):
+        k = len(x ^ y)
+        return min(k, n - k)
+
+    matching = min(sum(_cost(x, y) for x, y in zip(pa, p)) for p in permutations(pb))
+    return rf, wrf, matching
+
+
+def _parse(newick, _class=None):
+    if _class is None:
+        return parse_newick(newick=newick, edge_info=True)
+    return parse_newick(newick=newick, edge_info=True, _class=_class)
+
+
+class TestTreeDistances(unittest.TestCase):
+    def testSmallTrees(self):
+        t1 = '((a:1,b:1):2,(c:1,d:1):1,e:1);'
+        t2 = '((a:1,c:1):2,(b:1,d:1):1,e:1);'
+        t3 = '(a:1,(b:1,(e:1,(c:1,d:1):1):3):2);'
+        self.assertEqual(robinson_foulds_distance(_parse(t1), _parse(t2)), 4)
+        self.assertEqual(robinson_foulds_distance(_parse(t1), _parse(t3)), 0)
+        self.assertEqual(matching_split_distance(_parse(t1), _parse(t2)), 4)
+        self.assertEqual(weighted_robinson_foulds_distance(_parse(t1), _parse(t3)), 3.0)
+        # only the leaves that are in both trees are compared
+        self.assertEqual(robinson_foulds_distance(_parse(t1), _parse('((a:1,b:1):1,(c:1,x:1):1,e:1);')), 0)
+
+    def testMatchesBruteForce(self):
+        rng = random.Random(7)
+        for rep in range(40):
+            leaves = ['l{}'.format(i) for i in range(rng.randint(4, 8))]
+            other = list(leaves) if rep % 3 else leaves[1:] + ['x', 'y']
+            n1, n2 = _random_newick(leaves, rng), _random_newick(other, rng)
+            shared = frozenset(leaves) & frozenset(other)
+            rf, wrf, matching = _brute_force(n1, n2, shared)
+            self.assertEqual(robinson_foulds_distance(_parse(n1), _parse(n2)), rf)
+            self.assertEqual(robinson_foulds_distance(_parse(n1, ArrayTreeWithPathsInEdges), _parse(n2)), rf)
+            self.assertAlmostEqual(weighted_robinson_foulds_distance(_parse(n1), _parse(n2)), wrf)
+            self.assertEqual(matching_split_distance(_parse(n1), _parse(n2)), matching)
+
+    def testAllPairs(self):
+        rng = random.Random(3)
+        leaves = ['l{}'.format(i) for i in range(9)]
+        newicks = [_random_newick(leaves if i % 4 else leaves[2:], rng) for i in range(6)]
+        for metric, fn in (('rf', robinson_foulds_distance),
+                           ('weighted_rf', weighted_robinson_foulds_distance),
+                           ('matching', matching_split_distance)):
+            exp = [[fn(_parse(a), _parse(b)) for b in newicks] for a in newicks]
+            for num_workers in (1, 2):
+                found = all_pairs_tree_distances([_parse(n) for n in newicks], metric=metric,
+                                                 num_workers=num_workers)
+                self.assertEqual(found, exp)
+        self.assertRaises(ValueError, all_pairs_tree_distances, [], 'bogus')
+
+    def testAllPairsWithoutFork(self):
+        import peyotl.utility.parallel as parallel
+        newicks = ['((a,b),(c,d),e);', '((a,c),(b,d),e);', '((a,b,c),(d,e));']
+        exp = all_pairs_tree_distances([_parse(n) for n in newicks], num_workers=1)
+        fork_context = parallel._fork_context
+        parallel._fork_context = lambda: None
+        try:
+            found = all_pairs_tree_distances([_parse(n) for n in newicks], num_workers=2)
+        finally:
+            parallel._fork_context = fork_context
+        self.assertEqual(found, exp)
+
+
+if __name__ == "__main__":
+    unittest.main()
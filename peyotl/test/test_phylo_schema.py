@@ -1,8 +1,10 @@
 #! /usr/bin/env python
-from peyotl.nexson_syntax import PhyloSchema, extract_tree_nexson, detect_nexson_version
+from peyotl.nexson_syntax import ConversionCache, PhyloSchema, extract_tree_nexson, detect_nexson_version
 from peyotl.test.support import pathmap
 from peyotl.utility import get_logger
 import unittest
+import tempfile
+import shutil
 import json
 import os
 
@@ -205,5 +207,55 @@ class TestPhyloSchema(unittest.TestCase):
         self.assertTrue(nex.startswith('('))  # pylint: disable=E1103
 
 
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testLRU(self):
+        c = ConversionCache(max_bytes=10)
+        c.put('a', 'k', '1234')
+        c.put('b', 'k', '5678')
+        self.assertEqual(c.get('a', 'k'), '1234')
+        c.put('c', 'k', '90')
+        c.put('d', 'k', '4321')  # evicts b (a was used more recently)
+        self.assertIsNone(c.get('b', 'k'))
+        self.assertEqual(c.get('a', 'k'), '1234')
+        self.assertEqual(c.nbytes, 10)
+        c.put('e', 'k', 'x' * 11)  # larger than the cache
+        self.assertIsNone(c.get('e', 'k'))
+        self.assertEqual(c.stats(), {'hits': 2, 'disk_hits': 0, 'misses': 2, 'entries': 3, 'nbytes': 10})
+        c.put('f', 'k', u'\u00e9\u00e9\u00e9')  # 3 characters, but 6 bytes in utf-8
+        self.assertEqual(c.nbytes, 10)
+        self.assertEqual(len(c), 2)
+
+    def testSchemaConvert(self):
+        c = ConversionCache(cache_dir=self.tmp_dir)
+        schemas = [PhyloSchema('nexson', version='1.0.0'),
+                   PhyloSchema('nexson', version='1.0.0', content='otus'),
+                   PhyloSchema(type_ext='.tre'),
+                   PhyloSchema(type_ext='.tre', otu_label='ottid'),
+                   PhyloSchema(type_ext='.nexml')]
+        self.assertEqual(len(set(ps.cache_key for ps in schemas)), len(schemas))
+        for ps in schemas:
+            expected = ps.convert(pathmap.nexson_obj('9/v1.2.json'))
+            for n in range(2):
+                r = ps.convert(pathmap.nexson_obj('9/v1.2.json'), cache=c, blob_sha='abc')
+                self.assertEqual(r, expected)
+            o = pathmap.nexson_obj('9/v1.2.json')
+            unchanged = pathmap.nexson_obj('9/v1.2.json')
+            ps.convert(o, cache=c, blob_sha='abc')
+            self.assertEqual(o, unchanged)
+        self.assertEqual((c.hits, c.misses), (2 * len(schemas), len(schemas)))
+        ps = schemas[0]
+        expected = ps.serialize(pathmap.nexson_obj('9/v1.2.json'))
+        self.assertEqual(ps.serialize(None, cache=c, blob_sha='abc'), expected)
+        c = ConversionCache(cache_dir=self.tmp_dir)
+        self.assertEqual(ps.serialize(None, cache=c, blob_sha='abc'), expected)
+        self.assertEqual(c.disk_hits, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,15 @@
 #! /usr/bin/env python
-from peyotl.phylo.tree import create_tree_from_id2par
+from peyotl.phylo.tree import (create_tree_from_id2par, iter_newick_trees, map_newick_trees, newick_edge_info,
+                               parse_newick, ArrayTreeWithPathsInEdges, SlottedTreeWithPathsInEdges,
+                               TreeWithPathsInEdges)
+from peyotl.utility.str_util import StringIO
 from peyotl.utility import get_logger
 import unittest
+import tempfile
+import codecs
+import gzip
+import shutil
+import os
 
 _bogus_id2par = {'h': 'hp',
                  'p': 'hp',
@@ -67,5 +75,198 @@ class TestPhyloTree(unittest.TestCase):
         tree.do_full_check_of_invariants(self, id2par=_bogus_id2par)
 
 
+def _newick(tree):
+    o = StringIO()
+    tree.write_newick(o)
+    return o.getvalue()
+
+
+class TestCompactTrees(unittest.TestCase):
+    def testSameTopology(self):
+        tips = ['h', 'p', 'g', 'Po', 'Hy', 'Sy', 'Ho', 'No']
+        for kwargs in ({}, {'create_monotypic_nodes': True}):
+            exp = create_tree_from_id2par(_bogus_id2par, list(tips), **kwargs)
+            exp_nwk = _newick(exp)
+            for cls in (SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+                tree = create_tree_from_id2par(_bogus_id2par, list(tips), _class=cls, **kwargs)
+                self.assertIsInstance(tree, cls)
+                tree.do_full_check_of_invariants(self, id2par=_bogus_id2par)
+                self.assertEqual(_newick(tree), exp_nwk)
+                self.assertEqual(sorted(tree.leaf_ids), sorted(exp.leaf_ids))
+                self.assertEqual([n._id for n in tree.postorder_node_iter()],
+                                 [n._id for n in exp.postorder_node_iter()])
+                self.assertEqual(tree.find_node('h')._parent._id, 'hp')
+                self.assertEqual(set(tree.find_node('h').sib_iter()), {tree.find_node('p')})
+        tree = create_tree_from_id2par(_bogus_id2par, ['h'], _class=ArrayTreeWithPathsInEdges)
+        self.assertEqual(tree.root._id, 'h')
+
+    def testSlots(self):
+        tree = create_tree_from_id2par(_bogus_id2par, ['h', 'p', 'Ho'], _class=SlottedTreeWithPathsInEdges)
+        self.assertFalse(hasattr(tree.root, '__dict__'))
+        self.assertEqual(tree.find_node('HySyHoNo')._path_ids, ('Ho', 'HySyHoNo'))
+        bits = tree.add_bits4subtree_ids(None)
+        self.assertEqual(tree.root.bits4subtree_ids, sum(bits.values()))
+        at = create_tree_from_id2par(_bogus_id2par, ['h', 'p', 'Ho'], _class=ArrayTreeWithPathsInEdges)
+        self.assertEqual(len(at), 5)
+        self.assertEqual(at.find_node('Ho')._path_ids, ('Ho', 'HySyHoNo'))
+        bits = at.add_bits4subtree_ids(None)
+        self.assertEqual(at.root.bits4subtree_ids, sum(bits.values()))
+
+    def testParseNewick(self):
+        nwk = '((h,p)hp,g,(Hy,Sy)x)r;'
+        exp = _newick(parse_newick(newick=nwk))
+        self.assertEqual(exp, '((h,p)hp,g,(Hy,Sy)x)r;\n')
+        for cls in (SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+            tree = parse_newick(newick=nwk, _class=cls)
+            self.assertEqual(_newick(tree), exp)
+            self.assertEqual(tree.find_node('x')._id, 'x')
+            self.assertFalse(tree.find_node('hp').is_leaf)
+
+
+class TestTraversalArrays(unittest.TestCase):
+    def testOrders(self):
+        nwk = '((h,p)hp,g,(Hy,(Sy,No)sn)x)r;'
+        exp_pre = ['r', 'hp', 'h', 'p', 'g', 'x', 'Hy', 'sn', 'Sy', 'No']
+        exp_post = ['h', 'p', 'hp', 'g', 'Hy', 'Sy', 'No', 'sn', 'x', 'r']
+        for cls in (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+            tree = parse_newick(newick=nwk, _class=cls)
+            ta = tree.traversal_arrays()
+            self.assertEqual([ta.node(i)._id for i in ta.preorder], exp_pre)
+            self.assertEqual([ta.node(i)._id for i in ta.postorder], exp_post)
+            for i in ta.preorder:
+                p = ta.parent[i]
+                exp_par = ta.node(i)._parent
+                self.assertEqual(None if p < 0 else ta.node(p)._id, None if exp_par is None else exp_par._id)
+            self.assertIs(tree.traversal_arrays(), ta)
+            self.assertEqual([n._id for n in tree.preorder_node_iter()], exp_pre)
+            self.assertEqual([n._id for n in tree.postorder_node_iter()], exp_post)
+            self.assertEqual([n._id for n in tree.root.preorder_iter()], exp_pre)
+            self.assertEqual([n._id for n in tree.root.postorder_iter()], exp_post)
+            self.assertEqual([n._id for n in tree.postorder_node_iter(filter_fn=lambda n: n.is_leaf)],
+                             ['h', 'p', 'g', 'Hy', 'Sy', 'No'])
+            # adding a node makes the cached orders stale
+            tree.find_node('g').add_child(tree.create_leaf('z'))
+            self.assertIsNot(tree.traversal_arrays(), ta)
+            self.assertEqual([n._id for n in tree.preorder_node_iter()][4:6], ['g', 'z'])
+            self.assertEqual([n._id for n in tree.postorder_node_iter()][3:5], ['z', 'g'])
+            self.assertEqual(_newick(tree), '((h,p)hp,(z)g,(Hy,(Sy,No)sn)x)r;\n')
+
+    def testInvalidationIsPerTree(self):
+        for cls in (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+            tree = parse_newick(newick='((h,p)hp,g)r;', _class=cls)
+            ta = tree.traversal_arrays()
+            other = parse_newick(newick='(a,b)c;', _class=cls)
+            other.find_node('a').add_child(other.create_leaf('d'))
+            self.assertIs(tree.traversal_arrays(), ta)
+
+    def testReplaceChild(self):
+        for cls in (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+            for old, exp in [('h', '((y,p)hp,g)r;\n'), ('p', '((h,y)hp,g)r;\n'), ('hp', '(y,g)r;\n')]:
+                tree = parse_newick(newick='((h,p)hp,g)r;', _class=cls)
+                tree.traversal_arrays()
+                old_child = tree.find_node(old)
+                old_child.parent.replace_child(old_child, tree.create_leaf('y'))
+                self.assertEqual(_newick(tree), exp)
+            tree = parse_newick(newick='((h,p,q)hp,g)r;', _class=cls)
+            hp = tree.find_node('hp')
+            hp.replace_child(tree.find_node('p'), tree.create_leaf('y'))
+            hp.add_child(tree.create_leaf('z'))
+            self.assertEqual(_newick(tree), '((h,y,q,z)hp,g)r;\n')
+
+
+class TestNewickTreeBuilders(unittest.TestCase):
+    def testTokenBuilderMatchesEventBuilder(self):
+        from peyotl.utility.tokenizer import NewickEventFactory
+        for nwk in ['((h,p)hp,g)hpg;',
+                    "((h:1,'p q'[c]:2)hp:3,(g,Po))r;",
+                    '(a,(b,(c,(d,e)x)y)z);']:
+            for cls in (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+                exp = cls(newick_events=NewickEventFactory(newick=nwk))
+                tree = parse_newick(newick=nwk, _class=cls)
+                self.assertEqual(_newick(tree), _newick(exp))
+                self.assertEqual(sorted(tree.leaf_ids), sorted(exp.leaf_ids))
+                self.assertEqual(sorted(tree._id2node.keys()), sorted(exp._id2node.keys()))
+        tree = parse_newick(stream=StringIO('((h,p)hp,g)hpg;'))
+        self.assertEqual(sorted(tree.leaf_ids), ['g', 'h', 'p'])
+        self.assertRaises(ValueError, parse_newick, newick='((h,p)hp,g;')
+
+
+def _sorted_leaf_ids(tree):
+    return sorted(tree.leaf_ids)
+
+
+class TestNewickTreeSets(unittest.TestCase):
+    def testIterTrees(self):
+        content = "((h:1,p[pc]:2)hp:3,g)r;\n(a,[ac]b)s;\n(c,d)t"
+        for cls in (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+            trees = list(iter_newick_trees(stream=StringIO(content), _class=cls, edge_info=True, comments=True))
+            self.assertEqual([_newick(t) for t in trees], ['((h,p)hp,g)r;\n', '(a,b)s;\n', '(c,d)t;\n'])
+            first = trees[0]
+            self.assertEqual(first.find_node('h').edge.edge_info, '1')
+            self.assertEqual(first.find_node('hp').edge.edge_info, '3')
+            self.assertEqual(first.find_node('p').edge.comments, ['pc'])
+            self.assertEqual(trees[1].find_node('b').edge.comments, ['ac'])
+            self.assertFalse(hasattr(trees[1].find_node('a').edge, 'comments'))
+        trees = list(iter_newick_trees(newick=content))
+        self.assertFalse(hasattr(trees[0].find_node('h').edge, 'edge_info'))
+        self.assertEqual(list(iter_newick_trees(newick='')), [])
+
+    def testMapTrees(self):
+        trees = ['(t{i},(x{i},y{i}));\n'.format(i=i) for i in range(30)]
+        fd, fp = tempfile.mkstemp(suffix='.tre')
+        try:
+            with os.fdopen(fd, 'w') as out:
+                out.write(''.join(trees))
+            exp = [sorted(['t{}'.format(i), 'x{}'.format(i), 'y{}'.format(i)]) for i in range(30)]
+            self.assertEqual([_sorted_leaf_ids(t) for t in iter_newick_trees(filepath=fp)], exp)
+            self.assertEqual(list(map_newick_trees(fp, _sorted_leaf_ids, num_workers=1, num_ranges=4)), exp)
+            self.assertEqual(list(map_newick_trees(fp, _sorted_leaf_ids, num_workers=2)), exp)
+        finally:
+            os.remove(fp)
+
+
+class TestNewickWriter(unittest.TestCase):
+    def testOptions(self):
+        nwk = "((h:1,'p q'[c]:2)hp:3,(g:0.5,Po))r;"
+        for cls in (TreeWithPathsInEdges, SlottedTreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+            tree = parse_newick(newick=nwk, _class=cls, edge_info=True)
+            self.assertEqual(_newick(tree), "((h,'p q')hp,(g,Po))r;\n")
+            for buffer_size in (1, 3, 1000):
+                o = StringIO()
+                tree.write_newick(o, edge_length_fn=newick_edge_info, buffer_size=buffer_size)
+                self.assertEqual(o.getvalue(), "((h:1,'p q':2)hp:3,(g:0.5,Po))r;\n")
+            o = StringIO()
+            tree.write_newick(o, internal_labels=False, quote_labels=False,
+                              edge_length_fn=lambda nd: 7 if nd.is_leaf else None)
+            self.assertEqual(o.getvalue(), '((h:7,p q:7),(g:7,Po:7));\n')
+            o = StringIO()
+            tree.write_newick(o, label_fn=lambda nd: None if nd.is_leaf else nd._id)
+            self.assertEqual(o.getvalue(), '((,)hp,(,))r;\n')
+        self.assertEqual(_newick(parse_newick(newick='(a);')), '(a);\n')
+
+    def testPathIDsAndFiles(self):
+        tips = ['h', 'p', 'g', 'No']
+        for cls in (TreeWithPathsInEdges, ArrayTreeWithPathsInEdges):
+            tree = create_tree_from_id2par(_bogus_id2par, list(tips), _class=cls)
+            o = StringIO()
+            tree.write_newick(o, path_id_comments=True)
+            exp = o.getvalue()
+            # the order of the children of create_tree_from_id2par trees is arbitrary
+            self.assertIn(exp.replace('(h,p)', '(p,h)'),
+                          ['(((p,h)hp,g)hpg[&path_ids=hpg,hpgPo],No[&path_ids=No,HySyHoNo])hpgPoHySyHoNo;\n',
+                           '(No[&path_ids=No,HySyHoNo],((p,h)hp,g)hpg[&path_ids=hpg,hpgPo])hpgPoHySyHoNo;\n',
+                           '((g,(p,h)hp)hpg[&path_ids=hpg,hpgPo],No[&path_ids=No,HySyHoNo])hpgPoHySyHoNo;\n',
+                           '(No[&path_ids=No,HySyHoNo],(g,(p,h)hp)hpg[&path_ids=hpg,hpgPo])hpgPoHySyHoNo;\n'])
+            d = tempfile.mkdtemp()
+            try:
+                for fn, opener in (('t.tre', codecs.open), ('t.tre.gz', gzip.open)):
+                    fp = os.path.join(d, fn)
+                    tree.write_newick_file(fp, path_id_comments=True)
+                    with opener(fp, 'rb') as inp:
+                        self.assertEqual(inp.read().decode('utf-8'), exp)
+            finally:
+                shutil.rmtree(d)
+
+
 if __name__ == "__main__":
     unittest.main()
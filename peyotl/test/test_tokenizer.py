@@ -1,9 +1,14 @@
 #! /usr/bin/env python
-from peyotl.utility.tokenizer import NewickTokenizer, NewickEvents, NewickEventFactory
+from peyotl.utility.tokenizer import (NewickTokenizer, NewickTokenType, NewickEvents, NewickEventFactory,
+                                      ByteRangeReader, iter_newick_tokens, iter_newick_tree_ends,
+                                      newick_tree_byte_ranges)
 from peyotl.utility.str_util import StringIO
 from peyotl.utility import get_logger
 import unittest
+import tempfile
+import os
 from copy import deepcopy
+from io import BytesIO
 
 _LOG = get_logger(__name__)
 
@@ -71,5 +76,82 @@ class TestNewickEvents(unittest.TestCase):
         self.assertEqual(e, expected)
 
 
+_PARITY_NEWICKS = ['((h,p)hp,g)hpg;',
+                   '  ( (  h , p[test] [test2])  hp,  g) hpg ;',
+                   "((h_ ,'p')h p,'g()[],'':_')hpg;",
+                   "(('h ',p)h p,'g()[],'':_')hpg;",
+                   '((h:4.0,p:1.1461E-5)hp:1351.146436,g)hpg;',
+                   "((a:'1_0',b_c:[x]2)[y]:3,'d''''e')r:0;\n",
+                   '((h,p)hp,g)hpg',
+                   ]
+_BAD_NEWICKS = ['h;', '((h,p)hp,g));', '(h,p);x', '(h,,p);', "('h,p);", '(h,p[);', '(h p:1:2);',
+                '(h,p)(a);', '', '  ']
+
+
+class TestIterNewickTokens(unittest.TestCase):
+    def testParity(self):
+        for content in _PARITY_NEWICKS:
+            tok = NewickTokenizer(newick=content)
+            exp = []
+            for t in tok:
+                exp.append((tok.prev_token, t))
+            for chunk_size in (1, 2, 7, 1 << 16):
+                self.assertEqual(list(iter_newick_tokens(stream=StringIO(content), chunk_size=chunk_size)), exp)
+            self.assertEqual(list(iter_newick_tokens(newick=content)), exp)
+
+    def testComments(self):
+        toks = list(iter_newick_tokens(newick='((h,[pretest]p[test])hp,g)hpg;', keep_comments=True))
+        comments = [v for t, v in toks if t == NewickTokenType.COMMENT]
+        self.assertEqual(comments, ['pretest', 'test'])
+
+    def testErrors(self):
+        def _old_tokens(content):
+            return NewickTokenizer(newick=content).tokens()
+
+        for content in _BAD_NEWICKS:
+            if content.strip():
+                self.assertRaises(ValueError, _old_tokens, content)
+            self.assertRaises(ValueError, list, iter_newick_tokens(newick=content))
+            self.assertRaises(ValueError, list, iter_newick_tokens(stream=StringIO(content), chunk_size=2))
+
+    def testMultipleTrees(self):
+        content = "(a,b)c;\n((d,e),f);\n(g,h)"
+        for chunk_size in (1, 5, 1 << 16):
+            toks = list(iter_newick_tokens(stream=StringIO(content), chunk_size=chunk_size, multiple_trees=True))
+            self.assertEqual([v for t, v in toks if t == NewickTokenType.SEMICOLON], [';', ';'])
+            self.assertEqual([v for t, v in toks if t == NewickTokenType.LABEL], list('abcdefgh'))
+        self.assertEqual(list(iter_newick_tokens(newick=' \n', multiple_trees=True)), [])
+        for content in ['(a,b));(c,d);', '(a,b;(c,d);', '(a,b);c;', '(a,b);(c,d']:
+            self.assertRaises(ValueError, list, iter_newick_tokens(newick=content, multiple_trees=True))
+        self.assertRaises(ValueError, list, iter_newick_tokens(newick='(a,b);(c,d);'))
+
+
+class TestNewickTreeByteRanges(unittest.TestCase):
+    def testTreeEnds(self):
+        content = b"(a,'b;''c'[x;y])z;\n(d,e);"
+        self.assertEqual(list(iter_newick_tree_ends(BytesIO(content), chunk_size=3)),
+                         [content.index(b'\n'), len(content)])
+
+    def testByteRanges(self):
+        trees = ['({i},(x{i},y{i}));\n'.format(i=i) for i in range(20)]
+        fd, fp = tempfile.mkstemp(suffix='.tre')
+        try:
+            with os.fdopen(fd, 'w') as out:
+                out.write(''.join(trees))
+            for num_ranges in (1, 3, 7, 100):
+                ranges = newick_tree_byte_ranges(fp, num_ranges)
+                self.assertLessEqual(len(ranges), num_ranges)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], os.path.getsize(fp))
+                content = []
+                for start, end in ranges:
+                    with ByteRangeReader(fp, start, end) as r:
+                        content.append(r.read().decode('utf-8'))
+                    self.assertTrue(content[-1].rstrip().endswith(';'))
+                self.assertEqual(''.join(content), ''.join(trees))
+        finally:
+            os.remove(fp)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+from peyotl.tree_conflict import (classify_edges_against_taxonomy, git_blob_sha, iter_study_conflict_summaries,
+                                  TreeConflictCache)
+from peyotl.phylo.tree import create_tree_from_id2par
+from peyotl.utility.input_output import read_as_json, write_as_json
+from peyotl.ott import OTT
+from peyotl.test.support import pathmap
+from peyotl.utility import get_logger
+import unittest
+import tempfile
+import shutil
+import os
+
+_LOG = get_logger(__name__)
+
+# tips are OTT IDs of the test taxonomy: Chordata (6) = {8, 9}, Arthropoda (7) = {10, 11},
+#   Metazoa (4) = {6, 7}, Archaeplastida (5) = {12, 13, 20}
+_PHYLO_ID2PAR = {'n1': None, 'n2': 'n1', 'n3': 'n2', 'n4': 'n3', 8: 'n4', 9: 'n4', 10: 'n3', 11: 'n2',
+                 'n5': 'n1', 'n6': 'n5', 12: 'n6', 13: 'n6', 20: 'n5'}
+_EXPECTED = {'n2': ('supported', [4]), 'n3': ('conflicts', [7]), 'n4': ('supported', [6]),
+             'n5': ('supported', [5]), 'n6': ('resolves', [])}
+
+
+def _nexson_for_id2par(tree_id2par):
+    """Returns a NexSON 1.2 study with a tree for each tree ID -> id2par mapping (integer tips become
+    nodes mapped to those OTT IDs, plus an unmapped tip)."""
+    otus = {'otu_unmapped': {'^ot:originalLabel': 'unmapped'}}
+    trees = {}
+    for tree_id, id2par in tree_id2par.items():
+        nodes, edges = {}, {}
+        for c, p in id2par.items():
+            if isinstance(c, int):
+                otus['otu{}'.format(c)] = {'^ot:ottId': c, '^ot:originalLabel': str(c)}
+                nodes['tip{}'.format(c)] = {'@otu': 'otu{}'.format(c)}
+                c = 'tip{}'.format(c)
+            else:
+                nodes[c] = {}
+            if p is None:
+                nodes[c]['@root'] = True
+                root = c
+            else:
+                edges.setdefault(p, {})['e_' + c] = {'@source': p, '@target': c}
+        nodes['tip_unmapped'] = {'@otu': 'otu_unmapped'}
+        edges[root]['e_tip_unmapped'] = {'@source': root, '@target': 'tip_unmapped'}
+        trees[tree_id] = {'nodeById': nodes, 'edgeBySourceId': edges, '^ot:rootNodeId': root}
+    return {'nexml': {'@nexml2json': '1.2.1',
+                      '^ot:otusElementOrder': ['otus1'],
+                      'otusById': {'otus1': {'otuById': otus}},
+                      '^ot:treesElementOrder': ['trees1'],
+                      'treesById': {'trees1': {'@otus': 'otus1',
+                                               '^ot:treeElementOrder': sorted(trees.keys()),
+                                               'treeById': trees}}}}
+
+
+class TestTreeConflict(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        ott_dir = os.path.join(cls.tmp_dir, 'ott')
+        shutil.copytree(os.path.join(pathmap.TESTS_DATA_DIR, 'ott'), ott_dir)
+        cls.ott = OTT(ott_dir=ott_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def testClassifyEdges(self):
+        tips = [i for i in _PHYLO_ID2PAR if isinstance(i, int)]
+        phylo = create_tree_from_id2par(_PHYLO_ID2PAR, list(tips))
+        taxo = self.ott.induced_tree(list(tips))
+        found = classify_edges_against_taxonomy(phylo, taxo)
+        exp = dict(_EXPECTED)
+        exp.update(dict((i, ('terminal', [])) for i in tips))
+        self.assertEqual(found, exp)
+
+    def testGitBlobSha(self):
+        fp = os.path.join(self.tmp_dir, 'empty.txt')
+        open(fp, 'w').close()
+        self.assertEqual(git_blob_sha(fp), 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391')
+
+    def testCachedStudySummaries(self):
+        study_fp = os.path.join(self.tmp_dir, 'ot_1.json')
+        cache_dir = os.path.join(self.tmp_dir, 'conflict_cache')
+        other_id2par = {'r': None, 8: 'r', 10: 'r', 12: 'r'}
+        write_as_json(_nexson_for_id2par({'tree1': _PHYLO_ID2PAR, 'tree2': other_id2par}), study_fp)
+        results = list(iter_study_conflict_summaries([('ot_1', study_fp)], self.ott, cache_dir, num_workers=1))
+        self.assertEqual([(s, t) for s, t, _ in results], [('ot_1', 'tree1'), ('ot_1', 'tree2')])
+        summary = results[0][2]
+        self.assertEqual(summary['counts'], {'terminal': 7, 'supported': 3, 'conflicts': 1, 'resolves': 1})
+        self.assertEqual(summary['num_tips'], 7)
+        self.assertEqual(summary['edges']['tip20'], {'status': 'terminal', 'taxa': []})
+        for nd_id, (status, taxa) in _EXPECTED.items():
+            self.assertEqual(summary['edges'][nd_id], {'status': status, 'taxa': taxa})
+        self.assertEqual(results[1][2]['counts'], {'terminal': 3, 'supported': 0, 'conflicts': 0, 'resolves': 0})
+        # a second run reads the cache (marked here) instead of summarizing the study again
+        cache = TreeConflictCache(cache_dir, self.ott.version)
+        sha = git_blob_sha(study_fp)
+        cached = read_as_json(cache.filepath(sha))
+        self.assertEqual(cached['ott_version'], self.ott.version)
+        cached['trees']['tree2'] = 'from cache'
+        write_as_json(cached, cache.filepath(sha))
+        results = list(iter_study_conflict_summaries([('ot_1', study_fp)], self.ott, cache_dir, num_workers=1,
+                                                     study_tree_ids={'ot_1': set(['tree2'])}))
+        self.assertEqual(results, [('ot_1', 'tree2', 'from cache')])
+        # editing the study changes its blob SHA, so it is summarized again
+        write_as_json(_nexson_for_id2par({'tree2': other_id2par}), study_fp)
+        results = list(iter_study_conflict_summaries([('ot_1', study_fp)], self.ott, cache_dir, num_workers=2))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][2]['num_tips'], 3)
+        self.assertTrue(os.path.exists(cache.filepath(git_blob_sha(study_fp))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""Summaries of the conflict between the trees of phylesystem studies and the OTT taxonomy.
+
+Each edge of a tree (pruned to the tips that are mapped to OTT IDs, see
+create_pruned_and_taxonomy_for_tip_ott_ids) is classified against the OTT induced
+tree for those tips:
+    'terminal' - the edge leads to a tip,
+    'supported' - the tips below the edge are the tips of a taxon,
+    'conflicts' - the tips below the edge overlap the tips of a taxon without either
+        set containing the other,
+    'resolves' - none of the above (the edge is a resolution that the taxonomy lacks).
+
+Summaries are cached per study file, keyed by the git blob SHA of the file and the OTT
+version, so a rerun over a phylesystem only recomputes the studies whose files changed.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.ott import create_pruned_and_taxonomy_for_tip_ott_ids
+from peyotl.phylo.bitsets import tree_clade_bitsets
+from peyotl.phylo.compat import find_incompatible_splits
+from peyotl.utility.input_output import read_as_json, write_as_json
+from peyotl.utility.parallel import default_num_workers, shared_ordered_parallel_map
+from peyotl.utility import get_logger
+import hashlib
+import os
+
+_LOG = get_logger(__name__)
+
+EDGE_STATUSES = ('terminal', 'supported', 'conflicts', 'resolves')
+
+
+def git_blob_sha(filepath):
+    """Returns the SHA that git assigns to the content of `filepath` (as `git hash-object` does)."""
+    with open(filepath, 'rb') as fo:
+        content = fo.read()
+    h = hashlib.sha1(('blob {}\0'.format(len(content))).encode('ascii'))
+    h.update(content)
+    return h.hexdigest()
+
+
+def _taxon_clade_bitsets(taxo_tree, leaf_index, cls):
+    """Returns (clade bitsets, taxon IDs) for the internal nodes of `taxo_tree`. A taxon
+    that is itself one of the tips (an ancestor of another tip) contains that tip."""
+    child_lists, leaf_rows = [], []
+    row_of = {}
+    keep, taxon_ids = [], []
+    for nd in taxo_tree.postorder_node_iter():
+        c = [] if nd.is_leaf else [row_of[id(k)] for k in nd.child_iter() if id(k) in row_of]
+        i = leaf_index.get(nd._id)
+        if i is not None:
+            c.append(len(child_lists))
+            child_lists.append(None)
+            leaf_rows.append(i)
+        if nd.is_leaf:
+            if c:
+                row_of[id(nd)] = c[0]
+            continue
+        row_of[id(nd)] = len(child_lists)
+        keep.append(len(child_lists))
+        taxon_ids.append(nd._id)
+        child_lists.append(c)
+    bits = cls.from_children(child_lists, leaf_rows, len(leaf_index))
+    return bits.subset_rows(keep), taxon_ids
+
+
+def classify_edges_against_taxonomy(pruned_phylo, taxo_tree, backend='auto'):
+    """Returns a dict mapping the ID of each non-root node of `pruned_phylo` to a
+    (status, list of taxon IDs) pair for the edge above it. The taxa are those that
+    share the node's tips (for 'supported') or conflict with them (for 'conflicts').
+    The tips of both trees must have the same IDs.
+    """
+    leaf_index = {}
+    for nd in pruned_phylo.postorder_node_iter():
+        if nd.is_leaf:
+            leaf_index[nd._id] = len(leaf_index)
+    phylo_bits, phylo_nodes = tree_clade_bitsets(pruned_phylo, leaf_index=leaf_index, backend=backend)
+    taxo_bits, taxon_ids = _taxon_clade_bitsets(taxo_tree, leaf_index, type(phylo_bits))
+    taxa_for_clade = {}
+    for r, taxon_id in enumerate(taxon_ids):
+        taxa_for_clade.setdefault(taxo_bits.as_int(r), []).append(taxon_id)
+    conflicting = {}
+    for i, j in find_incompatible_splits(phylo_bits, taxo_bits, rooted=True):
+        conflicting.setdefault(i, []).append(taxon_ids[j])
+    classes = {}
+    for nd in pruned_phylo.postorder_node_iter():
+        if nd.is_leaf and nd._parent is not None:
+            classes[nd._id] = ('terminal', [])
+    for r, nd in enumerate(phylo_nodes):
+        if nd._parent is None:
+            continue
+        c = conflicting.get(r)
+        if c is not None:
+            classes[nd._id] = ('conflicts', c)
+        else:
+            s = taxa_for_clade.get(phylo_bits.as_int(r))
+            classes[nd._id] = ('supported', s) if s else ('resolves', [])
+    return classes
+
+
+def summarize_tree_conflict(tree_proxy, ott, backend='auto'):
+    """Returns None if no tip of `tree_proxy` is mapped to an OTT ID. Otherwise returns a dict:
+        'edges': node ID -> {'status': one of EDGE_STATUSES, 'taxa': list of OTT IDs},
+        'counts': status -> number of edges,
+        'num_tips': number of mapped tips (tips mapped to the same OTT ID count once).
+    Edges are identified by the NexSON ID of the node below them (for a tip edge, the first
+    tip that is mapped to the OTT ID).
+    """
+    pruned_phylo, taxo_tree = create_pruned_and_taxonomy_for_tip_ott_ids(tree_proxy, ott)
+    if pruned_phylo is None or taxo_tree is None:
+        return None
+    tip_node_id = {}
+    for node in tree_proxy:
+        if node.is_leaf:
+            ott_id = node.ott_id
+            if ott_id is not None and ott_id not in tip_node_id:
+                tip_node_id[ott_id] = node._id
+    edges = {}
+    counts = dict((s, 0) for s in EDGE_STATUSES)
+    for nd_id, (status, taxa) in classify_edges_against_taxonomy(pruned_phylo, taxo_tree, backend).items():
+        if status == 'terminal':
+            nd_id = tip_node_id[nd_id]
+        edges[nd_id] = {'status': status, 'taxa': taxa}
+        counts[status] += 1
+    return {'edges': edges, 'counts': counts, 'num_tips': len(tip_node_id)}
+
+
+class TreeConflictCache(object):
+    """Directory of study conflict summaries for one OTT version. A summary is stored in
+    <cache_dir>/<OTT version>/<first 2 chars of the blob SHA>/<blob SHA>.json
+    """
+
+    def __init__(self, cache_dir, ott_version):
+        self.cache_dir = cache_dir
+        self.ott_version = ott_version
+        self._version_dir = os.path.join(cache_dir, ott_version)
+
+    def filepath(self, blob_sha):
+        return os.path.join(self._version_dir, blob_sha[:2], blob_sha + '.json')
+
+    def get(self, blob_sha):
+        """Returns the cached dict of tree ID -> summary, or None."""
+        fp = self.filepath(blob_sha)
+        if not os.path.exists(fp):
+            return None
+        try:
+            return read_as_json(fp)['trees']
+        except Exception:
+            _LOG.exception('Ignoring unreadable tree conflict cache file "{}"'.format(fp))
+            return None
+
+    def put(self, blob_sha, trees):
+        fp = self.filepath(blob_sha)
+        par = os.path.dirname(fp)
+        if not os.path.isdir(par):
+            os.makedirs(par)
+        tmp_fp = '{}.{}.tmp'.format(fp, os.getpid())
+        write_as_json({'blob_sha': blob_sha, 'ott_version': self.ott_version, 'trees': trees}, tmp_fp)
+        os.rename(tmp_fp, fp)
+
+
+def _summarize_study_file(ott, args):
+    from peyotl.nexson_syntax import extract_tree_nexson
+    from peyotl.nexson_proxy import NexsonTreeProxy
+    study_id, filepath = args
+    nexson = read_as_json(filepath)
+    trees = {}
+    for tree_id, tree, otus in extract_tree_nexson(nexson, tree_id=None):
+        tree_proxy = NexsonTreeProxy(tree=tree, tree_id=tree_id, otus=otus)
+        trees[tree_id] = summarize_tree_conflict(tree_proxy, ott)
+    return study_id, trees
+
+
+def iter_study_conflict_summaries(study_filepath_iter, ott, cache_dir, num_workers=None, study_tree_ids=None):
+    """Yields (study_id, tree_id, summarize_tree_conflict result) for each tree of the
+    (study_id, filepath) pairs of `study_filepath_iter`.
+    Studies whose file content (git blob SHA) has a summary for the OTT version in `cache_dir`
+    are read from the cache; the rest are summarized by a pool of `num_workers` processes
+    (default: one per CPU) and added to the cache.
+    If `study_tree_ids` is not None, only the trees in its dict of study ID -> set of tree IDs
+    are reported (but every tree of a study is summarized, so the cache entry is complete).
+    """
+    if num_workers is None:
+        num_workers = default_num_workers()
+    ott.preload(('ottID2parentOttId',))
+    cache = TreeConflictCache(cache_dir, ott.version)
+
+    def _requested(study_id, trees):
+        wanted = None if study_tree_ids is None else study_tree_ids.get(study_id, ())
+        for tree_id in sorted(trees.keys()):
+            if wanted is None or tree_id in wanted:
+                yield study_id, tree_id, trees[tree_id]
+
+    stale = []
+    num_cached = 0
+    for study_id, filepath in study_filepath_iter:
+        if study_tree_ids is not None and study_id not in study_tree_ids:
+            continue
+        blob_sha = git_blob_sha(filepath)
+        trees = cache.get(blob_sha)
+        if trees is None:
+            stale.append((study_id, filepath, blob_sha))
+        else:
+            num_cached += 1
+            for x in _requested(study_id, trees):
+                yield x
+    _LOG.debug('{} studies read from the tree conflict cache, {} to summarize'.format(num_cached, len(stale)))
+    arg_it = ((study_id, filepath) for study_id, filepath, _ in stale)
+    results = shared_ordered_parallel_map(_summarize_study_file, ott, arg_it, num_workers)
+    for (study_id, trees), s in zip(results, stale):
+        cache.put(s[2], trees)
+        for x in _requested(study_id, trees):
+            yield x
+
+
+def summarize_phylesystem_conflicts(phylesystem, ott, cache_dir, num_workers=None):
+    """Generator of (study_id, tree_id, summarize_tree_conflict result) for every tree in `phylesystem`."""
+    return iter_study_conflict_summaries(phylesystem.iter_study_filepaths(), ott, cache_dir,
+                                         num_workers=num_workers)
+
+
+def summarize_collection_conflicts(collection, phylesystem, ott, cache_dir, num_workers=None):
+    """Generator of (study_id, tree_id, summarize_tree_conflict result) for the trees that are
+    included in `collection` (a tree collection object or the filepath to one)."""
+    from peyotl.collections_store import collection_to_included_trees
+    study_tree_ids = {}
+    for d in collection_to_included_trees(collection):
+        study_tree_ids.setdefault(d['studyID'], set()).add(d['treeID'])
+    study_fp_iter = ((study_id, phylesystem.get_filepath_for_doc(study_id)) for study_id in sorted(study_tree_ids))
+    return iter_study_conflict_summaries(study_fp_iter, ott, cache_dir, num_workers=num_workers,
+                                         study_tree_ids=study_tree_ids)
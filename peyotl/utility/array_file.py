@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""Simple binary container for named arrays of fixed-width integers (or doubles) that
+can be memory-mapped and queried without unpacking the whole file.
+
+The layout is:
+    8 byte magic string
+    uint32 format version, uint32 number of sections
+    one 40-byte section description per section:
+        16 byte (NUL-padded) section name, 1 byte struct typecode,
+        7 bytes of padding, uint64 offset, uint64 number of elements
+    the section data (each section starts on an 8-byte boundary).
+All numbers are little-endian. Does not depend on any other part of peyotl.
+"""
+import struct
+import mmap
+import sys
+import os
+
+_HEADER_FMT = '<8sII'
+_HEADER_SIZE = struct.calcsize(_HEADER_FMT)
+_SECTION_FMT = '<16sc7xQQ'
+_SECTION_SIZE = struct.calcsize(_SECTION_FMT)
+_WRITE_CHUNK = 1 << 16
+_VALID_TYPECODES = frozenset('bBhHiIqQd')
+# memoryview.cast is only available in python 3, and only reads native byte order
+_CAN_CAST = (sys.version_info.major > 2) and (sys.byteorder == 'little')
+
+
+def _pad_len(n):
+    return (8 - (n % 8)) % 8
+
+
+def int_typecode_for_range(min_value, max_value):
+    """Returns the smallest signed struct typecode of at least 32 bits that holds
+    every value in [min_value, max_value]."""
+    if min_value >= -(1 << 31) and max_value < (1 << 31):
+        return 'i'
+    return 'q'
+
+
+def write_array_file(filepath, sections, magic, version=1):
+    """Writes `sections` (a list of (name, typecode, sequence) triples) to `filepath`.
+    `magic` must be a byte string of at most 8 bytes that identifies the file type.
+    The data is written to a temporary file which is then moved into place,
+        so that processes that have the previous version mapped are not disturbed.
+    """
+    tmp_fp = filepath + '.tmp'
+    with open(tmp_fp, 'wb') as fo:
+        write_arrays(fo, sections, magic, version=version)
+    os.rename(tmp_fp, filepath)
+
+
+def array_file_bytes(sections, magic, version=1):
+    """Returns the content that write_array_file would write (see ArrayFile's `data` argument)."""
+    from io import BytesIO
+    fo = BytesIO()
+    write_arrays(fo, sections, magic, version=version)
+    return fo.getvalue()
+
+
+def write_arrays(fo, sections, magic, version=1):
+    """Writes the content of an array file to the binary stream `fo` (which must be at
+    position 0, because the section offsets are relative to the start of the stream)."""
+    if len(magic) > 8:
+        raise ValueError('magic must be at most 8 bytes')
+    table = []
+    offset = _HEADER_SIZE + _SECTION_SIZE * len(sections)
+    offset += _pad_len(offset)
+    for name, typecode, data in sections:
+        if typecode not in _VALID_TYPECODES:
+            raise ValueError('typecode "{}" is not supported'.format(typecode))
+        if len(name) > 16:
+            raise ValueError('section name "{}" is longer than 16 characters'.format(name))
+        table.append((name, typecode, offset, len(data)))
+        nbytes = struct.calcsize('<' + typecode) * len(data)
+        offset += nbytes + _pad_len(nbytes)
+    fo.write(struct.pack(_HEADER_FMT, magic, version, len(sections)))
+    for name, typecode, sect_offset, count in table:
+        fo.write(struct.pack(_SECTION_FMT, name.encode('ascii'), typecode.encode('ascii'), sect_offset, count))
+    for (name, typecode, data), info in zip(sections, table):
+        fo.write(b'\0' * (info[2] - fo.tell()))
+        if typecode == 'B' and isinstance(data, (bytes, bytearray)):
+            fo.write(data)
+            continue
+        fmt_pref = '<{n:d}' + typecode
+        for start in range(0, len(data), _WRITE_CHUNK):
+            chunk = data[start:start + _WRITE_CHUNK]
+            fo.write(struct.pack(fmt_pref.format(n=len(chunk)), *chunk))
+
+
+class IntArrayView(object):
+    """Read-only, list-like view of one section of a mapped ArrayFile."""
+
+    def __init__(self, buf, offset, count, typecode):
+        self._count = count
+        self._typecode = typecode
+        self._offset = offset
+        self._buf = buf
+        self._item_size = struct.calcsize('<' + typecode)
+        if _CAN_CAST:
+            end = offset + count * self._item_size
+            self._mv = memoryview(buf)[offset:end].cast(typecode)
+            self._getter = self._mv.__getitem__
+        else:
+            self._mv = None
+            fmt = '<' + typecode
+            item_size = self._item_size
+
+            def _getter(i):
+                if i < 0:
+                    i += count
+                if i < 0 or i >= count:
+                    raise IndexError('array index out of range')
+                return struct.unpack_from(fmt, buf, offset + i * item_size)[0]
+
+            self._getter = _getter
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        return self._getter(i)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        if self._mv is not None:
+            return self._mv.tolist()
+        fmt = '<{n:d}{t}'.format(n=self._count, t=self._typecode)
+        return list(struct.unpack_from(fmt, self._buf, self._offset))
+
+    @property
+    def nbytes(self):
+        return self._count * self._item_size
+
+    def release(self):
+        if self._mv is not None:
+            self._mv.release()
+            self._mv = None
+        self._getter = None
+
+
+class ArrayFile(object):
+    """Memory-maps a file written by write_array_file. Section data is only paged in
+    by the OS as it is touched, and the mapping is shared by all processes that
+    read the same file.
+    """
+
+    def __init__(self, filepath, magic=None, data=None):
+        """If `data` is not None, it is the content of an array file (e.g. from array_file_bytes)
+        and `filepath` is only used in error messages."""
+        self.filepath = filepath
+        self._views = {}
+        if data is not None:
+            self._mmap = data
+        else:
+            with open(filepath, 'rb') as fo:
+                self._mmap = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, self.version, num_sections = struct.unpack_from(_HEADER_FMT, self._mmap, 0)
+        if (magic is not None) and (file_magic.rstrip(b'\0') != magic.rstrip(b'\0')):
+            self.close()
+            raise ValueError('"{}" is not the expected type of binary file'.format(filepath))
+        self._sections = {}
+        for i in range(num_sections):
+            sect_start = _HEADER_SIZE + i * _SECTION_SIZE
+            name, typecode, offset, count = struct.unpack_from(_SECTION_FMT, self._mmap, sect_start)
+            name = name.rstrip(b'\0').decode('ascii')
+            self._sections[name] = (typecode.decode('ascii'), offset, count)
+
+    @property
+    def section_names(self):
+        return list(self._sections.keys())
+
+    def has_section(self, name):
+        return name in self._sections
+
+    def array(self, name):
+        v = self._views.get(name)
+        if v is None:
+            typecode, offset, count = self._sections[name]
+            v = IntArrayView(self._mmap, offset, count, typecode)
+            self._views[name] = v
+        return v
+
+    def raw_bytes(self, name, start, end):
+        """Returns the bytes [start, end) of a 'B' section."""
+        typecode, offset, count = self._sections[name]
+        assert typecode == 'B'
+        return self._mmap[offset + start:offset + end]
+
+    @property
+    def nbytes(self):
+        return len(self._mmap)
+
+    def close(self):
+        for v in self._views.values():
+            v.release()
+        self._views = {}
+        if self._mmap is not None:
+            if isinstance(self._mmap, mmap.mmap):
+                self._mmap.close()
+            self._mmap = None
@@ -22,6 +22,18 @@ def open_for_group_write(fp, mode, encoding='utf-8'):
     return o
 
 
+def open_text_for_write(filepath, encoding='utf-8', compress=None):
+    """Returns a stream for writing text to `filepath` as `encoding`. The file is gzip-compressed
+    if `compress` is True (or if `compress` is None and `filepath` ends with ".gz").
+    """
+    if compress is None:
+        compress = filepath.endswith('.gz')
+    if not compress:
+        return codecs.open(filepath, 'w', encoding=encoding)
+    import gzip
+    return codecs.getwriter(encoding)(gzip.open(filepath, 'wb', compresslevel=6))
+
+
 def read_filepath(filepath, encoding='utf-8'):
     """Returns the text content of `filepath`"""
     with codecs.open(filepath, 'r', encoding=encoding) as fo:
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Helpers for fanning work out over a pool of worker processes."""
+from __future__ import absolute_import, print_function, division
+import multiprocessing
+import sys
+
+
+def default_num_workers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def _fork_context():
+    """Returns the multiprocessing context (or module) that starts workers by forking, or
+    None if processes can not be forked on this platform."""
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        return None if sys.platform == 'win32' else multiprocessing
+    try:
+        return get_context('fork')
+    except ValueError:
+        return None
+
+
+def ordered_parallel_map(fn, arg_iter, num_workers, _context=multiprocessing):
+    """Yields fn(arg) for each arg in `arg_iter` (in order), using a pool of `num_workers`
+    processes. At most 2 * `num_workers` tasks are pending at a time, so the input is not
+    read much faster than the results are consumed.
+    """
+    if num_workers <= 1:
+        for arg in arg_iter:
+            yield fn(arg)
+        return
+    pool = _context.Pool(num_workers)
+    try:
+        pending = []
+        max_pending = 2 * num_workers
+        for arg in arg_iter:
+            pending.append(pool.apply_async(fn, (arg,)))
+            if len(pending) >= max_pending:
+                yield pending.pop(0).get()
+        while pending:
+            yield pending.pop(0).get()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+# `shared` argument of the running shared_ordered_parallel_map (inherited when the pool forks)
+_SHARED = None
+
+
+def _call_with_shared(fn_arg):
+    fn, arg = fn_arg
+    return fn(_SHARED, arg)
+
+
+def shared_ordered_parallel_map(fn, shared, arg_iter, num_workers):
+    """Yields fn(shared, arg) for each arg in `arg_iter` (in order), see ordered_parallel_map.
+    `shared` (e.g. a loaded taxonomy) is not pickled for each task: it is held in a module
+    global while the pool is created, so forked workers inherit it copy-on-write. The pool
+    always forks (whatever the default start method is); if processes can not be forked,
+    every call is made in this process. `fn` must be a module-level function.
+    """
+    global _SHARED
+    context = _fork_context()
+    if context is None:
+        num_workers = 1
+    prev = _SHARED
+    _SHARED = shared
+    try:
+        for r in ordered_parallel_map(_call_with_shared, ((fn, arg) for arg in arg_iter), num_workers,
+                                      _context=context):
+            yield r
+    finally:
+        _SHARED = prev
@@ -2,6 +2,8 @@
 from peyotl.utility import get_logger
 from peyotl.utility.input_output import read_filepath
 from enum import Enum
+import codecs
+import os
 import re
 
 _LOG = get_logger(__name__)
@@ -21,6 +23,7 @@ class NewickTokenType(Enum):
     LABEL = 5
     EDGE_INFO = 6
     SEMICOLON = 7
+    COMMENT = 8
 
 
 class NewickTokenizer(object):
@@ -309,15 +312,18 @@ class NewickEventFactory(object):
     def _greedy_token_seq(self, label, t):
         tok = next(self._base_it)
         self._comments.extend(self._tokenizer.comments)
-        if t == NewickEvents.CLOSE_SUBTREE and self._tokenizer.prev_token == NewickTokenType.LABEL:
-            label = tok
-            tok = next(self._base_it)
-            self._comments.extend(self._tokenizer.comments)
+        if t == NewickEvents.CLOSE_SUBTREE:
+            # `label` is the ")" token. The node is only labelled if a label follows it.
+            label = None
+            if self._tokenizer.prev_token == NewickTokenType.LABEL:
+                label = tok
+                tok = next(self._base_it)
+                self._comments.extend(self._tokenizer.comments)
 
         if tok == ':':
             tok = next(self._base_it)
             self._comments.extend(self._tokenizer.comments)
-            assert self._prev_type == NewickTokenType.EDGE_INFO
+            assert self._tokenizer.prev_token == NewickTokenType.EDGE_INFO
             edge_info = tok
             tok = next(self._base_it)
             self._comments.extend(self._tokenizer.comments)
@@ -331,3 +337,252 @@ class NewickEventFactory(object):
                 'comments': self._comments}
 
     next = __next__
+
+
+# One token per match: group 1 is punctuation, 2 a comment, 3 a quoted label, 4 an unquoted label.
+_TOKEN = re.compile(r"\s*(?:([(),:;])|\[([^\]]*)\]|'((?:[^']|'')*)'|([^'():,;\\\[\s][^'():,;\\\[]*))")
+_TRAILING_WS = re.compile(r"\s*$")
+DEFAULT_NEWICK_CHUNK_SIZE = 1 << 16
+# The scanner's state is kept as the integer values of the NewickTokenType facets (hashing
+# and comparing enum members is slow); each punctuation character maps to
+# (its token type value, values of the token types that may precede it)
+_NONE, _OPEN, _CLOSE, _COMMA, _COLON, _LABEL, _EDGE_INFO, _SEMICOLON, _COMMENT = range(9)
+_TYPE_FOR_VALUE = tuple(sorted(NewickTokenType, key=lambda x: x.value))
+_PUNC_INFO = {'(': (_OPEN, frozenset([_OPEN, _COMMA])),
+              ')': (_CLOSE, frozenset([_LABEL, _EDGE_INFO, _CLOSE])),
+              ',': (_COMMA, frozenset([_LABEL, _CLOSE, _EDGE_INFO])),
+              ':': (_COLON, frozenset([_LABEL, _CLOSE])),
+              ';': (_SEMICOLON, frozenset([_LABEL, _CLOSE, _EDGE_INFO]))}
+_LABEL_PRECEDERS = frozenset([_OPEN, _CLOSE, _COMMA])
+_EXPECTATION = {_OPEN: 'Expecting "(" to be preceded by "," or "("',
+                _CLOSE: 'Expecting ")" to be preceded by a label or branch information',
+                _COMMA: 'Expecting "," to be preceded by ")", a taxon label, or branch information',
+                _COLON: 'Expecting ":" to be preceded by ")" or a taxon label',
+                _SEMICOLON: 'Expecting ";" to be preceded by ")", a taxon label, or branch information',
+                }
+
+
+def _iter_text_chunks(stream, newick, filepath, chunk_size):
+    if stream is None:
+        if newick is not None:
+            yield newick
+            return
+        if filepath is None:
+            raise ValueError('"stream", "newick", or "filepath" must be provided')
+        with codecs.open(filepath, 'r', encoding='utf-8') as fo:
+            for c in _iter_text_chunks(fo, None, None, chunk_size):
+                yield c
+        return
+    while True:
+        c = stream.read(chunk_size)
+        if not c:
+            return
+        yield c
+
+
+def iter_newick_tokens(stream=None, newick=None, filepath=None, chunk_size=DEFAULT_NEWICK_CHUNK_SIZE,
+                       keep_comments=False, multiple_trees=False):
+    """Generator of (NewickTokenType facet, text) tuples for the newick tree in `stream`,
+    `newick` or `filepath`. The input is read in chunks of `chunk_size` characters and
+    scanned one token per regex match. Labels (and edge info) are normalized and the
+    syntax is checked in the same way as NewickTokenizer. Comments are only yielded
+    (as COMMENT tokens) if `keep_comments` is True.
+    If `multiple_trees` is True, any number of semicolon-terminated trees (including
+    none) may follow each other in the input; the token stream of each tree ends with
+    its SEMICOLON token (the semicolon is optional for the last tree).
+    """
+    chunks = _iter_text_chunks(stream, newick, filepath, chunk_size)
+    types = _TYPE_FOR_VALUE
+    comment_type = NewickTokenType.COMMENT
+    buf = ''
+    last = -1  # index of the last character in buf
+    pos = 0
+    eof = False
+    consumed = 0  # number of characters before buf (for error messages)
+    prev = _NONE
+    num_open, num_close = 0, 0
+    finished = False
+    num_trees = 0
+    match = _TOKEN.match
+    while True:
+        m = match(buf, pos)
+        if not eof:
+            # a token that ends at (or one before) the end of buf may continue in the next chunk. A
+            # quoted label is only complete if the character after its closing quote is not a quote.
+            if m is None or m.end() >= last or (m.lastindex == 3 and buf[m.end()] == "'"):
+                try:
+                    c = next(chunks)
+                except StopIteration:
+                    eof = True
+                else:
+                    consumed += pos
+                    buf = buf[pos:] + c
+                    last = len(buf) - 1
+                    pos = 0
+                continue
+        if m is None:
+            if _TRAILING_WS.match(buf, pos):
+                break
+            c = buf[pos:].lstrip()[0]
+            if c == "'":
+                _raise_at(consumed + pos, 'Found an opening single-quote, but not closing quote', prev)
+            if c == '[':
+                _raise_at(consumed + pos, 'Found an opening [ of a comment, but not closing ]', prev)
+            _raise_at(consumed + pos, 'Unexpected character "{}"'.format(c), prev)
+        if finished:
+            m = 'Unexpected newick content after the semicolon. Found "{c}"'.format(c=m.group(0).strip()[0])
+            _raise_at(consumed + pos, m, prev)
+        pos = m.end()
+        li = m.lastindex
+        if li == 1:
+            punc = m.group(1)
+            tt, allowed_prev = _PUNC_INFO[punc]
+            if prev not in allowed_prev:
+                if prev == _NONE:
+                    if tt != _OPEN:
+                        _raise_at(consumed + pos,
+                                  'Expected the first character to be a "(", but found "{}"'.format(punc), prev)
+                else:
+                    _raise_at(consumed + pos, _EXPECTATION[tt], prev)
+            if tt == _OPEN:
+                num_open += 1
+            elif tt == _CLOSE:
+                num_close += 1
+                if num_close > num_open:
+                    _raise_at(consumed + pos, 'Number of close parentheses exceeds the number of open parentheses',
+                              prev)
+            elif tt == _SEMICOLON:
+                if not multiple_trees:
+                    finished = True
+                elif num_close != num_open:
+                    _raise_at(consumed + pos, 'Number of close parentheses ({c:d}) does not equal the number of '
+                                              'open parentheses ({o:d})'.format(c=num_close, o=num_open), prev)
+                else:
+                    num_trees += 1
+                    num_open, num_close = 0, 0
+                    yield types[tt], punc
+                    prev = _NONE
+                    continue
+            prev = tt
+            yield types[tt], punc
+        elif li == 2:
+            if prev == _NONE:
+                _raise_at(consumed + pos, 'Expected the first character to be a "(", but found "["', prev)
+            if keep_comments:
+                yield comment_type, m.group(2)
+        else:
+            if li == 3:
+                label = m.group(3)
+                if pos <= last and buf[pos] == "'":
+                    _raise_at(consumed + pos, 'Found an opening single-quote, but not closing quote', prev)
+                if "''" in label:
+                    label = label.replace("''", "'")
+            else:
+                label = m.group(4).strip().replace('_', ' ')
+            if prev == _COLON:
+                prev = _EDGE_INFO
+            elif prev in _LABEL_PRECEDERS:
+                prev = _LABEL
+            elif prev == _NONE:
+                _raise_at(consumed + pos, 'Expected the first character to be a "("', prev)
+            else:
+                _raise_at(consumed + pos, 'Found "{}", but expected a label to be preceded by "(", ")", '
+                                          'or a comma'.format(label), prev)
+            yield types[prev], label
+    if prev == _NONE:
+        if multiple_trees:
+            return
+        raise ValueError('Error: Expected the first character to be a "(", but found no newick content')
+    if num_close != num_open:
+        raise ValueError('Number of close parentheses ({c:d}) does not equal '
+                         'the number of open parentheses ({o:d}) at the end '
+                         'of the input.'.format(c=num_close, o=num_open))
+
+
+def _raise_at(char_index, m, prev):
+    f = 'character #{}'.format(char_index)
+    if prev != _NONE:
+        raise ValueError('Error: {m} at {f} after a/an {p} token'.format(m=m, f=f, p=_TYPE_FOR_VALUE[prev].name))
+    raise ValueError('Error: {m} at {f}'.format(m=m, f=f))
+
+
+# the characters that can change whether a ";" ends a tree: quotes and comment brackets
+_TREE_SET_SPECIAL = re.compile(b"[';\\[\\]]")
+
+
+def iter_newick_tree_ends(fo, chunk_size=1 << 20):
+    """Yields the offset just past each tree-terminating semicolon in the binary stream `fo`
+    (semicolons in quoted labels and comments are skipped). Only the delimiters are
+    examined, so the file is scanned much faster than it can be tokenized.
+    """
+    offset = 0
+    in_quote, in_comment = False, False
+    while True:
+        b = fo.read(chunk_size)
+        if not b:
+            return
+        for m in _TREE_SET_SPECIAL.finditer(b):
+            c = m.group(0)
+            if in_quote:
+                # an escaped quote ('') closes and reopens the quote
+                if c == b"'":
+                    in_quote = False
+            elif in_comment:
+                if c == b']':
+                    in_comment = False
+            elif c == b';':
+                yield offset + m.end()
+            elif c == b"'":
+                in_quote = True
+            elif c == b'[':
+                in_comment = True
+        offset += len(b)
+
+
+def newick_tree_byte_ranges(filepath, num_ranges):
+    """Returns a list of at most `num_ranges` (start, end) byte offsets that partition the
+    newick tree-set in `filepath` into runs of whole trees of roughly equal size.
+    """
+    size = os.path.getsize(filepath)
+    targets = [(size * i) // num_ranges for i in range(1, num_ranges)]
+    ranges = []
+    start, last_end, t_index = 0, 0, 0
+    with open(filepath, 'rb') as fo:
+        for last_end in iter_newick_tree_ends(fo):
+            if t_index < len(targets) and last_end >= targets[t_index]:
+                ranges.append((start, last_end))
+                start = last_end
+                while t_index < len(targets) and targets[t_index] <= last_end:
+                    t_index += 1
+    if start < size:
+        if ranges and start >= last_end:
+            # only whitespace (or an unterminated last tree) follows the last cut
+            ranges[-1] = (ranges[-1][0], size)
+        else:
+            ranges.append((start, size))
+    return ranges
+
+
+class ByteRangeReader(object):
+    """Binary file-like object that reads the bytes [start, end) of `filepath`."""
+
+    def __init__(self, filepath, start, end):
+        self._fo = open(filepath, 'rb')
+        self._fo.seek(start)
+        self._remaining = end - start
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        b = self._fo.read(size)
+        self._remaining -= len(b)
+        return b
+
+    def close(self):
+        self._fo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
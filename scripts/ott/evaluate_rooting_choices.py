@@ -97,6 +97,9 @@ if __name__ == '__main__':
         else:
             sys.exit('This NexSON has not trees.\n')
     ott = OTT()
+    results = {}
     for tree_id, tree, otus in trees:
         tree_proxy = NexsonTreeProxy(tree=tree, tree_id=tree_id, otus=otus)
-        evaluate_tree_rooting(nexson, ott, tree_proxy)
+        results[tree_id] = evaluate_tree_rooting(nexson, ott, tree_proxy)
+    json.dump(results, out, indent=2, sort_keys=True)
+    out.write('\n')
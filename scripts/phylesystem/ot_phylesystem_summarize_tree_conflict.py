@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""Writes (as JSON) the classification of the edges of every phylesystem tree
+(or of the trees in a tree collection) against the OTT taxonomy.
+Summaries are cached in CACHE_DIR, so only studies that changed since the last
+run (or trees compared to a new OTT version) are recomputed.
+"""
+from peyotl.phylesystem.phylesystem_umbrella import Phylesystem
+from peyotl.tree_conflict import summarize_collection_conflicts, summarize_phylesystem_conflicts
+from peyotl.ott import OTT
+import argparse
+import codecs
+import json
+import sys
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cache-dir', required=True, help='directory of cached study summaries')
+    parser.add_argument('--collection', default=None, help='filepath of a tree collection to restrict the output')
+    parser.add_argument('--num-workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--output', default=None, help='output filepath (default: standard output)')
+    args = parser.parse_args()
+    phy = Phylesystem()
+    ott = OTT()
+    if args.collection is None:
+        summaries = summarize_phylesystem_conflicts(phy, ott, args.cache_dir, num_workers=args.num_workers)
+    else:
+        summaries = summarize_collection_conflicts(args.collection, phy, ott, args.cache_dir,
+                                                   num_workers=args.num_workers)
+    results = {}
+    for study_id, tree_id, summary in summaries:
+        results.setdefault(study_id, {})[tree_id] = summary
+    if args.output is None:
+        out = codecs.getwriter('utf-8')(sys.stdout)
+    else:
+        out = codecs.open(args.output, 'w', encoding='utf-8')
+    json.dump({'ott_version': ott.version, 'studies': results}, out, indent=1, sort_keys=True)
+    out.write('\n')